@@ -0,0 +1,326 @@
+"""
+Audio decoding for the voice API.
+
+Uploads are decoded straight from the request buffer whenever possible:
+
+    "wav"    – RIFF/WAVE PCM parsed in-process (no subprocess, no disk)
+    "pyav"   – WebM/Opus, Ogg, MP3… through PyAV when it is installed
+    "pipe"   – warm ffmpeg worker (DecoderPool) fed on stdin, s16le PCM on stdout
+    "file"   – ffmpeg reading a temp file, for containers that need seeking
+
+decode_audio() returns which of these was used so callers can report it.
+Clips over VOICE_MAX_CLIP_SECONDS raise ClipTooLong without being decoded
+in full: the WAV header is checked before any frame is read, PyAV stops at
+the limit and ffmpeg is told to stop writing just past it (-t).
+"""
+
+import io, os, queue, shutil, subprocess, tempfile, threading, time, atexit, wave, logging
+from typing import Tuple
+
+import numpy as np
+import imageio_ffmpeg
+
+try:
+    import av  # PyAV, optional in-process decoder
+except ImportError:  # pragma: no cover - optional dependency
+    av = None
+
+logger = logging.getLogger(__name__)
+
+DECODER_POOL_SIZE = int(os.environ.get("VOICE_DECODER_POOL_SIZE", "4"))
+DECODER_TIMEOUT = float(os.environ.get("VOICE_DECODER_TIMEOUT", "20"))
+DECODER_HEALTH_INTERVAL = float(os.environ.get("VOICE_DECODER_HEALTH_INTERVAL", "5"))
+MAX_CLIP_SECONDS = float(os.environ.get("VOICE_MAX_CLIP_SECONDS", "30"))
+
+_FFMPEG_EXE = None
+
+
+class ClipTooLong(ValueError):
+    """Clip longer than MAX_CLIP_SECONDS; no other decoder is tried."""
+
+    def __init__(self, seconds: float):
+        super().__init__(f"Clip longer than {MAX_CLIP_SECONDS:g}s")
+        self.seconds = seconds
+
+
+def _find_ffmpeg_exe() -> str:
+    global _FFMPEG_EXE
+    if _FFMPEG_EXE is None:
+        _FFMPEG_EXE = shutil.which("ffmpeg") or imageio_ffmpeg.get_ffmpeg_exe()
+    return _FFMPEG_EXE
+
+
+def _is_wav(buf: bytes) -> bool:
+    return len(buf) >= 12 and buf[:4] == b"RIFF" and buf[8:12] == b"WAVE"
+
+
+def _needs_seek(buf: bytes) -> bool:
+    """MP4/MOV may keep the index at the end, which ffmpeg cannot read from a pipe."""
+    return len(buf) >= 8 and buf[4:8] == b"ftyp"
+
+
+def _resample(samples: np.ndarray, sr: int, target_sr: int) -> np.ndarray:
+    if sr == target_sr:
+        return samples
+    import torch, torchaudio
+    out = torchaudio.functional.resample(torch.from_numpy(samples), sr, target_sr)
+    return out.numpy()
+
+
+# -----------------------------------------------------------
+# Decoders
+# -----------------------------------------------------------
+def _decode_wav(buf: bytes, sample_rate: int) -> np.ndarray:
+    with wave.open(io.BytesIO(buf)) as wf:
+        channels, width, sr = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        if wf.getnframes() > MAX_CLIP_SECONDS * sr:
+            raise ClipTooLong(wf.getnframes() / sr)
+        frames = wf.readframes(wf.getnframes())
+
+    if width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 3:
+        raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+        ints = (raw[:, 0].astype(np.int32) | (raw[:, 1].astype(np.int32) << 8)
+                | (raw[:, 2].astype(np.int8).astype(np.int32) << 16))
+        samples = ints.astype(np.float32) / 8388608.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {width}")
+
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return _resample(samples, sr, sample_rate)
+
+
+def _decode_pyav(buf: bytes, sample_rate: int) -> np.ndarray:
+    chunks, total = [], 0
+    limit = MAX_CLIP_SECONDS * sample_rate
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=sample_rate)
+    with av.open(io.BytesIO(buf), mode="r") as container:
+        stream = next(s for s in container.streams if s.type == "audio")
+        for frame in container.decode(stream):
+            for f in resampler.resample(frame):
+                chunks.append(f.to_ndarray().reshape(-1))
+                total += chunks[-1].size
+            if total > limit:
+                raise ClipTooLong(total / sample_rate)
+        chunks.extend(f.to_ndarray().reshape(-1) for f in resampler.resample(None))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+def _pcm_cmd(src: str, sample_rate: int) -> list:
+    return [
+        _find_ffmpeg_exe(), "-loglevel", "error",
+        "-i", src, "-ac", "1", "-ar", str(sample_rate),
+        # One second past the limit is enough to tell the clip is too long
+        "-t", f"{MAX_CLIP_SECONDS + 1:g}",
+        "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+    ]
+
+
+def _decode_pipe(buf: bytes, sample_rate: int) -> np.ndarray:
+    pool = get_decoder_pool()
+    if pool is not None and pool.sample_rate == sample_rate:
+        pcm = pool.decode(buf)
+    else:
+        pcm = subprocess.run(
+            _pcm_cmd("pipe:0", sample_rate), input=buf,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        ).stdout
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _decode_file(buf: bytes, sample_rate: int) -> np.ndarray:
+    temp_in = None
+    try:
+        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
+            temp_in = f.name
+            f.write(buf)
+        proc = subprocess.run(
+            _pcm_cmd(temp_in, sample_rate), stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+        )
+        return np.frombuffer(proc.stdout, dtype="<i2").astype(np.float32) / 32768.0
+    finally:
+        if temp_in and os.path.exists(temp_in):
+            os.remove(temp_in)
+
+
+# -----------------------------------------------------------
+# ffmpeg worker pool
+# -----------------------------------------------------------
+class DecoderPool:
+    """
+    Bounded pool of pre-started ffmpeg decoders (stdin → 16 kHz s16le stdout).
+
+    An ffmpeg process decodes exactly one container, so each worker serves a
+    single clip. `size` counts idle workers only: taking one frees its slot
+    and wakes the supervisor thread, which starts the replacement while the
+    clip is still decoding, so requests only wait for ffmpeg startup when
+    more than `size` clips arrive at once. Idle workers are health-checked
+    every `health_interval` seconds and restarted if they died.
+    """
+
+    def __init__(self, size: int, sample_rate: int, timeout: float = DECODER_TIMEOUT,
+                 health_interval: float = DECODER_HEALTH_INTERVAL):
+        self.size = size
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.restarts = 0
+        self._ready: "queue.Queue[subprocess.Popen]" = queue.Queue()
+        self._live = 0  # idle workers, started or starting
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._supervise, name="ffmpeg-decoder-pool", daemon=True)
+        self._thread.start()
+
+    def _spawn(self) -> subprocess.Popen:
+        return subprocess.Popen(
+            _pcm_cmd("pipe:0", self.sample_rate),
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+
+    @staticmethod
+    def _discard(proc: subprocess.Popen):
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            if pipe is not None:
+                pipe.close()
+
+    def _free_slot(self):
+        """A worker left the idle set: have the supervisor start another."""
+        with self._lock:
+            self._live -= 1
+        self._wake.set()
+
+    def _supervise(self):
+        while not self._closed:
+            try:
+                while self._live < self.size and not self._closed:
+                    proc = self._spawn()
+                    with self._lock:
+                        self._live += 1
+                    self._ready.put(proc)
+            except OSError as exc:
+                logger.error("Could not start ffmpeg decoder: %s", exc)
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+            self._health_check()
+
+    def _health_check(self):
+        for _ in range(self._ready.qsize()):
+            try:
+                proc = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            if proc.poll() is None:
+                self._ready.put(proc)
+            else:
+                logger.warning("Idle ffmpeg decoder exited (code=%s); restarting", proc.returncode)
+                self.restarts += 1
+                self._discard(proc)
+                self._free_slot()
+
+    def _acquire(self) -> subprocess.Popen:
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("No ffmpeg decoder available.")
+            try:
+                proc = self._ready.get(timeout=remaining)
+            except queue.Empty:
+                raise TimeoutError("No ffmpeg decoder available.")
+            self._free_slot()
+            if proc.poll() is None:
+                return proc
+            self.restarts += 1
+            self._discard(proc)
+
+    def decode(self, buf: bytes) -> bytes:
+        """Stream one clip through a warm worker and return raw s16le PCM."""
+        proc = self._acquire()
+        try:
+            out, err = proc.communicate(buf, timeout=self.timeout)
+        finally:
+            self._discard(proc)
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, proc.args, out, err)
+        return out
+
+    def stats(self) -> dict:
+        return {"size": self.size, "ready": self._ready.qsize(), "live": self._live,
+                "restarts": self.restarts}
+
+    def close(self):
+        """Kill the idle workers and stop the supervisor thread."""
+        self._closed = True
+        self._wake.set()
+        self._thread.join()
+        while True:
+            try:
+                proc = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(proc)
+            self._free_slot()
+
+
+_DECODER_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_decoder_pool(sample_rate: int = 16_000) -> DecoderPool | None:
+    """Process-wide decoder pool (None when VOICE_DECODER_POOL_SIZE=0)."""
+    global _DECODER_POOL
+    if _DECODER_POOL is None and DECODER_POOL_SIZE > 0:
+        with _POOL_LOCK:
+            if _DECODER_POOL is None:
+                _DECODER_POOL = DecoderPool(DECODER_POOL_SIZE, sample_rate)
+                atexit.register(_DECODER_POOL.close)
+    return _DECODER_POOL
+
+
+# -----------------------------------------------------------
+# Public API
+# -----------------------------------------------------------
+def decode_audio(audio_bytes: bytes, sample_rate: int) -> Tuple[np.ndarray, str]:
+    """Decode any upload to mono float32 samples at `sample_rate`; returns (samples, path)."""
+    if not audio_bytes:
+        raise ValueError("Empty audio payload.")
+
+    attempts = []
+    if _is_wav(audio_bytes):
+        attempts.append(("wav", _decode_wav))
+    if av is not None:
+        attempts.append(("pyav", _decode_pyav))
+    if not _needs_seek(audio_bytes):
+        attempts.append(("pipe", _decode_pipe))
+    attempts.append(("file", _decode_file))
+
+    last_exc = None
+    for path, decoder in attempts:
+        try:
+            samples = decoder(audio_bytes, sample_rate)
+        except ClipTooLong:
+            raise
+        except Exception as exc:
+            logger.debug("Decoder %s failed, falling back: %s", path, exc)
+            last_exc = exc
+            continue
+        if samples.size > MAX_CLIP_SECONDS * sample_rate:
+            raise ClipTooLong(samples.size / sample_rate)
+        if samples.size:
+            return samples, path
+        last_exc = ValueError("Empty audio after decode.")
+    raise last_exc
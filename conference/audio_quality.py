@@ -0,0 +1,128 @@
+"""
+Cheap quality gate for decoded clips, run before Silero VAD and ECAPA.
+
+One vectorized pass over 30 ms frames measures:
+
+    rms_dbfs        – overall level
+    clipping        – fraction of samples at full scale
+    snr_db          – loud frames (90th pct) over the noise floor (10th pct);
+                      steady noise or a tone has almost no spread, speech
+                      always has some, even without pauses
+    voiced_seconds  – frames within VOICED_RANGE_DB of the loud frames and
+                      above the absolute silence level
+
+Clips that are silent, clipped, too noisy or too short are rejected with a
+reason code instead of being zero-padded to 3.2 s and embedded anyway.
+The same frames tell when Silero has nothing to crop (speech runs from the
+first to the last frame), so prepare_waveform can skip it.
+
+    VOICE_QUALITY_GATE          – 0 disables the gate (and the VAD skip)
+    VOICE_MIN_RMS_DBFS          – quieter clips are "silence"
+    VOICE_MAX_CLIPPING          – clipped-sample fraction allowed
+    VOICE_MIN_SNR_DB            – noisier clips are "low_snr"
+    VOICE_MIN_VOICED_SECONDS    – less speech is "too_short"; only the louder
+                                  syllables count, so a 4 s recording of an
+                                  unhurried phrase can measure under 1 s
+"""
+
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+QUALITY_GATE = os.environ.get("VOICE_QUALITY_GATE", "1").lower() not in ("0", "false", "no")
+MIN_RMS_DBFS = float(os.environ.get("VOICE_MIN_RMS_DBFS", "-45"))
+MAX_CLIPPING = float(os.environ.get("VOICE_MAX_CLIPPING", "0.01"))
+MIN_SNR_DB = float(os.environ.get("VOICE_MIN_SNR_DB", "6"))
+MIN_VOICED_SECONDS = float(os.environ.get("VOICE_MIN_VOICED_SECONDS", "0.5"))
+
+FRAME_SECONDS = 0.03
+SILENCE_DBFS = -55.0     # frames below this are silence whatever the clip
+VOICED_RANGE_DB = 20.0   # voiced frames are within this of the loud frames
+CLIP_LEVEL = 0.99        # |sample| at or above this counts as clipped
+EDGE_SECONDS = 0.1       # unvoiced lead-in / tail Silero would trim
+
+MESSAGES = {
+    "silence": "No speech detected, please check your microphone",
+    "too_short": "Not enough speech, please speak for longer",
+    "too_long": "Recording is too long, please keep it shorter",
+    "clipping": "Audio is distorted (too loud), please move away from the microphone",
+    "low_snr": "Too much background noise, please try somewhere quieter",
+}
+
+
+@dataclass
+class QualityReport:
+    duration: float
+    rms_dbfs: float
+    clipping: float
+    snr_db: float
+    voiced_seconds: float
+    speech_only: bool          # voiced from the first to the last frame: Silero would not crop
+    reason: str | None = None  # why the clip is rejected, None when it passes
+
+    @property
+    def ok(self) -> bool:
+        return self.reason is None
+
+    def as_dict(self) -> dict:
+        return {
+            "duration": round(self.duration, 3),
+            "rms_dbfs": round(self.rms_dbfs, 1),
+            "clipping": round(self.clipping, 4),
+            "snr_db": round(self.snr_db, 1),
+            "voiced_seconds": round(self.voiced_seconds, 2),
+            "speech_only": self.speech_only,
+            "reason": self.reason,
+        }
+
+
+class AudioRejected(Exception):
+    """Clip failed the quality gate; carries the report for the API response."""
+
+    def __init__(self, report: QualityReport):
+        super().__init__(MESSAGES.get(report.reason, report.reason))
+        self.report = report
+        self.reason = report.reason
+        self.index = None  # position in a batch upload, when there is one
+
+
+def _db(power):
+    return 10.0 * np.log10(np.maximum(power, 1e-12))
+
+
+def assess(samples: np.ndarray, sr: int) -> QualityReport:
+    """Measure `samples` (mono float in [-1, 1]) and decide whether they are usable."""
+    samples = np.asarray(samples, dtype=np.float32)
+    frame = max(1, int(FRAME_SECONDS * sr))
+    n_frames = len(samples) // frame
+    if n_frames == 0:
+        return QualityReport(len(samples) / sr, -120.0, 0.0, 0.0, 0.0, False, "too_short")
+
+    frames = samples[: n_frames * frame].reshape(n_frames, frame)
+    power = np.einsum("ij,ij->i", frames, frames) / frame
+    frame_db = _db(power)
+    noise_db, loud_db = np.percentile(frame_db, [10, 90])
+
+    voiced = frame_db > max(SILENCE_DBFS, loud_db - VOICED_RANGE_DB)
+    voiced_idx = np.flatnonzero(voiced)
+    edge = int(EDGE_SECONDS / FRAME_SECONDS)
+    speech_only = bool(voiced_idx.size and voiced_idx[0] <= edge and voiced_idx[-1] >= n_frames - 1 - edge)
+
+    report = QualityReport(
+        duration=len(samples) / sr,
+        rms_dbfs=float(_db(power.mean())),
+        clipping=float(np.count_nonzero(np.abs(frames) >= CLIP_LEVEL)) / frames.size,
+        snr_db=float(loud_db - noise_db),
+        voiced_seconds=voiced_idx.size * frame / sr,
+        speech_only=speech_only,
+    )
+    if report.rms_dbfs < MIN_RMS_DBFS or not voiced_idx.size:
+        report.reason = "silence"
+    elif report.voiced_seconds < MIN_VOICED_SECONDS:
+        report.reason = "too_short"
+    elif report.clipping > MAX_CLIPPING:
+        report.reason = "clipping"
+    elif report.snr_db < MIN_SNR_DB:
+        report.reason = "low_snr"
+    return report
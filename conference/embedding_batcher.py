@@ -0,0 +1,114 @@
+"""
+Micro-batching scheduler for ECAPA embedding inference.
+
+Concurrent enroll / verify requests each submit a preprocessed waveform; a
+single worker thread collects whatever arrives within `window_ms` (or until
+`max_batch` clips are waiting) and runs one batched forward pass.
+
+    VOICE_BATCH_MAX_SIZE   – clips per forward pass (throughput)
+    VOICE_BATCH_WINDOW_MS  – how long the first clip may wait for company (latency);
+                             a negative value disables batching
+"""
+
+import os, queue, threading, time, logging
+from concurrent.futures import Future
+from typing import Callable, List, Sequence
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_SIZE = int(os.environ.get("VOICE_BATCH_MAX_SIZE", "16"))
+BATCH_WINDOW_MS = float(os.environ.get("VOICE_BATCH_WINDOW_MS", "5"))
+
+# (batch (B, T), relative lengths (B,)) -> (B, D) float32
+EncodeFn = Callable[[torch.Tensor, torch.Tensor], np.ndarray]
+
+
+def stack_waveforms(waveforms: Sequence[torch.Tensor]):
+    """Right-pad (1, T) / (T,) waveforms into a (B, T_max) batch plus relative lengths."""
+    flat = [w.reshape(-1) for w in waveforms]
+    longest = max(w.shape[0] for w in flat)
+    if all(w.shape[0] == longest for w in flat):
+        return torch.stack(flat), torch.ones(len(flat))
+    batch = torch.zeros(len(flat), longest, dtype=flat[0].dtype)
+    for i, w in enumerate(flat):
+        batch[i, : w.shape[0]] = w
+    lens = torch.tensor([w.shape[0] / longest for w in flat])
+    return batch, lens
+
+
+class EmbeddingBatcher:
+    def __init__(self, encode_fn: EncodeFn, max_batch: int = BATCH_MAX_SIZE,
+                 window_ms: float = BATCH_WINDOW_MS):
+        self.encode_fn = encode_fn
+        self.max_batch = max(1, max_batch)
+        self.window = max(0.0, window_ms) / 1000.0
+        self.batches = 0
+        self.clips = 0
+        self._queue: "queue.Queue[tuple[torch.Tensor, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="ecapa-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, waveform: torch.Tensor) -> Future:
+        fut: Future = Future()
+        self._queue.put((waveform, fut))
+        return fut
+
+    def embed(self, waveforms: Sequence[torch.Tensor]) -> List[np.ndarray]:
+        """Embed several clips; they land in the same forward pass when they fit."""
+        futures = [self.submit(w) for w in waveforms]
+        return [f.result() for f in futures]
+
+    def close(self):
+        """Stop the worker thread once the clips already queued are embedded."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # finish this batch, stop on the next _collect
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            futures = [fut for _, fut in batch]
+            try:
+                wavs, lens = stack_waveforms([w for w, _ in batch])
+                embs = self.encode_fn(wavs, lens)
+            except Exception as exc:
+                for fut in futures:
+                    fut.set_exception(exc)
+                continue
+            self.batches += 1
+            self.clips += len(batch)
+            for fut, emb in zip(futures, embs):
+                fut.set_result(emb)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "clips": self.clips,
+            "avg_batch": (self.clips / self.batches) if self.batches else 0.0,
+            "pending": self._queue.qsize(),
+        }
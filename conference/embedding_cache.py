@@ -0,0 +1,168 @@
+"""
+Content-addressed cache of speaker embeddings.
+
+Clients retry uploads and the frontend re-sends the same enrollment clips on
+re-join, so identical audio is decoded, VAD-trimmed and embedded again and
+again. Embeddings are cached under a hash of the raw upload bytes (plus the
+inference backend, since backends differ by a small tolerance):
+
+    1. a process-local LRU (VOICE_EMBED_CACHE_SIZE entries, VOICE_EMBED_CACHE_TTL seconds)
+    2. optionally Redis (VOICE_EMBED_CACHE_REDIS, e.g. redis://127.0.0.1:6379/1),
+       shared by every worker; Redis errors only count as misses
+
+VOICE_EMBED_CACHE_SIZE=0 disables the cache. stats() reports hits / misses
+and the compute time the hits saved.
+"""
+
+import hashlib, os, threading, time, logging
+from collections import OrderedDict
+
+import numpy as np
+
+from videocall_project import metrics
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_SIZE = int(os.environ.get("VOICE_EMBED_CACHE_SIZE", "512"))
+EMBED_CACHE_TTL = float(os.environ.get("VOICE_EMBED_CACHE_TTL", "600"))
+EMBED_CACHE_REDIS = os.environ.get("VOICE_EMBED_CACHE_REDIS", "")
+
+
+def audio_digest(audio_bytes: bytes, namespace: str = "") -> str:
+    h = hashlib.blake2b(audio_bytes, digest_size=20)
+    if namespace:
+        h.update(namespace.encode())
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, max_entries: int = EMBED_CACHE_SIZE, ttl: float = EMBED_CACHE_TTL,
+                 redis_url: str = EMBED_CACHE_REDIS, prefix: str = "voice:emb"):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self._entries = OrderedDict()  # digest -> (expires, embedding, compute seconds)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+        self.redis = None
+        if redis_url:
+            if redis is None:
+                logger.warning("VOICE_EMBED_CACHE_REDIS set but redis is not installed; local cache only")
+            else:
+                self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+
+    def get(self, digest: str) -> np.ndarray | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                expires, embedding, cost = entry
+                if expires > now:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    self.saved_seconds += cost
+                    return embedding
+                del self._entries[digest]
+
+        cached = self._redis_get(digest)
+        with self._lock:
+            if cached is None:
+                self.misses += 1
+                return None
+            embedding, cost = cached
+            self.redis_hits += 1
+            self.saved_seconds += cost
+        self._remember(digest, embedding, cost)
+        return embedding
+
+    def put(self, digest: str, embedding: np.ndarray, cost: float = 0.0):
+        """Store an embedding; `cost` is the compute time a later hit saves."""
+        embedding = np.array(embedding, dtype=np.float32).ravel()
+        embedding.setflags(write=False)
+        self._remember(digest, embedding, cost)
+        if self.redis is not None:
+            try:
+                # the compute cost rides along as a trailing float32
+                value = np.append(embedding, np.float32(cost)).tobytes()
+                self.redis.set(f"{self.prefix}:{digest}", value, ex=max(1, int(self.ttl)))
+            except redis.RedisError as exc:
+                logger.warning("Embedding cache write to Redis failed: %s", exc)
+
+    def _remember(self, digest: str, embedding: np.ndarray, cost: float):
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl, embedding, cost)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _redis_get(self, digest: str) -> tuple | None:
+        if self.redis is None:
+            return None
+        try:
+            raw = self.redis.get(f"{self.prefix}:{digest}")
+        except redis.RedisError as exc:
+            logger.warning("Embedding cache read from Redis failed: %s", exc)
+            return None
+        if not raw:
+            return None
+        value = np.frombuffer(raw, dtype=np.float32)
+        return value[:-1], float(value[-1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.redis_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "redis": self.redis is not None,
+                "hits": self.hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.redis_hits) / lookups if lookups else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+
+_CACHE = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Shared cache (None when VOICE_EMBED_CACHE_SIZE=0 disables it)."""
+    global _CACHE
+    if _CACHE is None and EMBED_CACHE_SIZE > 0:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache()
+    return _CACHE
+
+
+def _cache_stat(name: str):
+    return lambda: _CACHE.stats()[name] if _CACHE is not None else None
+
+
+metrics.collector("voice_embedding_cache_hits_total", "Embedding cache hits (local tier)",
+                  _cache_stat("hits"), kind="counter")
+metrics.collector("voice_embedding_cache_redis_hits_total", "Embedding cache hits (Redis tier)",
+                  _cache_stat("redis_hits"), kind="counter")
+metrics.collector("voice_embedding_cache_misses_total", "Embedding cache misses",
+                  _cache_stat("misses"), kind="counter")
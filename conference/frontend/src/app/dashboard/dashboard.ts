@@ -897,6 +897,20 @@ export class Dashboard implements OnInit, OnDestroy, AfterViewInit {
         break;
       }
 
+      // Reconnect / resync: only the changes since our last room version
+      case 'participants_delta': {
+        for (const change of msg.changes ?? []) {
+          if (change.op === 'join') {
+            this.onSignal({ type: 'participant_joined', participant: change.fields });
+          } else if (change.op === 'leave') {
+            this.onSignal({ type: 'participant_left', channel: change.channel });
+          } else if (change.op === 'update') {
+            this.onSignal({ type: 'participant_updated', participant: { ...change.fields, channel: change.channel } });
+          }
+        }
+        break;
+      }
+
       case 'participant_joined': {
         const row = msg.participant; const ch = this.participantChan(row); if (!ch) return;
         if (this.myServerChan && ch === this.myServerChan) return; // skip self
@@ -1033,20 +1047,18 @@ export class Dashboard implements OnInit, OnDestroy, AfterViewInit {
       }
 
       case "gaze_update": {
-        const ch = msg.channel;
-        const g = msg.gaze;
-      
-        if (ch && this.participantsMap.has(ch)) {
-          const p = this.participantsMap.get(ch)!;
-          this.participantsMap.set(ch, { ...p, gaze: g });
-          this.syncParticipantsArray();
-        } else {
-          const p = this.participants.find(pp => pp.name === msg.user);
-          if (p) {
-            p.gaze = g;
-            this.syncParticipantsArray();
-          }
-        }
+        this.applyGazeUpdate(msg);
+        break;
+      }
+
+      // Coalesced by the server: the latest status of every participant that changed this tick
+      case "gaze_updates": {
+        for (const update of msg.updates ?? []) this.applyGazeUpdate(update);
+        break;
+      }
+
+      case "voice_updates": {
+        for (const update of msg.updates ?? []) this.applyVoiceUpdate(update);
         break;
       }
 
@@ -1060,6 +1072,23 @@ export class Dashboard implements OnInit, OnDestroy, AfterViewInit {
     }
   }
 
+  private applyGazeUpdate(msg: { channel?: string; gaze?: string; user?: string }): void {
+    const ch = msg.channel;
+    const g = msg.gaze ?? '';
+
+    if (ch && this.participantsMap.has(ch)) {
+      const p = this.participantsMap.get(ch)!;
+      this.participantsMap.set(ch, { ...p, gaze: g });
+      this.syncParticipantsArray();
+    } else {
+      const p = this.participants.find(pp => pp.name === msg.user);
+      if (p) {
+        p.gaze = g;
+        this.syncParticipantsArray();
+      }
+    }
+  }
+
   private extractVoicePayload(msg: any): { channel?: string; voice?: string; user?: string } | null {
     if (!msg) return null;
     if (typeof msg.voice !== 'undefined' || typeof msg.channel !== 'undefined' || typeof msg.user !== 'undefined') {
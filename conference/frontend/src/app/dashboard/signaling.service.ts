@@ -13,23 +13,33 @@ export class SignalingService {
   public messages$ = this.messagesSubject.asObservable();
 
   private room?: string;
+  // Last room state version seen; an automatic reconnect asks the server for the changes since then
+  private roomVersion: number | null = null;
+
+  private buildUrl(room: string, since: number | null): string {
+    const query = since !== null ? `?since=${since}` : '';
 
-  private buildUrl(room: string): string {
     // If you want to override manually, set window.__SIGNALING_URL__ before Angular boots
     const override = (window as any).__SIGNALING_URL__ as string | undefined;
 
     if (override) {
-      return `${override.replace(/\/$/, '')}/${encodeURIComponent(room)}/`;
+      return `${override.replace(/\/$/, '')}/${encodeURIComponent(room)}/${query}`;
     }
 
     // Derive from page’s location
     const scheme = location.protocol === 'https:' ? 'wss' : 'ws';
-    return `${scheme}://${location.host}/ws/signaling/${encodeURIComponent(room)}/`;
+    return `${scheme}://${location.host}/ws/signaling/${encodeURIComponent(room)}/${query}`;
   }
 
   connect(room: string): void {
+    // A fresh join needs the full participant snapshot
+    this.roomVersion = null;
+    this.open(room);
+  }
+
+  private open(room: string): void {
     this.room = room;
-    const url = this.buildUrl(room);
+    const url = this.buildUrl(room, this.roomVersion);
 
     console.log('[SignalingService] connecting →', url);
     this.ws = new WebSocket(url);
@@ -41,6 +51,7 @@ export class SignalingService {
     this.ws.onmessage = (ev) => {
       try {
         const data: SignalMessage = JSON.parse(ev.data);
+        if (typeof data['v'] === 'number') this.roomVersion = data['v'];
         this.messagesSubject.next(data);
       } catch (err) {
         console.error('[SignalingService] JSON parse error', err, ev.data);
@@ -59,7 +70,7 @@ export class SignalingService {
   }
 
   private reconnect(): void {
-    if (this.room) this.connect(this.room);
+    if (this.room) this.open(this.room);
   }
 
   getSocket(): WebSocket | null {
@@ -67,8 +78,11 @@ export class SignalingService {
   }
 
   disconnect(): void {
+    if (this.ws) this.ws.onclose = null; // leaving on purpose: no automatic reconnect
     this.ws?.close();
     this.ws = null;
+    this.room = undefined;
+    this.roomVersion = null;
   }
 
   sendMessage(msg: SignalMessage): void {
@@ -0,0 +1,161 @@
+"""
+CPU inference backends for the ECAPA-TDNN speaker encoder.
+
+Feature extraction (Fbank + sentence mean/var norm) always runs in eager
+SpeechBrain; only the embedding network is swapped:
+
+    eager            – stock SpeechBrain module (float32)
+    torchscript      – torch.jit.trace of the embedding model, frozen for inference
+    torchscript-int8 – as above after dynamic int8 quantization of Linear layers
+                       (ECAPA is mostly Conv1d, so expect a small gain only)
+    onnx             – ONNX export run with onnxruntime (optional dependency)
+
+Select with VOICE_INFERENCE_BACKEND. A non-eager backend is only used after
+check_parity() confirms its embeddings stay within VOICE_PARITY_TOLERANCE
+(1 - cosine) of the eager model; otherwise the loader falls back to eager.
+"""
+
+import inspect, os, tempfile, logging
+
+import numpy as np
+import torch
+
+try:
+    import onnxruntime
+except ImportError:  # pragma: no cover - optional dependency
+    onnxruntime = None
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = os.environ.get("VOICE_INFERENCE_BACKEND", "eager")
+PARITY_TOLERANCE = float(os.environ.get("VOICE_PARITY_TOLERANCE", "0.002"))
+BACKENDS = ("eager", "torchscript", "torchscript-int8", "onnx")
+
+# Traced / exported graphs are specialised on this input; other lengths are
+# still accepted (the time axis is dynamic in both TorchScript and ONNX).
+_EXAMPLE_SECONDS = 3.2
+_SAMPLE_RATE = 16_000
+
+
+def _features(model, wavs: torch.Tensor, lens: torch.Tensor) -> torch.Tensor:
+    feats = model.mods.compute_features(wavs)
+    return model.mods.mean_var_norm(feats, lens)
+
+
+class EagerEncoder:
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, wavs: torch.Tensor, lens: torch.Tensor) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model.encode_batch(wavs, lens).reshape(wavs.shape[0], -1)
+
+
+class TorchScriptEncoder:
+    name = "torchscript"
+
+    def __init__(self, model, quantize: bool = False):
+        self.model = model
+        embedding_model = model.mods.embedding_model.eval()
+        if quantize:
+            self.name = "torchscript-int8"
+            embedding_model = torch.ao.quantization.quantize_dynamic(
+                embedding_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        example = self._example_feats()
+        with torch.no_grad():
+            traced = torch.jit.trace(embedding_model, example, check_trace=False)
+        self.graph = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+
+    def _example_feats(self) -> torch.Tensor:
+        wavs = torch.randn(1, int(_EXAMPLE_SECONDS * _SAMPLE_RATE), device=self.model.device) * 0.1
+        with torch.no_grad():
+            return _features(self.model, wavs, torch.ones(1, device=self.model.device))
+
+    def __call__(self, wavs: torch.Tensor, lens: torch.Tensor) -> torch.Tensor:
+        # The graph was traced without relative lengths: padded batches go eager.
+        if not bool(torch.all(lens >= 1.0)):
+            return EagerEncoder(self.model)(wavs, lens)
+        with torch.no_grad():
+            feats = _features(self.model, wavs, lens)
+            return self.graph(feats).reshape(wavs.shape[0], -1)
+
+
+class OnnxEncoder:
+    name = "onnx"
+
+    def __init__(self, model):
+        if onnxruntime is None:
+            raise RuntimeError("onnxruntime is not installed")
+        if str(model.device) != "cpu":
+            raise RuntimeError("the ONNX backend only runs on CPU")
+        self.model = model
+        wavs = torch.randn(1, int(_EXAMPLE_SECONDS * _SAMPLE_RATE)) * 0.1
+        with torch.no_grad():
+            example = _features(model, wavs, torch.ones(1))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ecapa.onnx")
+            kwargs = {}
+            if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+                kwargs["dynamo"] = False  # TorchScript exporter keeps dynamic_axes symbolic
+            torch.onnx.export(
+                model.mods.embedding_model.eval(), (example,), path,
+                input_names=["feats"], output_names=["embedding"],
+                dynamic_axes={"feats": {0: "batch", 1: "frames"}, "embedding": {0: "batch"}},
+                opset_version=17, **kwargs,
+            )
+            self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+
+    def __call__(self, wavs: torch.Tensor, lens: torch.Tensor) -> torch.Tensor:
+        if not bool(torch.all(lens >= 1.0)):
+            return EagerEncoder(self.model)(wavs, lens)
+        with torch.no_grad():
+            feats = _features(self.model, wavs, lens).cpu().numpy()
+        (emb,) = self.session.run(None, {"feats": feats})
+        return torch.from_numpy(emb).reshape(wavs.shape[0], -1)
+
+
+def build_encoder(model, backend: str = INFERENCE_BACKEND):
+    if backend == "eager":
+        return EagerEncoder(model)
+    if backend == "torchscript":
+        return TorchScriptEncoder(model)
+    if backend == "torchscript-int8":
+        return TorchScriptEncoder(model, quantize=True)
+    if backend == "onnx":
+        return OnnxEncoder(model)
+    raise ValueError(f"Unknown inference backend {backend!r}; expected one of {BACKENDS}")
+
+
+def check_parity(model, encoder, tolerance: float = PARITY_TOLERANCE, clips: int = 4) -> dict:
+    """Compare `encoder` with eager SpeechBrain on noise clips; max (1 - cosine) must stay under tolerance."""
+    rng = np.random.default_rng(0)
+    wavs = torch.from_numpy(
+        rng.standard_normal((clips, int(_EXAMPLE_SECONDS * _SAMPLE_RATE))).astype(np.float32) * 0.1
+    ).to(model.device)
+    lens = torch.ones(clips, device=model.device)
+    ref = torch.nn.functional.normalize(EagerEncoder(model)(wavs, lens).cpu(), dim=-1)
+    out = torch.nn.functional.normalize(encoder(wavs, lens).cpu(), dim=-1)
+    max_dev = float((1.0 - (ref * out).sum(dim=-1)).max())
+    return {"backend": encoder.name, "max_cosine_deviation": max_dev,
+            "tolerance": tolerance, "ok": max_dev <= tolerance}
+
+
+def load_encoder(model, backend: str = INFERENCE_BACKEND):
+    """Build the configured backend, falling back to eager if it fails or drifts."""
+    if backend == "eager":
+        return EagerEncoder(model)
+    try:
+        encoder = build_encoder(model, backend)
+        parity = check_parity(model, encoder)
+    except Exception as exc:
+        logger.error("Inference backend %s unavailable (%s); using eager", backend, exc)
+        return EagerEncoder(model)
+    if not parity["ok"]:
+        logger.error("Inference backend %s failed parity (%.5f > %.5f); using eager",
+                     backend, parity["max_cosine_deviation"], parity["tolerance"])
+        return EagerEncoder(model)
+    logger.info("Using %s ECAPA backend (parity %.5f)", backend, parity["max_cosine_deviation"])
+    return encoder
@@ -0,0 +1,84 @@
+"""
+Bounded executor for voice inference work.
+
+Async views hand decode / VAD / ECAPA work to a dedicated thread pool so the
+ASGI event loop (and the WebSocket signaling sharing it) never blocks. At most
+`workers + queue_size` jobs are admitted; beyond that submit() raises
+ExecutorSaturated and the view answers 503 with Retry-After.
+
+    VOICE_EXECUTOR_WORKERS  – concurrent inference jobs
+    VOICE_EXECUTOR_QUEUE    – jobs allowed to wait for a worker
+    VOICE_RETRY_AFTER       – seconds suggested to rejected clients
+"""
+
+import asyncio, os, threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from videocall_project import metrics
+
+EXECUTOR_WORKERS = int(os.environ.get("VOICE_EXECUTOR_WORKERS", "2"))
+EXECUTOR_QUEUE = int(os.environ.get("VOICE_EXECUTOR_QUEUE", "16"))
+RETRY_AFTER = int(os.environ.get("VOICE_RETRY_AFTER", "2"))
+
+
+class ExecutorSaturated(Exception):
+    def __init__(self, retry_after: int = RETRY_AFTER):
+        super().__init__("Voice inference queue is full.")
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    def __init__(self, workers: int = EXECUTOR_WORKERS, queue_size: int = EXECUTOR_QUEUE):
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.rejected = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="voice-inference")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._admitted = 0
+
+    @property
+    def depth(self) -> int:
+        """Jobs running or waiting."""
+        return self._admitted
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise ExecutorSaturated()
+        with self._lock:
+            self._admitted += 1
+        try:
+            fut = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    def _release(self, _fut=None):
+        with self._lock:
+            self._admitted -= 1
+        self._slots.release()
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+
+_EXECUTOR = None
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_executor() -> BoundedExecutor:
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        with _EXECUTOR_LOCK:
+            if _EXECUTOR is None:
+                _EXECUTOR = BoundedExecutor()
+    return _EXECUTOR
+
+
+metrics.collector("voice_executor_depth", "Voice inference jobs running or queued",
+                  lambda: _EXECUTOR.depth if _EXECUTOR is not None else 0)
+metrics.collector("voice_executor_rejected_total", "Voice requests rejected with 503 (queue full)",
+                  lambda: _EXECUTOR.rejected if _EXECUTOR is not None else 0, kind="counter")
@@ -0,0 +1,133 @@
+"""
+CPU lanes for torch inference inside one process.
+
+By default every thread that runs ECAPA / Silero uses torch's full
+intra-op pool, so a few concurrent verifications put cores x requests
+threads on the CPU and throughput collapses. The scheduler splits the
+usable cores into VOICE_INFERENCE_LANES lanes. Each lane is one thread with
+its own fixed torch.set_num_threads (the OpenMP thread count is per calling
+thread) and, optionally, its CPU set pinned with sched_setaffinity. Jobs go
+to the lane with the fewest queued + running jobs.
+
+    VOICE_INFERENCE_LANES      – number of lanes (0 = off: batcher / caller threads)
+    VOICE_LANE_THREADS         – torch threads per lane (default: cores // lanes)
+    VOICE_LANE_AFFINITY        – 1 pins each lane to its slice of the cores (Linux)
+
+Lanes take over from the micro-batcher: a request's VAD and forward pass
+run together on one lane, and the streaming VAD (speech_segments) runs on
+the lanes too, so no torch work is left on caller threads. Keep VOICE_EXECUTOR_WORKERS >= lanes so every
+lane can be fed.
+"""
+
+import os, queue, threading, logging
+from concurrent.futures import Future
+from typing import List
+
+from videocall_project import metrics
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_LANES = int(os.environ.get("VOICE_INFERENCE_LANES", "0"))
+LANE_THREADS = int(os.environ.get("VOICE_LANE_THREADS", "0"))
+LANE_AFFINITY = os.environ.get("VOICE_LANE_AFFINITY", "").lower() in ("1", "true", "yes")
+
+
+def usable_cores() -> List[int]:
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class Lane:
+    def __init__(self, index: int, threads: int, cpus: List[int] | None = None):
+        self.index = index
+        self.threads = threads
+        self.cpus = cpus
+        self.depth = 0  # queued + running, updated under the scheduler lock
+        self.completed = 0
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"inference-lane-{index}", daemon=True)
+        self._thread.start()
+
+    def _setup(self):
+        import torch
+
+        if self.cpus and hasattr(os, "sched_setaffinity"):
+            try:
+                os.sched_setaffinity(0, self.cpus)  # 0 = this thread
+            except OSError as exc:
+                logger.warning("Lane %d: could not pin to CPUs %s: %s", self.index, self.cpus, exc)
+        # The first torch call in a thread resets its thread count to the global one,
+        # so trigger it before setting this lane's count
+        torch.get_num_threads()
+        torch.set_num_threads(self.threads)
+
+    def _run(self):
+        self._setup()
+        while True:
+            fn, args, fut, done = self._queue.get()
+            if fut.set_running_or_notify_cancel():
+                try:
+                    fut.set_result(fn(*args))
+                except BaseException as exc:
+                    fut.set_exception(exc)
+            done(self)
+
+
+class LaneScheduler:
+    def __init__(self, lanes: int = INFERENCE_LANES, threads: int = LANE_THREADS, affinity: bool = LANE_AFFINITY):
+        cores = usable_cores()
+        lanes = max(1, lanes)
+        threads = threads or max(1, len(cores) // lanes)
+        self._lock = threading.Lock()
+        self.lanes = []
+        for i in range(lanes):
+            cpus = cores[i * threads:(i + 1) * threads] if affinity else None
+            self.lanes.append(Lane(i, threads, cpus or None))
+        logger.info("Inference lanes: %d x %d threads%s", lanes, threads, " (pinned)" if affinity else "")
+
+    def submit(self, fn, *args) -> Future:
+        fut: Future = Future()
+        with self._lock:
+            lane = min(self.lanes, key=lambda l: l.depth)
+            lane.depth += 1
+        lane._queue.put((fn, args, fut, self._done))
+        return fut
+
+    def run(self, fn, *args):
+        """Run `fn(*args)` on the least loaded lane and wait for the result."""
+        return self.submit(fn, *args).result()
+
+    def _done(self, lane: Lane):
+        with self._lock:
+            lane.depth -= 1
+            lane.completed += 1
+
+    def stats(self) -> dict:
+        return {
+            "lanes": [
+                {"threads": l.threads, "cpus": l.cpus, "depth": l.depth, "completed": l.completed}
+                for l in self.lanes
+            ],
+        }
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_lane_scheduler() -> LaneScheduler | None:
+    """Shared scheduler (None when VOICE_INFERENCE_LANES is 0)."""
+    global _SCHEDULER
+    if _SCHEDULER is None and INFERENCE_LANES > 0:
+        with _SCHEDULER_LOCK:
+            if _SCHEDULER is None:
+                _SCHEDULER = LaneScheduler()
+    return _SCHEDULER
+
+
+def _queued() -> int | None:
+    return sum(l.depth for l in _SCHEDULER.lanes) if _SCHEDULER is not None else None
+
+
+metrics.collector("voice_lane_depth", "Inference jobs queued or running on CPU lanes", _queued)
@@ -0,0 +1,339 @@
+"""
+Pre-forked inference server: one copy of the ECAPA / Silero weights per node.
+
+Every Daphne process used to load its own SpeechBrain model and Silero VAD.
+In server mode a parent process loads them once, then forks N workers that
+share the weight pages copy-on-write (inference never writes to them, and
+gc.freeze() keeps the collector from dirtying the pages holding the Python
+objects). Web processes set VOICE_INFERENCE_SOCKET and send decoded,
+quality-gated samples over the Unix socket; they never load a model.
+
+    python manage.py voice_inference_server --workers 4 --socket /run/voice.sock
+    VOICE_INFERENCE_SOCKET=/run/voice.sock daphne videocall_project.asgi:application
+
+Workers accept on the shared listening socket (one request per connection),
+run prepare_waveform (Silero crop) and the ECAPA forward pass on the whole
+request as one batch, and reply with the embeddings.
+
+Wire format, both directions: 4-byte big-endian header length, JSON header,
+then float32 payload bytes:
+
+    {"op": "embed", "lengths": [...], "vad": [...]}  ->  {"ok": true, "shape": [n, 192]}
+    {"op": "segments", "length": n, "sr": 16000}     ->  {"ok": true, "segments": [[s, e], ...]}
+    {"op": "stats"}                                  ->  {"ok": true, "pid": ..., "memory": {...}}
+
+    VOICE_INFERENCE_SOCKET    – socket path; unset = models load in-process
+    VOICE_INFERENCE_TIMEOUT   – client timeout per request (seconds)
+    VOICE_SERVER_THREADS      – torch intra-op threads per worker
+"""
+
+import gc, json, os, signal, socket, struct, threading, time, logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_SOCKET = os.environ.get("VOICE_INFERENCE_SOCKET")
+INFERENCE_TIMEOUT = float(os.environ.get("VOICE_INFERENCE_TIMEOUT", "30"))
+SERVER_THREADS = int(os.environ.get("VOICE_SERVER_THREADS", "1"))
+
+_HEADER = struct.Struct(">I")
+
+
+class InferenceServerError(RuntimeError):
+    pass
+
+
+# -----------------------------------------------------------
+# Framing
+# -----------------------------------------------------------
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    read = 0
+    while read < size:
+        n = sock.recv_into(view[read:], size - read)
+        if not n:
+            raise ConnectionError("inference socket closed mid-message")
+        read += n
+    return buf
+
+
+def send_message(sock: socket.socket, header: dict, payload: bytes = b""):
+    head = json.dumps(header).encode()
+    sock.sendall(_HEADER.pack(len(head)) + head)
+    if payload:
+        sock.sendall(payload)
+
+
+def recv_message(sock: socket.socket, payload_size=None):
+    """(header, payload); `payload_size(header)` says how many payload bytes follow."""
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, size))
+    nbytes = payload_size(header) if payload_size else 0
+    return header, (_recv_exact(sock, nbytes) if nbytes else b"")
+
+
+def _request_bytes(header: dict) -> int:
+    if header.get("op") == "embed":
+        return 4 * sum(header["lengths"])
+    if header.get("op") == "segments":
+        return 4 * header["length"]
+    return 0
+
+
+def _response_bytes(header: dict) -> int:
+    return 4 * int(np.prod(header["shape"])) if header.get("ok") and "shape" in header else 0
+
+
+# -----------------------------------------------------------
+# Memory accounting
+# -----------------------------------------------------------
+def process_memory(pid: int | str = "self") -> dict:
+    """RSS / PSS / USS in MB from /proc (PSS splits shared pages between their users)."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1])
+    except OSError:
+        return {}
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "uss_mb": round(uss / 1024, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024, 1),
+    }
+
+
+# -----------------------------------------------------------
+# Server
+# -----------------------------------------------------------
+def _load_models():
+    """Everything the workers need, loaded (and run once) in the parent before forking."""
+    global INFERENCE_SOCKET
+    import torch
+    from . import speaker_verification as sv
+    from .embedding_batcher import stack_waveforms
+
+    # This process *is* the server, whatever the environment says
+    INFERENCE_SOCKET = None
+    # Keep the parent single-threaded: an OpenMP pool started before fork()
+    # can deadlock the children
+    torch.set_num_threads(1)
+    sv.get_model()
+    sv.get_vad()
+    sv.get_encoder()
+    noise = np.random.default_rng(0).standard_normal(sv.SAMPLE_RATE * 2).astype(np.float32) * 0.1
+    waveform = sv.prepare_waveform(noise)
+    sv._encode_waveforms(*stack_waveforms([waveform, waveform]))
+
+
+def _stop_app_threads():
+    """
+    Shut down the web-process machinery (ffmpeg decoder pool, micro-batcher)
+    if anything started it: its threads, child processes and pipes must not
+    be inherited by the workers.
+    """
+    from . import audio_decoding
+    from . import speaker_verification as sv
+
+    pool, audio_decoding._DECODER_POOL = audio_decoding._DECODER_POOL, None
+    if pool is not None:
+        pool.close()
+    batcher, sv._BATCHER = sv._BATCHER, None
+    if batcher is not None:
+        batcher.close()
+
+
+def _handle(conn: socket.socket):
+    from . import speaker_verification as sv
+    from .embedding_batcher import stack_waveforms
+
+    header, payload = recv_message(conn, _request_bytes)
+    op = header.get("op")
+    if op == "embed":
+        samples = np.frombuffer(payload, dtype="<f4")
+        offsets = np.cumsum([0] + header["lengths"])
+        waveforms = [
+            sv.prepare_waveform(samples[start:end], vad=bool(vad))
+            for start, end, vad in zip(offsets[:-1], offsets[1:], header["vad"])
+        ]
+        embeddings = sv._encode_waveforms(*stack_waveforms(waveforms))
+        send_message(conn, {"ok": True, "shape": list(embeddings.shape)},
+                     np.ascontiguousarray(embeddings, dtype="<f4").tobytes())
+    elif op == "segments":
+        segments = sv._speech_segments(np.frombuffer(payload, dtype="<f4"), header.get("sr", sv.SAMPLE_RATE))
+        send_message(conn, {"ok": True, "segments": [list(map(int, s)) for s in segments]})
+    elif op == "stats":
+        send_message(conn, {"ok": True, "pid": os.getpid(), "memory": process_memory()})
+    else:
+        send_message(conn, {"ok": False, "error": f"unknown op {op!r}"})
+
+
+def _worker(listener: socket.socket, ready_fd: int):
+    import torch
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    torch.set_num_threads(SERVER_THREADS)
+    os.write(ready_fd, b"r")
+    os.close(ready_fd)
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                _handle(conn)
+            except Exception as exc:
+                logger.exception("Inference request failed: %s", exc)
+                try:
+                    send_message(conn, {"ok": False, "error": str(exc)})
+                except OSError:
+                    pass
+
+
+class InferenceServer:
+    def __init__(self, path: str, workers: int = 2):
+        self.path = path
+        self.workers = max(1, workers)
+        self.pids = []
+        self._listener = None
+        self._stopping = False
+
+    def start(self):
+        """Load the models, bind the socket and fork the workers; returns once all are ready."""
+        _stop_app_threads()
+        started = time.perf_counter()
+        _load_models()
+        self.load_seconds = time.perf_counter() - started
+        self.parent_memory = process_memory()
+        logger.info("Voice models loaded in %.1fs, parent %s", self.load_seconds, self.parent_memory)
+
+        # A forked child gets only the calling thread: locks held by any other thread
+        # (_VAD_LOCK, an OpenMP pool mid-run) would stay locked in every worker
+        others = [t.name for t in threading.enumerate() if t is not threading.current_thread()]
+        if others:
+            raise InferenceServerError(f"refusing to fork with other threads running: {', '.join(others)}")
+
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        self._listener.listen(128)
+
+        gc.freeze()  # objects allocated so far are never scanned, so their pages stay shared
+        for _ in range(self.workers):
+            self._spawn()
+
+    def _spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                _worker(self._listener, write_fd)
+            finally:
+                os._exit(1)
+        os.close(write_fd)
+        os.read(read_fd, 1)  # wait until the worker is serving
+        os.close(read_fd)
+        self.pids.append(pid)
+        logger.info("Inference worker %d started", pid)
+
+    def memory_report(self) -> dict:
+        workers = {pid: process_memory(pid) for pid in self.pids}
+        return {"parent": process_memory(), "workers": workers}
+
+    def serve_forever(self):
+        """Supervise: restart workers that die until SIGTERM / SIGINT."""
+        def stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        try:
+            while not self._stopping:
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    pid = 0
+                if pid and pid in self.pids:
+                    self.pids.remove(pid)
+                    logger.warning("Inference worker %d exited (%s), restarting", pid, status)
+                    self._spawn()
+                time.sleep(0.5)
+        finally:
+            self.stop()
+
+    def stop(self):
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+# -----------------------------------------------------------
+# Client (web processes)
+# -----------------------------------------------------------
+class InferenceClient:
+    def __init__(self, path: str = INFERENCE_SOCKET, timeout: float = INFERENCE_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def _call(self, header: dict, payload: bytes = b"") -> tuple:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+                send_message(sock, header, payload)
+                reply, data = recv_message(sock, _response_bytes)
+            except OSError as exc:
+                raise InferenceServerError(f"inference server at {self.path} unavailable: {exc}") from exc
+        if not reply.get("ok"):
+            raise InferenceServerError(reply.get("error", "inference failed"))
+        return reply, data
+
+    def embed(self, clips) -> list:
+        """(samples, vad) clips → unit-norm embeddings, as embed_clips returns them."""
+        arrays = [np.ascontiguousarray(samples, dtype="<f4") for samples, _ in clips]
+        header = {"op": "embed", "lengths": [len(a) for a in arrays], "vad": [bool(vad) for _, vad in clips]}
+        reply, data = self._call(header, b"".join(a.tobytes() for a in arrays))
+        return list(np.frombuffer(data, dtype="<f4").reshape(reply["shape"]).astype(np.float32))
+
+    def segments(self, samples: np.ndarray, sr: int) -> list:
+        array = np.ascontiguousarray(samples, dtype="<f4")
+        reply, _ = self._call({"op": "segments", "length": len(array), "sr": sr}, array.tobytes())
+        return [tuple(s) for s in reply["segments"]]
+
+    def stats(self) -> dict:
+        reply, _ = self._call({"op": "stats"})
+        return reply
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_inference_client() -> InferenceClient | None:
+    """Client for VOICE_INFERENCE_SOCKET (None when models run in this process)."""
+    global _CLIENT
+    if _CLIENT is None and INFERENCE_SOCKET:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = InferenceClient()
+    return _CLIENT
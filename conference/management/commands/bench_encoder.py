@@ -0,0 +1,103 @@
+"""
+Compare ECAPA inference backends: parity, latency and resident memory.
+
+Each backend is measured in a fresh child process so its RSS is not mixed
+with the others'.
+
+    python manage.py bench_encoder
+    python manage.py bench_encoder --backends eager torchscript onnx --batch 4 --iterations 20
+"""
+
+import argparse, json, resource, subprocess, sys, time
+
+from django.core.management.base import BaseCommand
+
+from conference.inference_backends import BACKENDS
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+class Command(BaseCommand):
+    help = "Benchmark latency, parity and RSS of the ECAPA inference backends."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+        parser.add_argument("--batch", type=int, default=1, help="clips per forward pass")
+        parser.add_argument("--seconds", type=float, default=3.2, help="clip length")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--json", action="store_true", help="print one JSON object per backend")
+        # internal: measure a single backend in this process
+        parser.add_argument("--child", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **opts):
+        if opts["child"]:
+            self.stdout.write(json.dumps(self._measure(opts["child"], opts)))
+            return
+
+        results = []
+        for backend in opts["backends"]:
+            cmd = [sys.executable, sys.argv[0], "bench_encoder", "--child", backend,
+                   "--batch", str(opts["batch"]), "--seconds", str(opts["seconds"]),
+                   "--iterations", str(opts["iterations"]), "--warmup", str(opts["warmup"])]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            lines = proc.stdout.strip().splitlines()
+            if proc.returncode != 0 or not lines:
+                results.append({"backend": backend, "error": proc.stderr.strip().splitlines()[-1:]})
+                continue
+            results.append(json.loads(lines[-1]))
+
+        if opts["json"]:
+            for row in results:
+                self.stdout.write(json.dumps(row))
+            return
+
+        self.stdout.write(f"{'backend':<18}{'parity':>10}{'p50 ms':>10}{'p95 ms':>10}"
+                          f"{'clips/s':>10}{'RSS MB':>10}{'+model MB':>11}")
+        for row in results:
+            if "error" in row:
+                self.stdout.write(f"{row['backend']:<18}  failed: {' '.join(row['error'])}")
+                continue
+            self.stdout.write(
+                f"{row['backend']:<18}{row['max_cosine_deviation']:>10.2e}{row['p50_ms']:>10.1f}"
+                f"{row['p95_ms']:>10.1f}{row['clips_per_sec']:>10.1f}{row['rss_mb']:>10.0f}"
+                f"{row['rss_mb'] - row['rss_base_mb']:>11.0f}"
+            )
+
+    def _measure(self, backend: str, opts) -> dict:
+        import numpy as np
+        import torch
+
+        from conference.inference_backends import build_encoder, check_parity
+        from conference.speaker_verification import SAMPLE_RATE, get_model
+
+        rss_base = _rss_mb()
+        model = get_model()
+        encoder = build_encoder(model, backend)
+        parity = check_parity(model, encoder)
+
+        wavs = torch.randn(opts["batch"], int(opts["seconds"] * SAMPLE_RATE)) * 0.1
+        lens = torch.ones(opts["batch"])
+        for _ in range(opts["warmup"]):
+            encoder(wavs, lens)
+        timings = []
+        for _ in range(opts["iterations"]):
+            start = time.perf_counter()
+            encoder(wavs, lens)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings = np.asarray(timings)
+        return {
+            "backend": backend,
+            "max_cosine_deviation": parity["max_cosine_deviation"],
+            "parity_ok": parity["ok"],
+            "batch": opts["batch"],
+            "p50_ms": float(np.percentile(timings, 50)),
+            "p95_ms": float(np.percentile(timings, 95)),
+            "clips_per_sec": float(opts["batch"] * 1000 / timings.mean()),
+            "rss_base_mb": rss_base,
+            "rss_mb": _rss_mb(),
+        }
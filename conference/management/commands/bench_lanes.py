@@ -0,0 +1,100 @@
+"""
+Verification throughput versus CPU lane configuration.
+
+Runs --requests single-clip embeddings (Silero crop + ECAPA forward pass)
+from --concurrency caller threads, once per configuration:
+
+    off       every caller thread runs torch itself with the default thread count
+    LxT       L lanes of T torch threads each (see conference/inference_lanes.py)
+
+    python manage.py bench_lanes
+    python manage.py bench_lanes --configs off 1x8 2x4 4x2 8x1 --concurrency 16 --affinity
+"""
+
+import json, time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+
+def _parse(config: str):
+    if config == "off":
+        return None
+    try:
+        lanes, threads = (int(part) for part in config.lower().split("x"))
+    except ValueError:
+        raise CommandError(f"bad lane config {config!r}, expected 'off' or LANESxTHREADS")
+    return lanes, threads
+
+
+class Command(BaseCommand):
+    help = "Benchmark embedding throughput for several lane x thread configurations."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--configs", nargs="+", default=None,
+                            help="'off' and/or LANESxTHREADS (default: off plus splits of the usable cores)")
+        parser.add_argument("--concurrency", type=int, default=8, help="concurrent callers")
+        parser.add_argument("--requests", type=int, default=48)
+        parser.add_argument("--seconds", type=float, default=4.0, help="clip length")
+        parser.add_argument("--affinity", action="store_true", help="pin lanes to their cores")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        import torch
+
+        from conference import speaker_verification as sv
+        from conference.inference_lanes import LaneScheduler, usable_cores
+        from conference.management.commands.bench_voice import synthetic_clip
+
+        cores = len(usable_cores())
+        configs = opts["configs"] or ["off"] + [f"{n}x{cores // n}" for n in (1, 2, 4, 8) if n <= cores]
+        default_threads = torch.get_num_threads()
+        clips = [(synthetic_clip(opts["seconds"], seed), True) for seed in range(8)]
+        sv._embed_on_lane(clips[:2])  # load models outside the measurement
+
+        results = []
+        for config in configs:
+            parsed = _parse(config)
+            if parsed is None:
+                def init():
+                    torch.get_num_threads()
+                    torch.set_num_threads(default_threads)
+
+                def job(clip):
+                    return sv._embed_on_lane([clip])
+                label = f"off ({default_threads} threads per caller)"
+            else:
+                scheduler = LaneScheduler(*parsed, affinity=opts["affinity"])
+                init = None
+
+                def job(clip, scheduler=scheduler):
+                    return scheduler.run(sv._embed_on_lane, [clip])
+                label = config
+            results.append(self._run(label, job, init, clips, opts))
+
+        if opts["json"]:
+            for row in results:
+                self.stdout.write(json.dumps(row))
+            return
+        self.stdout.write(f"{cores} usable cores, {opts['concurrency']} concurrent callers, "
+                          f"{opts['requests']} requests of {opts['seconds']}s")
+        self.stdout.write(f"{'config':<32}{'clips/s':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        for row in results:
+            self.stdout.write(f"{row['config']:<32}{row['clips_per_sec']:>10.2f}{row['p50_ms']:>10.1f}"
+                              f"{row['p95_ms']:>10.1f}")
+
+    def _run(self, label, job, init, clips, opts) -> dict:
+        def timed(i):
+            started = time.perf_counter()
+            job(clips[i % len(clips)])
+            return (time.perf_counter() - started) * 1000
+
+        with ThreadPoolExecutor(max_workers=opts["concurrency"], initializer=init) as pool:
+            list(pool.map(timed, range(opts["concurrency"])))  # warm every thread / lane
+            started = time.perf_counter()
+            latencies = list(pool.map(timed, range(opts["requests"])))
+            wall = time.perf_counter() - started
+        p50, p95 = np.percentile(latencies, [50, 95])
+        return {"config": label, "clips_per_sec": opts["requests"] / wall,
+                "p50_ms": float(p50), "p95_ms": float(p95)}
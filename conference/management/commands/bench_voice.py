@@ -0,0 +1,206 @@
+"""
+Stage-by-stage benchmark of the speaker-verification pipeline.
+
+Every request is split into the stages verify_voice runs:
+
+    decode   decode_audio (container -> 16 kHz float samples)
+    quality  audio_quality.assess (level / clipping / SNR / voiced gate)
+    vad      prepare_waveform (normalize, Silero VAD crop, fix length)
+    embed    embed_waveforms (ECAPA forward pass, through the micro-batcher)
+    score    _verify with the ready embedding (baselines, threshold, stats)
+
+Clips are synthetic speech-like signals (encoded with ffmpeg to --format,
+"webm" by default like browser uploads) or the files in --audio-dir. A
+throwaway in-memory voiceprint store is used, so real enrollments are
+never touched.
+
+    python manage.py bench_voice --output bench.json
+    python manage.py bench_voice --concurrency 4 --requests 64
+    python manage.py bench_voice --save-baseline conference/bench_baseline.json
+    python manage.py bench_voice --baseline conference/bench_baseline.json --tolerance 0.25
+
+With --baseline the command exits non-zero when the p50 of any stage is
+more than --tolerance slower than the stored one.
+"""
+
+import io, json, os, platform, subprocess, time, wave
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+STAGES = ("decode", "quality", "vad", "embed", "score", "total")
+
+
+def synthetic_clip(seconds: float, seed: int, sr: int = 16_000) -> np.ndarray:
+    """Speech-like test signal: pitched harmonics with syllable-rate envelope, pauses and noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = rng.uniform(95, 220) * (1 + 0.06 * np.sin(2 * np.pi * rng.uniform(0.5, 2) * t))
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = np.clip(np.sin(2 * np.pi * rng.uniform(3, 5) * t), 0, None) ** 0.6
+    pauses = (np.sin(2 * np.pi * 0.35 * t + rng.uniform(0, np.pi)) > -0.7).astype(np.float32)
+    signal = voiced * syllables * pauses + 0.01 * rng.standard_normal(t.size)
+    return (0.3 * signal / np.abs(signal).max()).astype(np.float32)
+
+
+def _wav_bytes(samples: np.ndarray, sr: int = 16_000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buf.getvalue()
+
+
+def _encode(wav: bytes, fmt: str) -> bytes:
+    if fmt == "wav":
+        return wav
+    from conference.audio_decoding import _find_ffmpeg_exe
+
+    codec = {"webm": ["-c:a", "libopus"], "ogg": ["-c:a", "libopus"], "mp3": ["-c:a", "libmp3lame"]}[fmt]
+    proc = subprocess.run(
+        [_find_ffmpeg_exe(), "-loglevel", "error", "-i", "pipe:0", *codec, "-f", fmt, "pipe:1"],
+        input=wav, capture_output=True, check=True,
+    )
+    return proc.stdout
+
+
+def _summary(values) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3),
+            "mean_ms": round(float(values.mean()), 3), "count": int(values.size)}
+
+
+class Command(BaseCommand):
+    help = "Benchmark decode / VAD / embedding / scoring and compare against a stored baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--audio-dir", help="use these audio files instead of synthetic clips")
+        parser.add_argument("--format", choices=("webm", "ogg", "mp3", "wav"), default="webm",
+                            help="container for synthetic clips")
+        parser.add_argument("--clips", type=int, default=8, help="distinct synthetic clips")
+        parser.add_argument("--seconds", type=float, default=5.0, help="synthetic clip length")
+        parser.add_argument("--requests", type=int, default=32, help="verifications per mode")
+        parser.add_argument("--concurrency", type=int, default=4, help="threads for the concurrent mode (0 = skip)")
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--output", help="write the JSON results here (default: stdout)")
+        parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown per stage")
+        parser.add_argument("--save-baseline", help="store this run as the new baseline")
+
+    def handle(self, *args, **opts):
+        import torch
+
+        from conference import speaker_verification as sv
+        from conference import voiceprint_store
+        from conference.audio_quality import assess
+        from conference.inference_backends import INFERENCE_BACKEND
+
+        # Never touch real enrollments
+        voiceprint_store._STORE = voiceprint_store.VoiceprintStore(":memory:")
+
+        clips = self._load_clips(opts)
+        room, user = "bench", "speaker"
+        for blob in clips[:sv.MAX_BASELINE_CLIPS]:
+            result = sv.enroll_voice(blob, room, user)
+            if not result["success"]:
+                raise CommandError(f"enrollment failed: {result['message']}")
+
+        def request(blob: bytes) -> dict:
+            timings = {}
+            start = time.perf_counter()
+            samples, _ = sv.decode_audio(blob, sv.SAMPLE_RATE)
+            t1 = time.perf_counter()
+            report = assess(samples, sv.SAMPLE_RATE)
+            if not report.ok:
+                raise CommandError(f"clip rejected by the quality gate: {report.reason}")
+            tq = time.perf_counter()
+            waveform = sv.prepare_waveform(samples, sv.SAMPLE_RATE, vad=not report.speech_only)
+            t2 = time.perf_counter()
+            embedding = sv.embed_waveforms([waveform])[0]
+            t3 = time.perf_counter()
+            result = sv._verify(room, user, lambda info: embedding)
+            t4 = time.perf_counter()
+            if not result["success"]:
+                raise CommandError(f"verification failed: {result['message']}")
+            timings["decode"], timings["quality"], timings["vad"] = (
+                (t1 - start) * 1000, (tq - t1) * 1000, (t2 - tq) * 1000,
+            )
+            timings["embed"], timings["score"], timings["total"] = (
+                (t3 - t2) * 1000, (t4 - t3) * 1000, (t4 - start) * 1000,
+            )
+            return timings
+
+        for i in range(opts["warmup"]):
+            request(clips[i % len(clips)])
+
+        results = {
+            "meta": {
+                "python": platform.python_version(),
+                "torch": torch.__version__,
+                "torch_threads": torch.get_num_threads(),
+                "cpu_count": os.cpu_count(),
+                "inference_backend": INFERENCE_BACKEND,
+                "format": "files" if opts["audio_dir"] else opts["format"],
+                "clips": len(clips),
+                "requests": opts["requests"],
+            },
+            "single": self._run(request, clips, opts["requests"], 1),
+        }
+        if opts["concurrency"] > 0:
+            results["concurrent"] = self._run(request, clips, opts["requests"], opts["concurrency"])
+
+        text = json.dumps(results, indent=2)
+        if opts["output"]:
+            Path(opts["output"]).write_text(text + "\n")
+        else:
+            self.stdout.write(text)
+        if opts["save_baseline"]:
+            Path(opts["save_baseline"]).write_text(text + "\n")
+            self.stderr.write(f"Baseline saved to {opts['save_baseline']}")
+        if opts["baseline"]:
+            self._compare(results, json.loads(Path(opts["baseline"]).read_text()), opts["tolerance"])
+
+    def _load_clips(self, opts) -> list:
+        if opts["audio_dir"]:
+            files = sorted(p for p in Path(opts["audio_dir"]).iterdir() if p.is_file())
+            if not files:
+                raise CommandError(f"no audio files in {opts['audio_dir']}")
+            return [p.read_bytes() for p in files]
+        return [_encode(_wav_bytes(synthetic_clip(opts["seconds"], seed)), opts["format"])
+                for seed in range(opts["clips"])]
+
+    def _run(self, request, clips, requests: int, concurrency: int) -> dict:
+        blobs = [clips[i % len(clips)] for i in range(requests)]
+        start = time.perf_counter()
+        if concurrency == 1:
+            timings = [request(blob) for blob in blobs]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                timings = list(pool.map(request, blobs))
+        wall = time.perf_counter() - start
+        return {
+            "concurrency": concurrency,
+            "requests_per_sec": round(requests / wall, 3),
+            "stages": {stage: _summary([t[stage] for t in timings]) for stage in STAGES},
+        }
+
+    def _compare(self, results: dict, baseline: dict, tolerance: float):
+        regressions = []
+        for mode in ("single", "concurrent"):
+            if mode not in results or mode not in baseline:
+                continue
+            for stage in STAGES:
+                old = baseline[mode]["stages"].get(stage, {}).get("p50_ms")
+                new = results[mode]["stages"][stage]["p50_ms"]
+                if old and new > old * (1 + tolerance):
+                    regressions.append(f"{mode}/{stage}: p50 {new:.1f} ms vs baseline {old:.1f} ms "
+                                       f"(+{(new / old - 1) * 100:.0f}%)")
+        if regressions:
+            raise CommandError("Performance regression:\n  " + "\n  ".join(regressions))
+        self.stderr.write(f"No stage slower than baseline by more than {tolerance:.0%}")
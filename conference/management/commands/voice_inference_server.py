@@ -0,0 +1,79 @@
+"""
+Run the pre-forked voice inference server (see conference/inference_server.py).
+
+    python manage.py voice_inference_server --workers 4 --socket /run/voice.sock
+    python manage.py voice_inference_server --workers 4 --report     # memory table, then exit
+
+--report starts the server, sends a few requests through the socket, prints
+RSS / PSS / USS for the parent and every worker, and compares the total
+against --workers processes that each load their own models (the parent's
+footprint after loading is what one such process costs).
+"""
+
+import json, tempfile, time
+from pathlib import Path
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from conference.inference_server import INFERENCE_SOCKET, InferenceClient, InferenceServer
+
+
+class Command(BaseCommand):
+    help = "Serve ECAPA / Silero inference to web processes from pre-forked workers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=INFERENCE_SOCKET, help="Unix socket path (VOICE_INFERENCE_SOCKET)")
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument("--report", action="store_true", help="print per-worker memory and exit")
+        parser.add_argument("--requests", type=int, default=8, help="requests sent before --report measures")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        path = opts["socket"] or str(Path(tempfile.gettempdir()) / "voice-inference.sock")
+        server = InferenceServer(path, opts["workers"])
+        server.start()
+        if not opts["report"]:
+            self.stdout.write(f"Voice inference server on {path} with {len(server.pids)} workers "
+                              f"(models loaded in {server.load_seconds:.1f}s)")
+            server.serve_forever()
+            return
+
+        try:
+            report = self._report(server, path, opts["requests"])
+        finally:
+            server.stop()
+        if opts["json"]:
+            self.stdout.write(json.dumps(report))
+            return
+        self.stdout.write(f"{'process':<16}{'RSS MB':>10}{'PSS MB':>10}{'USS MB':>10}{'shared MB':>11}")
+        rows = [("parent", report["parent"])] + [(f"worker {pid}", m) for pid, m in report["workers"].items()]
+        for name, m in rows:
+            self.stdout.write(f"{name:<16}{m['rss_mb']:>10}{m['pss_mb']:>10}{m['uss_mb']:>10}{m['shared_mb']:>11}")
+        self.stdout.write(
+            f"Forked: {report['forked_total_mb']} MB total (PSS) for {opts['workers']} workers; "
+            f"separate processes loading their own models: ~{report['separate_total_mb']} MB "
+            f"({report['load_seconds']}s load, {report['embed_ms']} ms per request)"
+        )
+
+    def _report(self, server, path: str, requests: int) -> dict:
+        client = InferenceClient(path)
+        rng = np.random.default_rng(0)
+        clip = (0.1 * rng.standard_normal(16_000 * 3)).astype(np.float32)
+        started = time.perf_counter()
+        for i in range(requests):
+            client.embed([(clip, i % 2 == 0)])
+        embed_ms = (time.perf_counter() - started) * 1000 / max(requests, 1)
+
+        memory = server.memory_report()
+        workers = memory["workers"]
+        forked = memory["parent"].get("pss_mb", 0) + sum(m.get("pss_mb", 0) for m in workers.values())
+        return {
+            "parent": memory["parent"],
+            "workers": workers,
+            "forked_total_mb": round(forked, 1),
+            # each process would hold what the parent holds after loading, plus its own working set
+            "separate_total_mb": round(len(workers) * server.parent_memory.get("rss_mb", 0), 1),
+            "load_seconds": round(server.load_seconds, 1),
+            "embed_ms": round(embed_ms, 1),
+        }
@@ -0,0 +1,197 @@
+"""
+1:N speaker identification over enrolled voiceprints.
+
+Every enrolled user is represented by the unit-norm centroid of their
+baseline clips. Small rooms are searched exactly with one matrix-vector
+product; once a room (or the cross-room index) holds VOICE_ANN_MIN_SIZE
+users, an inverted-file index (spherical k-means lists) is built and only
+the VOICE_ANN_NPROBE closest lists are scored.
+
+Raw cosines are turned into calibrated confidences with a logistic curve
+(VOICE_IDENTIFY_SLOPE / VOICE_IDENTIFY_MIDPOINT), and into a share of
+probability among the returned candidates with a softmax.
+
+Indexes are cached per room (VOICE_INDEX_CACHE_SIZE most recently used
+rooms). The all-rooms index is refreshed in the background, at most once
+every VOICE_GLOBAL_INDEX_REFRESH seconds, instead of inside identify
+requests.
+"""
+
+import logging, math, os, threading, time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List
+
+import numpy as np
+
+from .voiceprint_store import get_store
+
+logger = logging.getLogger(__name__)
+
+ANN_MIN_SIZE = int(os.environ.get("VOICE_ANN_MIN_SIZE", "256"))
+ANN_NPROBE = int(os.environ.get("VOICE_ANN_NPROBE", "8"))
+IDENTIFY_SLOPE = float(os.environ.get("VOICE_IDENTIFY_SLOPE", "18"))
+IDENTIFY_MIDPOINT = float(os.environ.get("VOICE_IDENTIFY_MIDPOINT", "0.6"))
+SOFTMAX_TEMPERATURE = float(os.environ.get("VOICE_IDENTIFY_TEMPERATURE", "0.05"))
+INDEX_CACHE_SIZE = int(os.environ.get("VOICE_INDEX_CACHE_SIZE", "64"))
+GLOBAL_INDEX_REFRESH = float(os.environ.get("VOICE_GLOBAL_INDEX_REFRESH", "30"))
+
+
+@dataclass
+class Match:
+    user_key: str
+    room: str
+    user: str
+    similarity: float
+    confidence: float
+    probability: float
+
+    def as_dict(self) -> dict:
+        return {
+            "user_key": self.user_key,
+            "room": self.room,
+            "user": self.user,
+            "similarity": self.similarity,
+            "confidence": self.confidence,
+            "probability": self.probability,
+        }
+
+
+def calibrate(similarity: np.ndarray) -> np.ndarray:
+    """Map cosine similarity to a match probability."""
+    return 1.0 / (1.0 + np.exp(-IDENTIFY_SLOPE * (similarity - IDENTIFY_MIDPOINT)))
+
+
+def _normalize(x: np.ndarray) -> np.ndarray:
+    return x / (np.linalg.norm(x, axis=-1, keepdims=True) + 1e-9)
+
+
+def _spherical_kmeans(x: np.ndarray, k: int, iters: int = 10, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        assign = np.argmax(x @ centers.T, axis=1)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assign, x)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centers[empty]
+        centers = _normalize(sums)
+    return centers, np.argmax(x @ centers.T, axis=1)
+
+
+class CentroidIndex:
+    def __init__(self, keys: List[tuple], centroids: np.ndarray,
+                 ann_min_size: int = ANN_MIN_SIZE, nprobe: int = ANN_NPROBE):
+        self.keys = keys  # [(user_key, room, user)]
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.lists = None
+        if len(keys) >= ann_min_size:
+            nlist = max(2, int(math.sqrt(len(keys))))
+            self.coarse, assign = _spherical_kmeans(self.centroids, nlist)
+            self.lists = [np.flatnonzero(assign == c) for c in range(nlist)]
+
+    @property
+    def kind(self) -> str:
+        return "ivf" if self.lists is not None else "exact"
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def search(self, probe: np.ndarray, top_k: int):
+        """Return (indices, similarities) of the best top_k users, best first."""
+        if not self.keys:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        if self.lists is None:
+            candidates = np.arange(len(self.keys))
+            scores = self.centroids @ probe
+        else:
+            nprobe = min(self.nprobe, len(self.lists))
+            nearest = np.argpartition(-(self.coarse @ probe), nprobe - 1)[:nprobe]
+            candidates = np.concatenate([self.lists[c] for c in nearest])
+            scores = self.centroids[candidates] @ probe
+        top_k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    def identify(self, probe: np.ndarray, top_k: int = 3) -> List[Match]:
+        idx, sims = self.search(_normalize(np.asarray(probe, dtype=np.float32)), top_k)
+        if not len(idx):
+            return []
+        sims = np.clip(sims, -1.0, 1.0)
+        shares = np.exp((sims - sims.max()) / SOFTMAX_TEMPERATURE)
+        shares /= shares.sum()
+        confidences = calibrate(sims)
+        return [
+            Match(*self.keys[i], similarity=float(s), confidence=float(c), probability=float(p))
+            for i, s, c, p in zip(idx, sims, confidences, shares)
+        ]
+
+    @classmethod
+    def from_store(cls, room: str | None = None, store=None) -> "CentroidIndex":
+        store = store or get_store()
+        keys, centroids = [], []
+        for key, room_name, user, baselines in store.iter_voiceprints(room):
+            keys.append((key, room_name, user))
+            centroids.append(_normalize(baselines.mean(axis=0)))
+        dim = centroids[0].shape[0] if centroids else 0
+        return cls(keys, np.stack(centroids) if centroids else np.zeros((0, dim), np.float32))
+
+
+_INDEXES = OrderedDict()  # room (None = all rooms) -> (version, CentroidIndex), LRU order
+_INDEX_LOCK = threading.Lock()
+_GLOBAL_REBUILD = {"thread": None, "started": 0.0}
+
+
+def _cache(room, version, index):
+    with _INDEX_LOCK:
+        _INDEXES[room] = (version, index)
+        _INDEXES.move_to_end(room)
+        while len(_INDEXES) > INDEX_CACHE_SIZE:
+            _INDEXES.popitem(last=False)
+
+
+def _rebuild_global(store):
+    try:
+        version = store.room_version(None)
+        _cache(None, version, CentroidIndex.from_store(None, store))
+    except Exception:
+        logger.exception("Rebuilding the all-rooms speaker index failed")
+
+
+def _refresh_global(store):
+    """Start a background rebuild of the all-rooms index, at most once per GLOBAL_INDEX_REFRESH."""
+    with _INDEX_LOCK:
+        thread = _GLOBAL_REBUILD["thread"]
+        if thread is not None and thread.is_alive():
+            return
+        if time.monotonic() - _GLOBAL_REBUILD["started"] < GLOBAL_INDEX_REFRESH:
+            return
+        _GLOBAL_REBUILD["started"] = time.monotonic()
+        thread = _GLOBAL_REBUILD["thread"] = threading.Thread(
+            target=_rebuild_global, args=(store,), name="speaker-index-rebuild", daemon=True
+        )
+    thread.start()
+
+
+def get_index(room: str | None = None) -> CentroidIndex:
+    """
+    Cached index for a room, rebuilt whenever its voiceprints change. The
+    all-rooms index changes with every enrollment anywhere, so a stale one
+    keeps serving while it is rebuilt in the background.
+    """
+    store = get_store()
+    version = store.room_version(room)
+    with _INDEX_LOCK:
+        cached = _INDEXES.get(room)
+        if cached is not None:
+            _INDEXES.move_to_end(room)
+    if cached and cached[0] == version:
+        return cached[1]
+    if cached and room is None:
+        _refresh_global(store)
+        return cached[1]
+    index = CentroidIndex.from_store(room, store)
+    _cache(room, version, index)
+    return index
@@ -6,20 +6,33 @@ Enterprise-grade Speaker Verification using SpeechBrain ECAPA-TDNN + Silero VAD.
 ✅ Adaptive per-user thresholds (self-normalizing)
 ✅ Silero VAD for robust speech trimming
 ✅ Safe normalization & similarity clamping
+✅ Voiceprints persisted in a shared SQLite store (voiceprint_store)
 
 API:
     enroll_voice(audio_bytes, room, username)
     verify_voice(audio_bytes, room, username)
+    identify_voice(audio_bytes, room=None, top_k=3)
 """
 
-import os, io, subprocess, tempfile, shutil, logging
+import os, itertools, threading, time, logging
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Iterable, List
 import numpy as np
-import torch, torchaudio
-from scipy.spatial.distance import cosine
+import torch
 from speechbrain.inference import EncoderClassifier
-import imageio_ffmpeg
+
+from videocall_project import metrics
+
+from .audio_decoding import ClipTooLong, decode_audio
+from .audio_quality import QUALITY_GATE, AudioRejected, QualityReport, assess
+from .embedding_batcher import BATCH_WINDOW_MS, EmbeddingBatcher, stack_waveforms
+from .embedding_cache import audio_digest, get_embedding_cache
+from .inference_backends import INFERENCE_BACKEND, load_encoder
+from .inference_lanes import get_lane_scheduler
+from .inference_server import get_inference_client
+from .speaker_index import get_index
+from .verification_stats import VerificationStats
+from .voiceprint_store import get_store
 
 # -----------------------------------------------------------
 # Configuration & Globals
@@ -31,12 +44,23 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 _MODEL = None
-VOICE_BASELINES: Dict[str, List[np.ndarray]] = {}
-USER_STATS: Dict[str, Dict[str, list | float]] = {}
+_MODEL_LOCK = threading.Lock()
+
+# Bundled weights; falls back to the HuggingFace hub when they are missing.
+MODEL_DIR = Path(os.environ.get("VOICE_MODEL_DIR", Path(__file__).resolve().parent / "models" / "spkrec-ecapa-voxceleb"))
+# Optional local checkout of snakers4/silero-vad (torch.hub source="local").
+SILERO_DIR = os.environ.get("VOICE_SILERO_DIR")
 
 SAMPLE_RATE = 16_000
 TARGET_SPEECH_SECONDS = 3.2
-MAX_BASELINE_CLIPS = 5
+MAX_BASELINE_CLIPS = int(os.environ.get("VOICE_MAX_BASELINE_CLIPS", "5"))
+
+_STAGE_SECONDS = metrics.histogram("voice_stage_seconds", "Voice pipeline time per stage", ["stage"])
+DECODE_SECONDS, GATE_SECONDS, VAD_SECONDS, EMBED_SECONDS, SCORE_SECONDS = (
+    _STAGE_SECONDS.labels(stage) for stage in ("decode", "quality", "vad", "embed", "score")
+)
+_REJECTED = metrics.counter("voice_quality_rejected_total", "Clips rejected by the quality gate", ["reason"])
+VAD_SKIPPED = metrics.counter("voice_vad_skipped_total", "Clips the quality gate found to be all speech").labels()
 
 # -----------------------------------------------------------
 # Model loader
@@ -44,15 +68,21 @@ MAX_BASELINE_CLIPS = 5
 def get_model(device: str | None = None):
     global _MODEL
     if _MODEL is None:
-        run_device = device or ("cuda" if torch.cuda.is_available() else "cpu")
-        save_dir = Path.cwd() / "models" / "spkrec-ecapa-voxceleb"
-        save_dir.mkdir(parents=True, exist_ok=True)
-        _MODEL = EncoderClassifier.from_hparams(
-            source="speechbrain/spkrec-ecapa-voxceleb",
-            savedir=str(save_dir),
-            run_opts={"device": run_device},
-        )
-        logger.info("ECAPA-TDNN model loaded on %s", run_device)
+        with _MODEL_LOCK:
+            if _MODEL is None:
+                run_device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+                if (MODEL_DIR / "hyperparams.yaml").is_file():
+                    source, save_dir = str(MODEL_DIR), MODEL_DIR
+                else:
+                    source = "speechbrain/spkrec-ecapa-voxceleb"
+                    save_dir = Path.cwd() / "models" / "spkrec-ecapa-voxceleb"
+                    save_dir.mkdir(parents=True, exist_ok=True)
+                _MODEL = EncoderClassifier.from_hparams(
+                    source=source,
+                    savedir=str(save_dir),
+                    run_opts={"device": run_device},
+                )
+                logger.info("ECAPA-TDNN model loaded on %s from %s", run_device, source)
     return _MODEL
 
 
@@ -61,31 +91,42 @@ def get_model(device: str | None = None):
 # -----------------------------------------------------------
 _SILERO_VAD = None
 _GET_SPEECH_TS = None
+# The Silero JIT model keeps recurrent state between windows; one caller at a time.
+_VAD_LOCK = threading.Lock()
+_VAD_LOAD_LOCK = threading.Lock()
+
+def _load_silero():
+    """Prefer local weights (checkout dir, then the silero-vad package) over torch.hub downloads."""
+    if SILERO_DIR:
+        model, utils = torch.hub.load(SILERO_DIR, 'silero_vad', source='local')
+        return model, utils[0]
+    try:
+        from silero_vad import get_speech_timestamps, load_silero_vad
+    except ImportError:
+        model, utils = torch.hub.load('snakers4/silero-vad', 'silero_vad', trust_repo=True)
+        return model, utils[0]  # get_speech_timestamps
+    return load_silero_vad(), get_speech_timestamps
+
 
 def get_vad():
     global _SILERO_VAD, _GET_SPEECH_TS
     if _SILERO_VAD is None:
-        logger.info("Loading Silero VAD model...")
-        _SILERO_VAD, utils = torch.hub.load('snakers4/silero-vad', 'silero_vad', trust_repo=True)
-        _GET_SPEECH_TS = utils[0]  # get_speech_timestamps
-        logger.info("Silero VAD loaded.")
+        with _VAD_LOAD_LOCK:
+            if _SILERO_VAD is None:
+                logger.info("Loading Silero VAD model...")
+                _SILERO_VAD, _GET_SPEECH_TS = _load_silero()
+                logger.info("Silero VAD loaded.")
     return _SILERO_VAD, _GET_SPEECH_TS
 
 
 # -----------------------------------------------------------
 # Audio preprocessing
 # -----------------------------------------------------------
-def _find_ffmpeg_exe() -> str:
-    exe = shutil.which("ffmpeg")
-    if exe:
-        return exe
-    return imageio_ffmpeg.get_ffmpeg_exe()
-
-
 def _silero_crop(waveform: torch.Tensor, sr: int) -> torch.Tensor:
     """Crop to main voiced region using Silero VAD timestamps."""
     model, get_ts = get_vad()
-    ts = get_ts(waveform.squeeze(), model, sampling_rate=sr)
+    with _VAD_LOCK:
+        ts = get_ts(waveform.squeeze(), model, sampling_rate=sr)
     if not ts:
         return waveform
     start = ts[0]["start"]
@@ -93,68 +134,259 @@ def _silero_crop(waveform: torch.Tensor, sr: int) -> torch.Tensor:
     return waveform[:, start:end]
 
 
-def audio_bytes_to_tensor(audio_bytes: bytes, sample_rate: int = SAMPLE_RATE):
-    """Decode WebM/MP3/WAV → mono 16kHz, crop to voiced 3.2s region."""
-    temp_in = temp_out = None
+def _speech_segments(samples: np.ndarray, sr: int) -> List[tuple]:
+    model, get_ts = get_vad()
+    with _VAD_LOCK:
+        ts = get_ts(torch.from_numpy(np.ascontiguousarray(samples, dtype=np.float32)), model, sampling_rate=sr)
+    return [(t["start"], t["end"]) for t in ts]
+
+
+def speech_segments(samples: np.ndarray, sr: int = SAMPLE_RATE) -> List[tuple]:
+    """Silero VAD (start, end) sample offsets of the speech inside `samples`."""
+    client = get_inference_client()
+    if client is not None:
+        return client.segments(samples, sr)
+    # With lanes enabled all torch work runs on them: a caller thread would pick up
+    # whatever thread count the last lane set as the process default
+    scheduler = get_lane_scheduler()
+    if scheduler is not None:
+        return scheduler.run(_speech_segments, samples, sr)
+    return _speech_segments(samples, sr)
+
+
+def decode_clip(audio_bytes: bytes, sample_rate: int = SAMPLE_RATE, info: dict | None = None):
+    """Decode WebM/MP3/WAV → mono 16kHz samples and quality-gate them: (samples, run VAD?)."""
+    started = time.perf_counter()
     try:
-        ffmpeg = _find_ffmpeg_exe()
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as f:
-            temp_in = f.name
-            f.write(audio_bytes)
-            f.flush()
-        temp_out = temp_in.rsplit(".", 1)[0] + ".wav"
-        cmd = [
-            ffmpeg, "-y", "-nostdin", "-loglevel", "error",
-            "-i", temp_in, "-ac", "1", "-ar", str(sample_rate),
-            "-acodec", "pcm_s16le", temp_out,
-        ]
-        subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-        waveform, sr = torchaudio.load(temp_out)
-        if waveform.numel() == 0:
-            raise ValueError("Empty audio after decode.")
-        if waveform.size(0) > 1:
-            waveform = waveform.mean(dim=0, keepdim=True)
-
-        waveform = waveform - waveform.mean()
-        peak = waveform.abs().max()
-        if peak > 0:
-            waveform = waveform / peak
-        waveform = torch.clamp(waveform, -1.0, 1.0)
-
+        samples, decode_path = decode_audio(audio_bytes, sample_rate)
+    except ClipTooLong as exc:
+        _REJECTED.labels("too_long").inc()
+        raise AudioRejected(QualityReport(exc.seconds, -120.0, 0.0, 0.0, 0.0, False, "too_long"))
+    DECODE_SECONDS.observe(time.perf_counter() - started)
+    if info is not None:
+        info["decode_path"] = decode_path
+        info["duration"] = len(samples) / sample_rate
+    vad = True
+    if QUALITY_GATE:
+        started = time.perf_counter()
+        report = assess(samples, sample_rate)
+        GATE_SECONDS.observe(time.perf_counter() - started)
+        if info is not None:
+            info["quality"] = report.as_dict()
+        if not report.ok:
+            _REJECTED.labels(report.reason).inc()
+            raise AudioRejected(report)
+        # Speech from the first frame to the last: the Silero crop would be a no-op
+        vad = not report.speech_only
+        if not vad:
+            VAD_SKIPPED.inc()
+    logger.info("Preprocessed: sr=%d, decode=%s", sample_rate, decode_path)
+    return samples, vad
+
+
+def audio_bytes_to_tensor(audio_bytes: bytes, sample_rate: int = SAMPLE_RATE, info: dict | None = None):
+    """Decode WebM/MP3/WAV → mono 16kHz, quality-gate, crop to voiced 3.2s region."""
+    samples, vad = decode_clip(audio_bytes, sample_rate, info)
+    return prepare_waveform(samples, sample_rate, vad=vad), sample_rate
+
+
+def prepare_waveform(samples: np.ndarray, sr: int = SAMPLE_RATE, vad: bool = True) -> torch.Tensor:
+    """Mono float samples → normalized (1, T) tensor, VAD-cropped and fixed to 3.2s."""
+    waveform = torch.from_numpy(np.ascontiguousarray(samples, dtype=np.float32)).unsqueeze(0)
+
+    waveform = waveform - waveform.mean()
+    peak = waveform.abs().max()
+    if peak > 0:
+        waveform = waveform / peak
+    waveform = torch.clamp(waveform, -1.0, 1.0)
+
+    if vad:
+        started = time.perf_counter()
         waveform = _silero_crop(waveform, sr)
+        VAD_SECONDS.observe(time.perf_counter() - started)
 
-        # Fixed-length center crop
-        target = int(TARGET_SPEECH_SECONDS * sr)
-        if waveform.shape[1] >= target:
-            waveform = waveform[:, :target]
-        else:
-            pad = target - waveform.shape[1]
-            waveform = torch.nn.functional.pad(waveform, (0, pad))
-
-        duration = waveform.shape[1] / sr
-        logger.info("Preprocessed: sr=%d, speech_dur=%.2fs", sr, duration)
-        return waveform, sr
-    finally:
-        for p in (temp_in, temp_out):
-            if p and os.path.exists(p):
-                os.remove(p)
+    # Fixed-length center crop
+    target = int(TARGET_SPEECH_SECONDS * sr)
+    if waveform.shape[1] >= target:
+        waveform = waveform[:, :target]
+    else:
+        pad = target - waveform.shape[1]
+        waveform = torch.nn.functional.pad(waveform, (0, pad))
+    return waveform
 
 
 # -----------------------------------------------------------
 # Embedding extraction
 # -----------------------------------------------------------
-def extract_embedding(audio_bytes: bytes) -> np.ndarray:
-    waveform, sr = audio_bytes_to_tensor(audio_bytes)
-    model = get_model()
-    device = next(model.modules()).device
-    waveform = waveform.to(device)
+_ENCODER = None
+
+
+def get_encoder():
+    """ECAPA forward pass for the configured VOICE_INFERENCE_BACKEND (parity-checked)."""
+    global _ENCODER
+    if _ENCODER is None:
+        model = get_model()
+        with _MODEL_LOCK:
+            if _ENCODER is None:
+                _ENCODER = load_encoder(model, INFERENCE_BACKEND)
+    return _ENCODER
+
+
+def _encode_waveforms(wavs: torch.Tensor, lens: torch.Tensor) -> np.ndarray:
+    """(B, T) waveforms → (B, 192) unit-norm embeddings in one forward pass."""
+    encoder = get_encoder()
+    device = next(encoder.model.modules()).device
 
     with torch.no_grad():
-        emb = model.encode_batch(waveform)
-        emb = torch.nn.functional.normalize(emb, p=2, dim=-1).reshape(-1)
-    emb_np = emb.cpu().numpy().astype(np.float32)
-    emb_np /= np.linalg.norm(emb_np) + 1e-9
-    return emb_np
+        emb = encoder(wavs.to(device), lens.to(device))
+        emb = torch.nn.functional.normalize(emb, p=2, dim=-1)
+    return emb.cpu().numpy().astype(np.float32)
+
+
+_BATCHER = None
+_BATCHER_LOCK = threading.Lock()
+
+
+def get_batcher() -> EmbeddingBatcher | None:
+    """Shared micro-batcher (None when VOICE_BATCH_WINDOW_MS < 0 disables it)."""
+    global _BATCHER
+    if _BATCHER is None and BATCH_WINDOW_MS >= 0:
+        with _BATCHER_LOCK:
+            if _BATCHER is None:
+                _BATCHER = EmbeddingBatcher(_encode_waveforms)
+    return _BATCHER
+
+
+def embed_waveforms(waveforms: List[torch.Tensor]) -> List[np.ndarray]:
+    started = time.perf_counter()
+    batcher = get_batcher()
+    if batcher is not None:
+        embeddings = batcher.embed(waveforms)
+    else:
+        wavs, lens = stack_waveforms(waveforms)
+        embeddings = list(_encode_waveforms(wavs, lens))
+    EMBED_SECONDS.observe(time.perf_counter() - started)
+    return embeddings
+
+
+def _embed_on_lane(clips: List[tuple]) -> List[np.ndarray]:
+    waveforms = [prepare_waveform(samples, vad=vad) for samples, vad in clips]
+    started = time.perf_counter()
+    embeddings = list(_encode_waveforms(*stack_waveforms(waveforms)))
+    EMBED_SECONDS.observe(time.perf_counter() - started)
+    return embeddings
+
+
+def embed_clips(clips: List[tuple]) -> List[np.ndarray]:
+    """Embed decoded (samples, vad) clips: on the inference server or a CPU lane when configured."""
+    client = get_inference_client()
+    if client is not None:
+        started = time.perf_counter()
+        embeddings = client.embed(clips)
+        EMBED_SECONDS.observe(time.perf_counter() - started)
+        return embeddings
+    scheduler = get_lane_scheduler()
+    if scheduler is not None:
+        return scheduler.run(_embed_on_lane, clips)
+    return embed_waveforms([prepare_waveform(samples, vad=vad) for samples, vad in clips])
+
+
+def _cached_embedding(audio_bytes: bytes, info: dict | None):
+    """(digest, embedding or None); digest is None when the cache is disabled."""
+    cache = get_embedding_cache()
+    if cache is None:
+        return None, None
+    digest = audio_digest(audio_bytes, INFERENCE_BACKEND)
+    embedding = cache.get(digest)
+    if embedding is not None and info is not None:
+        info["decode_path"] = "cache"
+    return digest, embedding
+
+
+def extract_embedding(audio_bytes: bytes, info: dict | None = None) -> np.ndarray:
+    digest, embedding = _cached_embedding(audio_bytes, info)
+    if embedding is not None:
+        return embedding
+    started = time.perf_counter()
+    embedding = embed_clips([decode_clip(audio_bytes, info=info)])[0]
+    if digest is not None:
+        get_embedding_cache().put(digest, embedding, time.perf_counter() - started)
+    return embedding
+
+
+metrics.collector("voice_batcher_pending", "Clips waiting for the ECAPA micro-batcher",
+                  lambda: _BATCHER.stats()["pending"] if _BATCHER is not None else None)
+metrics.collector("voice_batcher_batches_total", "ECAPA forward passes run by the micro-batcher",
+                  lambda: _BATCHER.batches if _BATCHER is not None else None, kind="counter")
+
+
+# -----------------------------------------------------------
+# Warm-up & readiness
+# -----------------------------------------------------------
+# Opt-in: the ASGI entry point starts warm_up() in the background when VOICE_WARMUP=1,
+# so management commands never load models or start the decoder pool / batcher.
+WARMUP_ON_START = os.environ.get("VOICE_WARMUP", "").lower() in ("1", "true", "yes")
+WARMUP_RETRY_SECONDS = (5, 15, 30, 60)  # backoff between failed attempts, the last one repeats
+_READY = threading.Event()
+_WARMUP = {"state": "pending" if WARMUP_ON_START else "disabled", "error": None, "seconds": None, "attempts": 0}
+
+
+def warm_up():
+    """Load ECAPA + Silero and run dummy passes so the first real request is fast."""
+    _WARMUP.update(state="running", error=None, attempts=_WARMUP["attempts"] + 1)
+    started = time.perf_counter()
+    try:
+        from .audio_decoding import get_decoder_pool
+        get_decoder_pool(SAMPLE_RATE)
+
+        client = get_inference_client()
+        if client is not None:
+            # Models live in the inference server; just make sure it answers
+            client.stats()
+            _WARMUP.update(state="done", seconds=round(time.perf_counter() - started, 3))
+            _READY.set()
+            return True
+
+        noise = np.random.default_rng(0).standard_normal(SAMPLE_RATE * 2).astype(np.float32) * 0.1
+        speech_segments(noise)
+        waveform = prepare_waveform(noise, vad=False)
+        embed_waveforms([waveform])
+        wavs, lens = stack_waveforms([waveform, waveform])
+        _encode_waveforms(wavs, lens)
+    except Exception as exc:
+        logger.exception("Voice model warm-up failed: %s", exc)
+        _WARMUP.update(state="failed", error=str(exc))
+        return False
+    _WARMUP.update(state="done", seconds=round(time.perf_counter() - started, 3))
+    _READY.set()
+    logger.info("Voice models warmed up in %.2fs", _WARMUP["seconds"])
+    return True
+
+
+def _warm_up_until_ready():
+    """warm_up(), retried with backoff: a transient failure must not keep the process unready."""
+    for attempt in itertools.count():
+        if warm_up():
+            return
+        delay = WARMUP_RETRY_SECONDS[min(attempt, len(WARMUP_RETRY_SECONDS) - 1)]
+        logger.warning("Retrying voice model warm-up in %gs", delay)
+        time.sleep(delay)
+
+
+def start_warm_up() -> threading.Thread:
+    thread = threading.Thread(target=_warm_up_until_ready, name="voice-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def readiness() -> dict:
+    """Ready once warm-up finished (always ready when warm-up is not enabled)."""
+    cache = get_embedding_cache()
+    return {
+        "ready": _READY.is_set() or not WARMUP_ON_START,
+        "warmup": dict(_WARMUP),
+        "embedding_cache": cache.stats() if cache is not None else None,
+    }
 
 
 # -----------------------------------------------------------
@@ -163,79 +395,95 @@ def extract_embedding(audio_bytes: bytes) -> np.ndarray:
 def compute_similarity(a: np.ndarray, b: np.ndarray) -> float:
     a = a / (np.linalg.norm(a) + 1e-9)
     b = b / (np.linalg.norm(b) + 1e-9)
-    return float(np.clip(1.0 - cosine(a, b), 0.0, 1.0))
+    return float(np.clip(np.dot(a, b), 0.0, 1.0))
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    """(n, D) float32 with every row L2-normalized."""
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    return matrix / (np.linalg.norm(matrix, axis=1, keepdims=True) + 1e-9)
+
+
+def score_against_baselines(baselines: np.ndarray, probe: np.ndarray) -> np.ndarray:
+    """Clamped cosine of a unit-norm probe against unit-norm (n, D) baselines: one mat-vec."""
+    return np.clip(baselines @ probe, 0.0, 1.0)
 
 
-def _update_baseline_profile(key: str) -> float:
-    """Update cached stats about the enrolled baseline clips."""
-    samples = VOICE_BASELINES.get(key) or []
-    if not samples:
-        USER_STATS.pop(key, None)
+def baseline_consistency(baselines: np.ndarray) -> float:
+    """Mean clamped pairwise cosine between baseline clips (one Gram matrix)."""
+    n = len(baselines)
+    if n < 2:
+        return 1.0
+    gram = np.clip(baselines @ baselines.T, 0.0, 1.0)
+    return float((gram.sum() - np.trace(gram)) / (n * (n - 1)))
+
+
+def _update_baseline_profile(key: str, samples: np.ndarray | None = None) -> float:
+    """Update stored stats about the enrolled baseline clips."""
+    store = get_store()
+    if samples is None:
+        samples = store.get_baselines(key)
+    if samples is None or not len(samples):
+        store.clear_stats(key)
         return 0.0
 
-    stats = USER_STATS.setdefault(key, {"samples": [], "mean": 0.0})
-    if len(samples) > 1:
-        pairwise_scores = [
-            compute_similarity(samples[i], samples[j])
-            for i in range(len(samples))
-            for j in range(i + 1, len(samples))
-        ]
-        baseline_score = float(np.mean(pairwise_scores)) if pairwise_scores else 1.0
-    else:
-        baseline_score = 1.0
+    baseline_score = baseline_consistency(samples)
+
+    def set_baseline(stats):
+        stats.baseline_mean = baseline_score
 
-    stats["baseline_mean"] = baseline_score
+    store.update_stats(key, set_baseline)
     return baseline_score
 
 
-def _derive_threshold(key: str, baseline_score: float | None = None, base_thresh: float = 0.6) -> float:
-    """Blend baseline quality and recent verification matches into a working threshold."""
-    stats = USER_STATS.get(key)
+def _derive_threshold(stats: VerificationStats | None, baseline_score: float | None = None,
+                      base_thresh: float = 0.6) -> float:
+    """Blend baseline quality and recent verification matches (from `stats`) into a working threshold."""
     threshold = base_thresh
 
     if baseline_score is None and stats:
-        baseline_score = stats.get("baseline_mean")
+        baseline_score = stats.baseline_mean
 
     if baseline_score:
         threshold = max(threshold, min(0.9, baseline_score * 0.92))
 
-    if stats:
-        recent_samples = stats.get("samples") or []
-        if recent_samples:
-            recent_mean = float(np.mean(recent_samples[-5:]))
-            threshold = max(threshold, min(0.9, recent_mean * 0.98))
+    if stats and stats.recent_mean is not None:
+        threshold = max(threshold, min(0.9, stats.recent_mean * 0.98))
 
     return float(np.clip(threshold, 0.5, 0.95))
 
 
 def get_dynamic_threshold(key: str, base_thresh=0.60):
     """Compute adaptive threshold from baseline quality and recent samples."""
-    return _derive_threshold(key, base_thresh=base_thresh)
+    return _derive_threshold(get_store().get_stats(key), base_thresh=base_thresh)
 
 
 # -----------------------------------------------------------
 # Enrollment & Verification
 # -----------------------------------------------------------
+def _rejected(exc: AudioRejected, **extra) -> dict:
+    """Failure payload for a clip the quality gate turned down (reason code + measurements)."""
+    result = {"success": False, "message": str(exc), "reason": exc.reason, "quality": exc.report.as_dict(), **extra}
+    if exc.index is not None:
+        result["index"] = exc.index
+        result["message"] = f"Sample {exc.index + 1}: {exc}"
+    return result
+
+
 def enroll_voice(audio_bytes: bytes, room: str, user: str):
     key = f"{room}_{user}"
+    info = {}
     try:
-        new_emb = extract_embedding(audio_bytes)
-        existing = VOICE_BASELINES.get(key)
+        new_emb = _unit_rows(extract_embedding(audio_bytes, info=info))
+        samples = get_store().append_baseline(key, room, user, new_emb, MAX_BASELINE_CLIPS)
 
-        if not existing:
-            VOICE_BASELINES[key] = [new_emb]
+        if len(samples) == 1:
             msg = "Baseline enrolled (n=1)"
         else:
-            if isinstance(existing, np.ndarray):
-                existing = [existing]
-            existing.append(new_emb)
-            if len(existing) > MAX_BASELINE_CLIPS:
-                existing = existing[-MAX_BASELINE_CLIPS:]
-            VOICE_BASELINES[key] = existing
-            msg = f"Baseline updated (n={len(existing)})"
+            msg = f"Baseline updated (n={len(samples)})"
 
-        baseline_quality = _update_baseline_profile(key)
-        threshold = _derive_threshold(key, baseline_quality)
+        baseline_quality = _update_baseline_profile(key, samples)
+        threshold = _derive_threshold(get_store().get_stats(key), baseline_quality)
 
         return {
             "success": True,
@@ -243,64 +491,145 @@ def enroll_voice(audio_bytes: bytes, room: str, user: str):
             "user_key": key,
             "threshold": threshold,
             "baseline_quality": baseline_quality,
+            "decode_path": info.get("decode_path"),
+            "quality": info.get("quality"),
         }
+    except AudioRejected as exc:
+        return _rejected(exc)
     except Exception as e:
         logger.exception("Enroll failed: %s", e)
         return {"success": False, "message": f"Enrollment failed: {e}"}
 
 
-def enroll_voice_batch(audio_iterable: Iterable[bytes], room: str, user: str):
+def _store_batch(room: str, user: str, embeddings: List[np.ndarray], decode_paths: list) -> dict:
+    """Replace the user's baseline with the last MAX_BASELINE_CLIPS embeddings."""
     key = f"{room}_{user}"
-    try:
-        embeddings = []
-        for blob in audio_iterable:
-            if not blob:
-                continue
-            emb = extract_embedding(blob)
-            embeddings.append(emb)
-
-        if not embeddings:
-            raise ValueError("No valid audio samples provided.")
-
-        USER_STATS.pop(key, None)
-        baseline_samples = list(embeddings[-MAX_BASELINE_CLIPS:])
-        VOICE_BASELINES[key] = baseline_samples
-        baseline_quality = _update_baseline_profile(key)
-        threshold = _derive_threshold(key, baseline_quality)
-        return {
-            "success": True,
-            "message": f"Baseline updated (n={len(baseline_samples)})",
-            "user_key": key,
-            "threshold": threshold,
-            "baseline_quality": baseline_quality,
-        }
-    except Exception as exc:
-        logger.exception("Batch enroll failed: %s", exc)
-        return {"success": False, "message": f"Enrollment failed: {exc}"}
+    if not embeddings:
+        raise ValueError("No valid audio samples provided.")
+
+    baseline_samples = get_store().set_baselines(
+        key, room, user, _unit_rows(np.stack(embeddings[-MAX_BASELINE_CLIPS:])), reset_stats=True
+    )
+    baseline_quality = _update_baseline_profile(key, baseline_samples)
+    threshold = _derive_threshold(get_store().get_stats(key), baseline_quality)
+    return {
+        "success": True,
+        "message": f"Baseline updated (n={len(baseline_samples)})",
+        "user_key": key,
+        "threshold": threshold,
+        "baseline_quality": baseline_quality,
+        "decode_paths": decode_paths,
+    }
+
+
+class BatchEnrollment:
+    """
+    Batch enrollment fed one clip at a time, as a streamed upload delivers
+    them: each clip is looked up in the embedding cache on arrival, only
+    misses are decoded and quality-gated, and finish() embeds them all in one
+    batched forward pass.
+    """
+
+    def __init__(self):
+        self.embeddings: List[np.ndarray | None] = []
+        self.decode_paths = []
+        self.seconds = 0.0  # decoded audio held until finish(); cache hits hold none
+        self.failure: dict | None = None
+        self._pending = []  # (position, cache digest, decoded clip) still to embed
+
+    def add(self, audio_bytes: bytes) -> bool:
+        """Look up, or decode and gate, one clip; False once a clip was rejected (see `failure`)."""
+        if not audio_bytes:
+            return True
+        info = {}
+        try:
+            digest, embedding = _cached_embedding(audio_bytes, info)
+            if embedding is None:
+                clip = decode_clip(audio_bytes, info=info)
+        except AudioRejected as exc:
+            exc.index = len(self.embeddings)
+            self.failure = _rejected(exc)
+            return False
+        except Exception as exc:
+            logger.exception("Batch enroll failed: %s", exc)
+            self.failure = {"success": False, "message": f"Enrollment failed: {exc}"}
+            return False
+        if embedding is None:
+            self._pending.append((len(self.embeddings), digest, clip))
+            self.seconds += info["duration"]
+        self.embeddings.append(embedding)
+        self.decode_paths.append(info.get("decode_path"))
+        return True
+
+    def _embed_pending(self):
+        started = time.perf_counter()
+        fresh = embed_clips([clip for _, _, clip in self._pending])
+        cost = (time.perf_counter() - started) / len(self._pending)
+        cache = get_embedding_cache()
+        for (position, digest, _), embedding in zip(self._pending, fresh):
+            self.embeddings[position] = embedding
+            if digest is not None:
+                cache.put(digest, embedding, cost)
+        self._pending = []
+
+    def finish(self, room: str, user: str) -> dict:
+        if self.failure is not None:
+            return self.failure
+        try:
+            if self._pending:
+                self._embed_pending()
+            return _store_batch(room, user, self.embeddings, self.decode_paths)
+        except Exception as exc:
+            logger.exception("Batch enroll failed: %s", exc)
+            return {"success": False, "message": f"Enrollment failed: {exc}"}
+
+
+def enroll_voice_batch(audio_iterable: Iterable[bytes], room: str, user: str):
+    """Enroll from clips already in memory; stops at the first rejected one."""
+    batch = BatchEnrollment()
+    for audio_bytes in audio_iterable:
+        if not batch.add(audio_bytes):
+            break
+    return batch.finish(room, user)
 
 
 def verify_voice(audio_bytes: bytes, room: str, user: str):
+    return _verify(room, user, lambda info: extract_embedding(audio_bytes, info=info))
+
+
+def verify_waveform(samples: np.ndarray, room: str, user: str):
+    """Verify already-decoded 16 kHz speech (live streams): no decode, no VAD pass."""
+    def embed(info):
+        info["decode_path"] = "stream"
+        return embed_clips([(samples, False)])[0]
+    return _verify(room, user, embed)
+
+
+def _verify(room: str, user: str, embed):
     key = f"{room}_{user}"
-    base_list = VOICE_BASELINES.get(key)
-    if not base_list:
+    store = get_store()
+    # One read for baselines and stats, one write transaction for the new score
+    base_list, stats = store.get_profile(key)
+    if base_list is None:
         return {"success": False, "message": "No baseline found.", "percentage": 0}
 
+    info = {}
     try:
-        verify_emb = extract_embedding(audio_bytes)
-        scores = [compute_similarity(base_emb, verify_emb) for base_emb in base_list]
+        verify_emb = _unit_rows(embed(info))[0]
+        started = time.perf_counter()
+        scores = score_against_baselines(base_list, verify_emb)
         avg_sim = float(np.mean(scores))
         max_sim = float(np.max(scores))
         blended_sim = float(np.clip(max(avg_sim, max_sim * 0.95), 0.0, 1.0))
 
-        stats = USER_STATS.setdefault(key, {"samples": [], "mean": 0.0})
-        baseline_quality = stats.get("baseline_mean")
-        if not baseline_quality:
-            baseline_quality = _update_baseline_profile(key)
-            stats = USER_STATS.setdefault(key, {"samples": [], "mean": 0.0})
-        baseline_quality = float(baseline_quality or 0.75)
+        measured = stats.baseline_mean if stats else None
+        if not measured:
+            # Not profiled yet; stored along with this score below
+            measured = baseline_consistency(base_list)
+        baseline_quality = float(measured or 0.75)
 
         # adaptive thresholding
-        thresh = get_dynamic_threshold(key)
+        thresh = _derive_threshold(stats, measured)
         relative_score = blended_sim / max(baseline_quality, 1e-6)
         relative_score = float(np.clip(relative_score, 0.0, 1.2))
         pct = round(min(relative_score, 1.0) * 100)
@@ -313,18 +642,15 @@ def verify_voice(audio_bytes: bytes, room: str, user: str):
         else:
             status = "suspicious"
 
-        stats["samples"].append(blended_sim)
-        if len(stats["samples"]) > 50:
-            stats["samples"] = stats["samples"][-50:]
-        stats["mean"] = float(np.mean(stats["samples"][-10:]))
-        stats["last_score"] = blended_sim
-        stats["best_score"] = max_sim
-        stats["baseline_mean"] = baseline_quality
+        def record(stats):
+            stats.record(blended_sim, max_sim, relative_score)
+            stats.baseline_mean = baseline_quality
 
-        best_relative = max(relative_score, stats.get("best_relative", 0.0))
-        stats["best_relative"] = best_relative
+        stats = store.update_stats(key, record)
+        best_relative = stats.best_relative if stats else relative_score
         if status == "suspicious" and best_relative >= 0.85:
             status = "medium_confidence"
+        SCORE_SECONDS.observe(time.perf_counter() - started)
 
         return {
             "success": True,
@@ -335,8 +661,38 @@ def verify_voice(audio_bytes: bytes, room: str, user: str):
             "baseline_quality": baseline_quality,
             "percentage": pct,
             "status": status,
-            "message": f"Voice match: {pct}% ({status})"
+            "message": f"Voice match: {pct}% ({status})",
+            "decode_path": info.get("decode_path"),
+            "quality": info.get("quality"),
         }
+    except AudioRejected as exc:
+        return _rejected(exc, percentage=0)
     except Exception as e:
         logger.exception("Verify failed: %s", e)
         return {"success": False, "message": f"Verification failed: {e}", "percentage": 0}
+
+
+def identify_voice(audio_bytes: bytes, room: str | None = None, top_k: int = 3):
+    """Rank every enrolled user in `room` (all rooms when None) against one clip."""
+    info = {}
+    try:
+        index = get_index(room)
+        if not len(index):
+            return {"success": False, "message": "No enrolled voices found.", "matches": []}
+
+        probe = _unit_rows(extract_embedding(audio_bytes, info=info))[0]
+        matches = [m.as_dict() for m in index.identify(probe, top_k=max(1, top_k))]
+        best = matches[0]
+        return {
+            "success": True,
+            "matches": matches,
+            "candidates": len(index),
+            "index": index.kind,
+            "message": f"Best match: {best['user']} ({round(best['confidence'] * 100)}%)",
+            "decode_path": info.get("decode_path"),
+        }
+    except AudioRejected as exc:
+        return _rejected(exc, matches=[])
+    except Exception as e:
+        logger.exception("Identify failed: %s", e)
+        return {"success": False, "message": f"Identification failed: {e}", "matches": []}
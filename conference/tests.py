@@ -0,0 +1,345 @@
+from unittest import mock
+
+import numpy as np
+from django.test import RequestFactory, SimpleTestCase
+
+from . import speaker_index, speaker_verification, views
+from .audio_quality import AudioRejected, assess
+from .speaker_index import CentroidIndex
+from .voice_stream import StreamingVerifier
+from .verification_stats import HISTORY, MEAN_WINDOW, RECENT_WINDOW, VerificationStats
+from .voiceprint_store import VoiceprintStore
+
+
+class VerificationStatsTests(SimpleTestCase):
+    def _record_all(self, scores, capacity=HISTORY):
+        stats = VerificationStats(capacity)
+        for score in scores:
+            stats.record(score, score, score)
+        return stats
+
+    def test_empty(self):
+        stats = VerificationStats()
+        self.assertEqual(stats.mean, 0.0)
+        self.assertIsNone(stats.recent_mean)
+        self.assertEqual(stats.samples(), [])
+
+    def test_running_means_follow_the_windows(self):
+        scores = [i / 100 for i in range(1, 23)]
+        stats = self._record_all(scores)
+        self.assertAlmostEqual(stats.mean, sum(scores[-MEAN_WINDOW:]) / MEAN_WINDOW, places=5)
+        self.assertAlmostEqual(stats.recent_mean, sum(scores[-RECENT_WINDOW:]) / RECENT_WINDOW, places=5)
+
+        short = self._record_all(scores[:3])
+        self.assertAlmostEqual(short.mean, sum(scores[:3]) / 3, places=5)
+        self.assertAlmostEqual(short.recent_mean, sum(scores[:3]) / 3, places=5)
+
+    def test_ring_buffer_keeps_the_newest_scores_in_order(self):
+        scores = [i / 1000 for i in range(137)]
+        stats = self._record_all(scores, capacity=20)
+        self.assertEqual(len(stats.samples()), 20)
+        for kept, expected in zip(stats.samples(), scores[-20:]):
+            self.assertAlmostEqual(kept, expected, places=5)
+        self.assertAlmostEqual(stats.mean, sum(scores[-MEAN_WINDOW:]) / MEAN_WINDOW, places=5)
+
+    def test_record_tracks_last_best_and_best_relative(self):
+        stats = VerificationStats()
+        stats.record(0.7, 0.8, 0.9)
+        stats.record(0.6, 0.65, 0.7)
+        self.assertEqual(stats.last_score, 0.6)
+        self.assertEqual(stats.best_score, 0.65)
+        self.assertEqual(stats.best_relative, 0.9)
+
+    def test_binary_round_trip(self):
+        stats = self._record_all([0.5, 0.75, 0.25] * 20)
+        stats.baseline_mean = 0.8
+        blob = stats.to_bytes()
+        loaded = VerificationStats.load(blob)
+        self.assertEqual(loaded.samples(), stats.samples())
+        self.assertEqual(loaded.n, stats.n)
+        self.assertAlmostEqual(loaded.mean, stats.mean)
+        self.assertAlmostEqual(loaded.recent_mean, stats.recent_mean)
+        self.assertEqual(loaded.baseline_mean, 0.8)
+        self.assertIsNone(VerificationStats.load(None))
+
+        # Appending after a reload continues the same ring
+        loaded.record(1.0, 1.0, 1.0)
+        self.assertAlmostEqual(loaded.samples()[-1], 1.0)
+
+    def test_unset_fields_survive_storage(self):
+        loaded = VerificationStats.load(VerificationStats().to_bytes())
+        self.assertIsNone(loaded.last_score)
+        self.assertIsNone(loaded.baseline_mean)
+        self.assertEqual(loaded.best_relative, 0.0)
+
+    def test_unknown_version(self):
+        blob = bytearray(VerificationStats().to_bytes())
+        blob[0] = 99
+        with self.assertRaises(ValueError):
+            VerificationStats.from_bytes(bytes(blob))
+
+
+class QualityGateTests(SimpleTestCase):
+    SR = 16_000
+
+    def _speech(self, seconds, lead=0.0, gain=1.0):
+        """Noise under a syllable-rate envelope: loud and quiet frames, like speech."""
+        rng = np.random.default_rng(0)
+        t = np.arange(int(seconds * self.SR)) / self.SR
+        voiced = 0.1 * (0.2 + np.abs(np.sin(2 * np.pi * 2 * t))) * rng.standard_normal(len(t))
+        return (gain * np.concatenate([np.zeros(int(lead * self.SR)), voiced])).astype(np.float32)
+
+    def _phrase(self, seed, seconds=4.0):
+        """
+        A recording like the dashboard's 4 s clips: the speaker starts late and
+        says a few words of 1-3 syllables, stressed and unstressed, with pauses
+        between words, over a quiet room.
+        """
+        rng = np.random.default_rng(seed)
+        out = np.zeros(int(seconds * self.SR))
+        t = 1.0
+        while t < seconds - 0.6:
+            for _ in range(rng.integers(1, 4)):
+                n = int(rng.uniform(0.12, 0.25) * self.SR)
+                start = int(t * self.SR)
+                gain = 0.25 * 10 ** (-rng.uniform(0, 18) / 20)
+                out[start:start + n] += gain * np.hanning(n) * rng.standard_normal(n)
+                t += n / self.SR + 0.03
+            t += rng.uniform(0.3, 0.8)
+        out += 10 ** (-62 / 20) * rng.standard_normal(len(out))
+        return out.astype(np.float32)
+
+    def assertReason(self, samples, reason):
+        report = assess(samples, self.SR)
+        self.assertEqual(report.reason, reason, report.as_dict())
+        return report
+
+    def test_speech_passes(self):
+        report = self.assertReason(self._speech(3), None)
+        self.assertTrue(report.ok)
+        self.assertTrue(report.speech_only)
+        self.assertAlmostEqual(report.duration, 3.0)
+
+    def test_unhurried_phrases_pass(self):
+        for seed in range(8):
+            report = self.assertReason(self._phrase(seed), None)
+            self.assertLess(report.voiced_seconds, 1.5)
+
+    def test_leading_silence_needs_the_vad_crop(self):
+        report = self.assertReason(self._speech(2, lead=0.5), None)
+        self.assertFalse(report.speech_only)
+
+    def test_silence(self):
+        self.assertReason(np.zeros(2 * self.SR, dtype=np.float32), "silence")
+        self.assertReason(self._speech(3, gain=0.003), "silence")
+
+    def test_too_short(self):
+        self.assertReason(np.concatenate([self._speech(0.3), np.zeros(self.SR, dtype=np.float32)]), "too_short")
+        self.assertReason(np.zeros(100, dtype=np.float32), "too_short")
+
+    def test_clipping(self):
+        t = np.arange(2 * self.SR) / self.SR
+        self.assertReason(np.sign(np.sin(2 * np.pi * 200 * t)).astype(np.float32), "clipping")
+
+    def test_steady_noise_is_low_snr(self):
+        noise = 0.1 * np.random.default_rng(1).standard_normal(2 * self.SR).astype(np.float32)
+        self.assertReason(noise, "low_snr")
+
+    def test_rejection_carries_the_report(self):
+        exc = AudioRejected(assess(np.zeros(self.SR, dtype=np.float32), self.SR))
+        self.assertEqual(exc.reason, "silence")
+        self.assertEqual(exc.report.as_dict()["reason"], "silence")
+        self.assertIn("microphone", str(exc))
+
+
+class _FakeStore:
+    def __init__(self, rooms):
+        self.rooms = rooms  # room -> {user: (n, D) baselines}
+        self.version = 0
+        self.iterated = []
+
+    def room_version(self, room=None):
+        return (room, self.version)
+
+    def iter_voiceprints(self, room=None):
+        self.iterated.append(room)
+        for room_name, users in self.rooms.items():
+            if room is None or room == room_name:
+                for user, baselines in users.items():
+                    yield f"{room_name}_{user}", room_name, user, baselines
+
+
+class CentroidIndexTests(SimpleTestCase):
+    def _voices(self, n, dim=192, seed=0):
+        rng = np.random.default_rng(seed)
+        return rng.standard_normal((n, dim)).astype(np.float32)
+
+    def test_exact_search_ranks_the_enrolled_voice_first(self):
+        voices = self._voices(20)
+        index = CentroidIndex([(f"r_u{i}", "r", f"u{i}") for i in range(20)], speaker_index._normalize(voices))
+        self.assertEqual(index.kind, "exact")
+        matches = index.identify(voices[7] + 0.1 * self._voices(1, seed=1)[0], top_k=3)
+        self.assertEqual(matches[0].user, "u7")
+        self.assertEqual(len(matches), 3)
+        self.assertGreater(matches[0].confidence, matches[1].confidence)
+        self.assertAlmostEqual(sum(m.probability for m in matches), 1.0, places=5)
+
+    def test_ivf_recall(self):
+        n = 1000
+        voices = speaker_index._normalize(self._voices(n))
+        keys = [(f"r_u{i}", "r", f"u{i}") for i in range(n)]
+        ivf = CentroidIndex(keys, voices, ann_min_size=256, nprobe=8)
+        exact = CentroidIndex(keys, voices, ann_min_size=n + 1)
+        self.assertEqual(ivf.kind, "ivf")
+
+        noise = speaker_index._normalize(self._voices(200, seed=2))
+        probes = speaker_index._normalize(voices[:200] + 0.5 * noise)
+        hits = sum(ivf.search(p, 1)[0][0] == exact.search(p, 1)[0][0] for p in probes)
+        self.assertGreaterEqual(hits / len(probes), 0.95)
+
+    def test_empty_index(self):
+        index = CentroidIndex.from_store("r", _FakeStore({}))
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.identify(np.ones(4)), [])
+
+
+class IndexCacheTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.store = _FakeStore({room: {"ana": rng.standard_normal((2, 8))} for room in ("a", "b", "c")})
+        patches = [
+            mock.patch.object(speaker_index, "get_store", return_value=self.store),
+            mock.patch.object(speaker_index, "_INDEXES", speaker_index.OrderedDict()),
+            mock.patch.object(speaker_index, "_GLOBAL_REBUILD", {"thread": None, "started": 0.0}),
+            mock.patch.object(speaker_index, "INDEX_CACHE_SIZE", 2),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_rooms_are_cached_until_they_change(self):
+        first = speaker_index.get_index("a")
+        self.assertIs(speaker_index.get_index("a"), first)
+        self.store.version += 1
+        self.assertIsNot(speaker_index.get_index("a"), first)
+
+    def test_least_recently_used_room_is_evicted(self):
+        for room in ("a", "b", "a", "c"):
+            speaker_index.get_index(room)
+        self.assertEqual(list(speaker_index._INDEXES), ["a", "c"])
+
+    def test_stale_global_index_is_served_while_rebuilt(self):
+        stale = speaker_index.get_index(None)
+        self.store.version += 1
+        self.assertIs(speaker_index.get_index(None), stale)
+        speaker_index._GLOBAL_REBUILD["thread"].join()
+        fresh = speaker_index.get_index(None)
+        self.assertIsNot(fresh, stale)
+        self.assertEqual(self.store.iterated, [None, None])
+
+        # Rate limited: another change within GLOBAL_INDEX_REFRESH keeps the current index
+        self.store.version += 1
+        self.assertIs(speaker_index.get_index(None), fresh)
+        self.assertEqual(self.store.iterated, [None, None])
+
+
+class StreamingVerifierTests(SimpleTestCase):
+    def test_odd_length_frames_are_dropped_to_keep_samples_aligned(self):
+        stream = StreamingVerifier("r", "ana", block_seconds=0.001)  # 16-sample blocks
+        pcm = np.arange(16, dtype="<i2").tobytes()
+        self.assertFalse(stream.push(b"\x01" + pcm))
+        self.assertEqual(stream.dropped_bytes, 33)
+        self.assertTrue(stream.push(pcm))
+        np.testing.assert_array_equal(stream._next_block() * 32768, np.arange(16))
+
+
+class BatchEnrollmentTests(SimpleTestCase):
+    def setUp(self):
+        self.cached = {b"known": np.ones(4)}
+        self.decoded = []
+        self.stored = []
+        patches = [
+            mock.patch.object(speaker_verification, "_cached_embedding", self._cached_embedding),
+            mock.patch.object(speaker_verification, "decode_clip", self._decode_clip),
+            mock.patch.object(speaker_verification, "embed_clips",
+                              lambda clips: [np.full(4, len(audio)) for audio, _ in clips]),
+            mock.patch.object(speaker_verification, "get_embedding_cache", return_value=mock.Mock()),
+            mock.patch.object(speaker_verification, "_store_batch",
+                              lambda room, user, embeddings, paths: self.stored.append((embeddings, paths))
+                              or {"success": True}),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _cached_embedding(self, audio_bytes, info):
+        embedding = self.cached.get(audio_bytes)
+        if embedding is not None:
+            info["decode_path"] = "cache"
+        return audio_bytes, embedding
+
+    def _decode_clip(self, audio_bytes, info):
+        if audio_bytes == b"noise":
+            raise AudioRejected(assess(np.zeros(16_000, dtype=np.float32), 16_000))
+        self.decoded.append(audio_bytes)
+        info.update(decode_path="ffmpeg", duration=2.0)
+        return audio_bytes, True
+
+    def test_only_cache_misses_are_decoded(self):
+        batch = speaker_verification.BatchEnrollment()
+        for clip in (b"new", b"known", b"", b"newer"):
+            self.assertTrue(batch.add(clip))
+        self.assertEqual(self.decoded, [b"new", b"newer"])
+        self.assertEqual(batch.seconds, 4.0)
+        self.assertEqual(batch.finish("r", "ana"), {"success": True})
+        (embeddings, paths), = self.stored
+        self.assertEqual([e[0] for e in embeddings], [3, 1, 5])
+        self.assertEqual(paths, ["ffmpeg", "cache", "ffmpeg"])
+
+    def test_enroll_voice_batch_stops_at_the_first_rejected_clip(self):
+        result = speaker_verification.enroll_voice_batch([b"known", b"noise", b"new"], "r", "ana")
+        self.assertEqual((result["reason"], result["index"]), ("silence", 1))
+        self.assertEqual(self.decoded, [])
+        self.assertEqual(self.stored, [])
+
+
+class UploadErrorTests(SimpleTestCase):
+    def test_malformed_multipart_body_is_a_bad_request(self):
+        for handler in (views._handle_enroll, views._handle_enroll_batch):
+            request = RequestFactory().post("/api/voice/enroll", data=b"garbage", content_type="multipart/form-data")
+            payload, status_code = handler(request)
+            self.assertEqual(status_code, 400)
+            self.assertFalse(payload["success"])
+            self.assertIn("Could not read the upload", payload["message"])
+
+
+class VerifyTests(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.voice = rng.standard_normal(16).astype(np.float32)
+        self.store = VoiceprintStore(":memory:")
+        baselines = np.stack([self.voice + 0.1 * rng.standard_normal(16) for _ in range(3)])
+        self.store.set_baselines("r_ana", "r", "ana", baselines / np.linalg.norm(baselines, axis=1, keepdims=True))
+        patch = mock.patch.object(speaker_verification, "get_store", return_value=self.store)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_one_read_and_one_write_per_verification(self):
+        with mock.patch.object(self.store, "get_stats", wraps=self.store.get_stats) as get_stats, \
+                mock.patch.object(self.store, "update_stats", wraps=self.store.update_stats) as update_stats:
+            first = speaker_verification._verify("r", "ana", lambda info: -self.voice)
+            second = speaker_verification._verify("r", "ana", lambda info: self.voice)
+        self.assertEqual(get_stats.call_count, 0)
+        self.assertEqual(update_stats.call_count, 2)
+        self.assertEqual(first["status"], "suspicious")
+        self.assertEqual(second["status"], "high_confidence")
+
+        stats = self.store.get_stats("r_ana")
+        self.assertEqual(stats.n, 2)
+        # The baseline profile is measured on first use and stored with the score
+        self.assertAlmostEqual(stats.baseline_mean, first["baseline_quality"], places=5)
+        self.assertEqual(second["baseline_quality"], first["baseline_quality"])
+
+    def test_unknown_user(self):
+        result = speaker_verification._verify("r", "bo", lambda info: self.voice)
+        self.assertEqual(result, {"success": False, "message": "No baseline found.", "percentage": 0})
@@ -0,0 +1,169 @@
+"""
+Bounded ingestion of voice uploads.
+
+Uploads are never read whole into memory. Each multipart file is buffered
+only up to VOICE_MAX_FILE_BYTES, handed to the view's callback as soon as
+its last chunk arrives (batch enrollment decodes it, unless its embedding
+is cached, and keeps only the samples), then dropped. Peak memory per request is therefore one file plus
+the decoded samples, which VOICE_MAX_REQUEST_SECONDS bounds, whatever the
+size of the upload.
+
+Limits are enforced as early as the data allows:
+
+    VOICE_MAX_REQUEST_BYTES    – Content-Length checked by UploadLimitMiddleware before
+                                 the body is received; streamed bodies are cut off
+    VOICE_MAX_FILE_BYTES       – per file, while its chunks arrive
+    VOICE_MAX_FILES            – files per request
+    VOICE_MAX_REQUEST_SECONDS  – decoded audio per request (batch enrollment)
+
+Per-clip duration (VOICE_MAX_CLIP_SECONDS) is enforced by the decoder.
+"""
+
+import json, os
+
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http.multipartparser import MultiPartParserError
+
+MAX_REQUEST_BYTES = int(os.environ.get("VOICE_MAX_REQUEST_BYTES", str(40 * 2**20)))
+MAX_FILE_BYTES = int(os.environ.get("VOICE_MAX_FILE_BYTES", str(8 * 2**20)))
+MAX_FILES = int(os.environ.get("VOICE_MAX_FILES", "10"))
+MAX_REQUEST_SECONDS = float(os.environ.get("VOICE_MAX_REQUEST_SECONDS", "120"))
+
+VOICE_API_PREFIX = "/video-call/api/voice/"
+
+
+class UploadRejected(Exception):
+    """Upload over one of the limits; answered with 413."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+    def as_dict(self) -> dict:
+        return {"success": False, "message": str(self), "reason": self.reason}
+
+
+def _mb(size: int) -> str:
+    return f"{size / 2**20:.3g} MB"
+
+
+def request_too_large() -> UploadRejected:
+    return UploadRejected(f"Upload exceeds {_mb(MAX_REQUEST_BYTES)}", "request_too_large")
+
+
+class ClipUploadHandler(FileUploadHandler):
+    """
+    Multipart upload handler that buffers one file at a time and calls
+    `on_file(field_name, data)` when it is complete. Nothing is added to
+    request.FILES. `on_file` may return False or raise to stop the upload;
+    the reason is kept in `error`.
+    """
+
+    def __init__(self, request, on_file, max_files: int = MAX_FILES):
+        super().__init__(request)
+        self.on_file = on_file
+        self.max_files = max_files
+        self.files = 0
+        self.received = 0
+        self.error = None
+        self._chunks = None
+        self._size = 0
+
+    def _stop(self, error):
+        self.error = error
+        self._chunks = None
+        raise StopUpload(connection_reset=False)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.files += 1
+        if self.files > self.max_files:
+            self._stop(UploadRejected(f"At most {self.max_files} audio files per request", "too_many_files"))
+        self._chunks, self._size = [], 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        self._size += len(raw_data)
+        if self._size > MAX_FILE_BYTES:
+            self._stop(UploadRejected(f"Audio file exceeds {_mb(MAX_FILE_BYTES)}", "file_too_large"))
+        if self.received > MAX_REQUEST_BYTES:
+            self._stop(request_too_large())
+        self._chunks.append(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        data, self._chunks = b"".join(self._chunks), None
+        try:
+            keep_going = self.on_file(self.field_name, data)
+        except Exception as exc:
+            self._stop(exc)
+        if keep_going is False:
+            self._stop(None)
+        return None
+
+
+def ingest(request, on_file, max_files: int = MAX_FILES):
+    """
+    Parse the multipart body of `request`, feeding each file to `on_file`
+    as it completes. Returns the exception that stopped the upload (a
+    malformed body included), if any.
+    """
+    try:
+        length = int(request.META.get("CONTENT_LENGTH") or 0)
+    except ValueError:
+        length = 0
+    if length > MAX_REQUEST_BYTES:
+        return request_too_large()
+    handler = ClipUploadHandler(request, on_file, max_files)
+    request.upload_handlers = [handler]
+    try:
+        request.POST  # runs the parser; on_file is called from inside it
+    except MultiPartParserError as exc:
+        return handler.error or exc
+    return handler.error
+
+
+# -----------------------------------------------------------
+# ASGI
+# -----------------------------------------------------------
+async def _reject(send):
+    body = json.dumps(request_too_large().as_dict()).encode()
+    await send({"type": "http.response.start", "status": 413,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+class UploadLimitMiddleware:
+    """
+    Refuses voice API requests whose body is over MAX_REQUEST_BYTES before
+    Django receives (and spools) it: 413 straight from the Content-Length
+    header, or as soon as a body without one grows past the limit (Django
+    then sees a disconnect and drops the request).
+    """
+
+    def __init__(self, app, prefix: str = VOICE_API_PREFIX):
+        self.app = app
+        self.prefix = prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.prefix):
+            return await self.app(scope, receive, send)
+
+        length = dict(scope.get("headers") or []).get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > MAX_REQUEST_BYTES:
+            return await _reject(send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_REQUEST_BYTES:
+                    await _reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        return await self.app(scope, limited_receive, send)
@@ -1,14 +1,19 @@
 from django.urls import re_path as url, path
-from .views import RedirectToAngular, voice_enroll, voice_enroll_batch, voice_verify
+from .views import (
+    RedirectToAngular, voice_enroll_async, voice_enroll_batch_async, voice_identify_async, voice_ready,
+    voice_verify_async,
+)
 from django.views.static import serve
 from django.conf import settings
 from django.conf.urls.static import static
 
 urlpatterns = [
     # Voice API endpoints
-    path('api/voice/enroll', voice_enroll, name='voice-enroll'),
-    path('api/voice/enroll-batch', voice_enroll_batch, name='voice-enroll-batch'),
-    path('api/voice/verify', voice_verify, name='voice-verify'),
+    path('api/voice/enroll', voice_enroll_async, name='voice-enroll'),
+    path('api/voice/enroll-batch', voice_enroll_batch_async, name='voice-enroll-batch'),
+    path('api/voice/verify', voice_verify_async, name='voice-verify'),
+    path('api/voice/identify', voice_identify_async, name='voice-identify'),
+    path('api/voice/ready', voice_ready, name='voice-ready'),
     
     # Angular app (catch-all, must be last)
     url(r'', view=RedirectToAngular.as_view(), name='ang-app')
@@ -0,0 +1,111 @@
+"""
+Per-user verification statistics with O(1) updates.
+
+Each user keeps the last HISTORY blended scores in a float32 ring buffer,
+with running sums over the last MEAN_WINDOW (`mean`) and RECENT_WINDOW
+(`recent_mean`, used by the adaptive threshold) scores, so recording a
+verification never re-slices or re-averages the history. Stats are stored
+in the voiceprint row as a fixed-size binary record (255 bytes).
+"""
+
+import math, struct
+from array import array
+
+HISTORY = 50
+MEAN_WINDOW = 10
+RECENT_WINDOW = 5
+
+_VERSION = 1
+# version, capacity, samples recorded, then the float fields in __slots__ order
+_HEADER = struct.Struct("<BHI6d")
+_NONE = float("nan")
+
+
+def _opt(value: float) -> float | None:
+    return None if math.isnan(value) else value
+
+
+class VerificationStats:
+    __slots__ = ("scores", "head", "n", "sum_mean", "sum_recent",
+                 "last_score", "best_score", "best_relative", "baseline_mean")
+
+    def __init__(self, capacity: int = HISTORY):
+        self.scores = array("f", bytes(4 * max(capacity, MEAN_WINDOW)))
+        self.head = 0           # next slot to write
+        self.n = 0              # scores recorded so far (may exceed capacity)
+        self.sum_mean = 0.0     # sum of the last MEAN_WINDOW scores
+        self.sum_recent = 0.0   # sum of the last RECENT_WINDOW scores
+        self.last_score = None
+        self.best_score = None  # max similarity against the baselines, last verification
+        self.best_relative = 0.0
+        self.baseline_mean = None
+
+    # ---- updates ----
+    def _push(self, score: float):
+        scores, cap, head = self.scores, len(self.scores), self.head
+        # Scores leaving each window are still in the ring (capacity >= MEAN_WINDOW)
+        self.sum_mean += score - (scores[(head - MEAN_WINDOW) % cap] if self.n >= MEAN_WINDOW else 0.0)
+        self.sum_recent += score - (scores[(head - RECENT_WINDOW) % cap] if self.n >= RECENT_WINDOW else 0.0)
+        scores[head] = score
+        self.head = (head + 1) % cap
+        self.n += 1
+        if self.head == 0:
+            self._resum()  # once per lap, so float error never accumulates
+
+    def _resum(self):
+        recent = self.samples()
+        self.sum_mean = float(sum(recent[-MEAN_WINDOW:]))
+        self.sum_recent = float(sum(recent[-RECENT_WINDOW:]))
+
+    def record(self, score: float, max_score: float, relative: float):
+        """Add one verification result."""
+        self._push(score)
+        self.last_score = score
+        self.best_score = max_score
+        self.best_relative = max(relative, self.best_relative)
+
+    # ---- reads ----
+    @property
+    def mean(self) -> float:
+        """Mean of the last MEAN_WINDOW scores (0.0 before any)."""
+        return self.sum_mean / min(self.n, MEAN_WINDOW) if self.n else 0.0
+
+    @property
+    def recent_mean(self) -> float | None:
+        """Mean of the last RECENT_WINDOW scores, None before any."""
+        return self.sum_recent / min(self.n, RECENT_WINDOW) if self.n else None
+
+    def samples(self) -> list:
+        """Stored scores, oldest first."""
+        if self.n < len(self.scores):
+            return self.scores[:self.n].tolist()
+        return (self.scores[self.head:] + self.scores[:self.head]).tolist()
+
+    # ---- storage ----
+    def to_bytes(self) -> bytes:
+        floats = (self.sum_mean, self.sum_recent, self.last_score, self.best_score,
+                  self.best_relative, self.baseline_mean)
+        header = _HEADER.pack(_VERSION, len(self.scores), self.n,
+                              *(_NONE if v is None else v for v in floats))
+        return header + self.scores.tobytes()
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "VerificationStats":
+        version, capacity, n, *floats = _HEADER.unpack_from(blob)
+        if version != _VERSION:
+            raise ValueError(f"unknown verification stats version {version}")
+        stats = cls.__new__(cls)
+        stats.scores = array("f")
+        stats.scores.frombytes(blob[_HEADER.size:_HEADER.size + 4 * capacity])
+        stats.n = n
+        stats.head = n % capacity
+        stats.sum_mean, stats.sum_recent = floats[0], floats[1]
+        stats.last_score, stats.best_score = _opt(floats[2]), _opt(floats[3])
+        stats.best_relative = _opt(floats[4]) or 0.0
+        stats.baseline_mean = _opt(floats[5])
+        return stats
+
+    @classmethod
+    def load(cls, value: bytes | None) -> "VerificationStats | None":
+        """Decode the voiceprint row's stats column."""
+        return None if value is None else cls.from_bytes(value)
@@ -1,13 +1,21 @@
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.views import View
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
 from rest_framework import status
-from .speaker_verification import enroll_voice, enroll_voice_batch, verify_voice
+from .inference_executor import ExecutorSaturated, get_executor
+from .speaker_verification import BatchEnrollment, enroll_voice, identify_voice, readiness, verify_voice
+from .uploads import MAX_REQUEST_SECONDS, UploadRejected, ingest
+from videocall_project import metrics
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+VOICE_REQUESTS = metrics.counter("voice_requests_total", "Voice API requests by endpoint and HTTP status",
+                                 ["endpoint", "status"])
+VOICE_REQUEST_SECONDS = metrics.histogram("voice_request_seconds", "Voice API latency, queueing included",
+                                          ["endpoint"])
+
 
 class RedirectToAngular(View):
 
@@ -15,112 +23,207 @@ class RedirectToAngular(View):
         return render(request, 'index.html')
 
 
-@api_view(['POST'])
-def voice_enroll(request):
+def voice_ready(request):
+    """Readiness probe: 200 once the voice models are warmed up, 503 before."""
+    state = readiness()
+    return JsonResponse(state, status=status.HTTP_200_OK if state["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+# -----------------------------------------------------------
+# Request handlers, run on the voice executor by the views below.
+# Each returns (payload, http_status).
+# -----------------------------------------------------------
+def _upload_error(error):
+    """(payload, http_status) for the exception that stopped an upload."""
+    if isinstance(error, UploadRejected):
+        return error.as_dict(), status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    return {"success": False, "message": f"Could not read the upload: {error}"}, status.HTTP_400_BAD_REQUEST
+
+
+def _read_audio(request):
     """
-    API endpoint for voice enrollment
-    Accepts audio file and user info, extracts and stores embedding
+    Parse the upload through the bounded handler and return the 'audio'
+    file's bytes, or an (payload, http_status) error.
     """
+    clips = {}
+
+    def on_file(field, data):
+        if field == 'audio':
+            clips['audio'] = data
+
+    error = ingest(request, on_file, max_files=1)
+    if error is not None:
+        return None, _upload_error(error)
+    if not clips.get('audio'):
+        return None, ({"success": False, "message": "No audio file provided"}, status.HTTP_400_BAD_REQUEST)
+    return clips['audio'], None
+
+
+def _handle_enroll(request):
     try:
-        # Get audio file from request
-        audio_file = request.FILES.get('audio')
-        if not audio_file:
-            return Response(
-                {"success": False, "message": "No audio file provided"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        # Get audio bytes from request
+        audio_bytes, error = _read_audio(request)
+        if error:
+            return error
+
         # Get user info
-        room = request.data.get('room', 'default')
-        username = request.data.get('username', 'guest')
-        
-        # Read audio bytes
-        audio_bytes = audio_file.read()
-        
+        room = request.POST.get('room', 'default')
+        username = request.POST.get('username', 'guest')
+
         # Enroll voice
         result = enroll_voice(audio_bytes, room, username)
-        
+
         if result['success']:
-            return Response(result, status=status.HTTP_200_OK)
+            return result, status.HTTP_200_OK
+        elif 'reason' in result:
+            return result, status.HTTP_422_UNPROCESSABLE_ENTITY
         else:
-            return Response(result, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
+            return result, status.HTTP_500_INTERNAL_SERVER_ERROR
+
     except Exception as e:
         logger.error(f"Voice enrollment error: {e}")
-        return Response(
-            {"success": False, "message": f"Server error: {str(e)}"},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        return {"success": False, "message": f"Server error: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
 
 
-@api_view(['POST'])
-def voice_enroll_batch(request):
-    """
-    API endpoint for batched voice enrollment.
-    Accepts multiple audio files, aggregates embeddings, and stores baseline once.
-    """
+def _handle_enroll_batch(request):
     try:
-        audio_files = request.FILES.getlist('files')
-        if not audio_files:
-            return Response(
-                {"success": False, "message": "No audio samples provided"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        room = request.data.get('room', 'default')
-        username = request.data.get('username', 'guest')
-
-        audio_payloads = [f.read() for f in audio_files if f]
-        if not audio_payloads:
-            return Response(
-                {"success": False, "message": "Unable to read audio samples"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        result = enroll_voice_batch(audio_payloads, room, username)
-        status_code = status.HTTP_200_OK if result.get('success') else status.HTTP_500_INTERNAL_SERVER_ERROR
-        return Response(result, status=status_code)
+        # Each uncached file is decoded and gated as soon as it has arrived, while the rest of the
+        # body is parsed; finish() then embeds them all in one batch
+        batch = BatchEnrollment()
+
+        def on_file(field, data):
+            if field != 'files':
+                return True
+            if not batch.add(data):
+                return False
+            if batch.seconds > MAX_REQUEST_SECONDS:
+                raise UploadRejected(f"More than {MAX_REQUEST_SECONDS:g}s of audio in one request",
+                                     "request_too_long")
+            return True
+
+        error = ingest(request, on_file)
+        if error is not None:
+            return _upload_error(error)
+        if batch.failure is None and not batch.embeddings:
+            return {"success": False, "message": "No audio samples provided"}, status.HTTP_400_BAD_REQUEST
+
+        room = request.POST.get('room', 'default')
+        username = request.POST.get('username', 'guest')
+
+        result = batch.finish(room, username)
+        if result.get('success'):
+            status_code = status.HTTP_200_OK
+        elif 'reason' in result:
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+        else:
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+        return result, status_code
     except Exception as exc:
         logger.error(f"Voice enrollment batch error: {exc}")
-        return Response(
-            {"success": False, "message": f"Server error: {str(exc)}"},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        return {"success": False, "message": f"Server error: {str(exc)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
 
 
-@api_view(['POST'])
-def voice_verify(request):
-    """
-    API endpoint for voice verification
-    Accepts audio file and user info, compares with stored baseline
-    """
+def _handle_verify(request):
     try:
-        # Get audio file from request
-        audio_file = request.FILES.get('audio')
-        if not audio_file:
-            return Response(
-                {"success": False, "message": "No audio file provided"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
+        # Get audio bytes from request
+        audio_bytes, error = _read_audio(request)
+        if error:
+            return error
+
         # Get user info
-        room = request.data.get('room', 'default')
-        username = request.data.get('username', 'guest')
-        
-        # Read audio bytes
-        audio_bytes = audio_file.read()
-        
+        room = request.POST.get('room', 'default')
+        username = request.POST.get('username', 'guest')
+
         # Verify voice
         result = verify_voice(audio_bytes, room, username)
-        
+
         if result['success']:
-            return Response(result, status=status.HTTP_200_OK)
+            return result, status.HTTP_200_OK
+        elif 'reason' in result:
+            return result, status.HTTP_422_UNPROCESSABLE_ENTITY
         else:
-            return Response(result, status=status.HTTP_400_BAD_REQUEST)
-            
+            return result, status.HTTP_400_BAD_REQUEST
+
     except Exception as e:
         logger.error(f"Voice verification error: {e}")
-        return Response(
-            {"success": False, "message": f"Server error: {str(e)}"},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        return {"success": False, "message": f"Server error: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+def _handle_identify(request):
+    try:
+        audio_bytes, error = _read_audio(request)
+        if error:
+            return error
+
+        # `all_rooms=1` searches every enrolled voice instead of one room
+        all_rooms = request.POST.get('all_rooms', '').lower() in ('1', 'true', 'yes')
+        room = None if all_rooms else request.POST.get('room', 'default')
+        try:
+            top_k = int(request.POST.get('top_k', 3))
+        except ValueError:
+            return {"success": False, "message": "top_k must be an integer"}, status.HTTP_400_BAD_REQUEST
+
+        result = identify_voice(audio_bytes, room, top_k)
+        if result['success']:
+            status_code = status.HTTP_200_OK
+        elif 'reason' in result:
+            status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+        else:
+            status_code = status.HTTP_400_BAD_REQUEST
+        return result, status_code
+    except Exception as e:
+        logger.error(f"Voice identification error: {e}")
+        return {"success": False, "message": f"Server error: {str(e)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
+# -----------------------------------------------------------
+# Async views (Daphne): the work runs on the bounded voice executor
+# -----------------------------------------------------------
+async def _run_on_executor(request, handler):
+    if request.method != 'POST':
+        return JsonResponse({"detail": f'Method "{request.method}" not allowed.'},
+                            status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    endpoint = handler.__name__.removeprefix("_handle_")
+    started = time.perf_counter()
+    try:
+        payload, status_code = await get_executor().run(handler, request)
+    except ExecutorSaturated as exc:
+        VOICE_REQUESTS.labels(endpoint, status.HTTP_503_SERVICE_UNAVAILABLE).inc()
+        response = JsonResponse({"success": False, "message": "Voice service busy, retry later"},
+                                status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = str(exc.retry_after)
+        return response
+    VOICE_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+    VOICE_REQUESTS.labels(endpoint, status_code).inc()
+    return JsonResponse(payload, status=status_code)
+
+
+async def voice_enroll_async(request):
+    """
+    Voice enrollment: takes an 'audio' file plus room / username, extracts
+    its embedding and adds it to the user's baseline.
+    """
+    return await _run_on_executor(request, _handle_enroll)
+
+
+async def voice_enroll_batch_async(request):
+    """
+    Batched enrollment: takes several 'files', embeds them together and
+    replaces the user's baseline once.
+    """
+    return await _run_on_executor(request, _handle_enroll_batch)
+
+
+async def voice_verify_async(request):
+    """Voice verification: compares an 'audio' file with the user's stored baseline."""
+    return await _run_on_executor(request, _handle_verify)
+
+
+async def voice_identify_async(request):
+    """1:N identification: ranks an 'audio' file against every enrolled voice in the room."""
+    return await _run_on_executor(request, _handle_identify)
+
+
+# The voice API is called without a CSRF token (csrf_exempt only wraps async views on Django 5+)
+for _view in (voice_enroll_async, voice_enroll_batch_async, voice_verify_async, voice_identify_async):
+    _view.csrf_exempt = True
@@ -0,0 +1,81 @@
+"""
+Streaming voice verification for live PCM sent over the signaling WebSocket.
+
+The client streams 16 kHz mono s16le PCM. Audio is buffered cheaply on the
+event loop (push), and whole VAD blocks are handled in a worker thread
+(process): only the new block goes through Silero, its speech is appended to
+a rolling window of TARGET_SPEECH_SECONDS, and once VOICE_STREAM_HOP_SECONDS
+of fresh speech has accumulated the window is verified against the baseline.
+
+    VOICE_STREAM_HOP_SECONDS    – new speech between two scores
+    VOICE_STREAM_BLOCK_SECONDS  – audio handed to VAD at a time
+    VOICE_STREAM_MAX_PENDING    – seconds of unprocessed audio kept under load
+"""
+
+import os, threading, logging
+
+import numpy as np
+
+from .speaker_verification import SAMPLE_RATE, TARGET_SPEECH_SECONDS, speech_segments, verify_waveform
+
+logger = logging.getLogger(__name__)
+
+STREAM_HOP_SECONDS = float(os.environ.get("VOICE_STREAM_HOP_SECONDS", "3.0"))
+STREAM_BLOCK_SECONDS = float(os.environ.get("VOICE_STREAM_BLOCK_SECONDS", "1.0"))
+STREAM_MAX_PENDING = float(os.environ.get("VOICE_STREAM_MAX_PENDING", "10.0"))
+
+
+class StreamingVerifier:
+    def __init__(self, room: str, user: str, sample_rate: int = SAMPLE_RATE,
+                 hop_seconds: float = STREAM_HOP_SECONDS, block_seconds: float = STREAM_BLOCK_SECONDS,
+                 max_pending_seconds: float = STREAM_MAX_PENDING):
+        self.room = room
+        self.user = user
+        self.sample_rate = sample_rate
+        self.window_len = int(TARGET_SPEECH_SECONDS * sample_rate)
+        self.hop_len = int(hop_seconds * sample_rate)
+        self.block_bytes = int(block_seconds * sample_rate) * 2
+        self.max_pending_bytes = int(max_pending_seconds * sample_rate) * 2
+        self.dropped_bytes = 0
+        self._pending = bytearray()
+        self._lock = threading.Lock()
+        self._speech = np.zeros(0, dtype=np.float32)
+        self._new_speech = 0
+
+    def push(self, pcm: bytes) -> bool:
+        """Buffer raw PCM (event loop side); True once a full VAD block is waiting."""
+        if len(pcm) & 1:
+            # Frames carry whole s16 samples; a torn one would shift every later sample
+            self.dropped_bytes += len(pcm)
+            return False
+        with self._lock:
+            self._pending += pcm
+            overflow = len(self._pending) - self.max_pending_bytes
+            if overflow > 0:
+                overflow += overflow & 1  # keep sample alignment
+                del self._pending[:overflow]
+                self.dropped_bytes += overflow
+            return len(self._pending) >= self.block_bytes
+
+    def _next_block(self) -> np.ndarray | None:
+        with self._lock:
+            if len(self._pending) < self.block_bytes:
+                return None
+            block = bytes(self._pending[: self.block_bytes])
+            del self._pending[: self.block_bytes]
+        return np.frombuffer(block, dtype="<i2").astype(np.float32) / 32768.0
+
+    def process(self) -> dict | None:
+        """VAD every waiting block; returns a verify result when a score is due (worker side)."""
+        while (block := self._next_block()) is not None:
+            segments = speech_segments(block, self.sample_rate)
+            if not segments:
+                continue
+            speech = np.concatenate([block[start:end] for start, end in segments])
+            self._speech = np.concatenate([self._speech, speech])[-self.window_len:]
+            self._new_speech += speech.shape[0]
+
+        if len(self._speech) < self.window_len or self._new_speech < self.hop_len:
+            return None
+        self._new_speech = 0
+        return verify_waveform(self._speech.copy(), self.room, self.user)
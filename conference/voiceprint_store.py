@@ -0,0 +1,205 @@
+"""
+Durable voiceprint store shared by every worker process.
+
+Each enrolled user is one SQLite row holding a contiguous (n, dim) float32
+matrix of baseline embeddings as a BLOB, plus its verification stats (a
+fixed-size VerificationStats record, see verification_stats). The
+database runs in WAL mode with `mmap_size` set, so readers in all Daphne
+workers page the same file in through the OS cache instead of keeping their
+own copies, and every add / trim happens inside a single write transaction.
+
+    VOICE_STORE_PATH       – database file (":memory:" for a throwaway store)
+    VOICE_STORE_MMAP_MB    – SQLite mmap window per connection
+"""
+
+import os, sqlite3, threading, time, itertools
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from .verification_stats import VerificationStats
+
+STORE_PATH = os.environ.get(
+    "VOICE_STORE_PATH", str(Path(__file__).resolve().parent.parent / "voiceprints.sqlite3")
+)
+STORE_MMAP_MB = int(os.environ.get("VOICE_STORE_MMAP_MB", "256"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS voiceprints (
+    key         TEXT PRIMARY KEY,
+    room        TEXT NOT NULL,
+    user        TEXT NOT NULL,
+    dim         INTEGER NOT NULL,
+    count       INTEGER NOT NULL,
+    embeddings  BLOB NOT NULL,
+    stats       BLOB,
+    updated     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS voiceprints_room ON voiceprints (room);
+"""
+
+_memory_ids = itertools.count()
+
+
+def _to_blob(matrix: np.ndarray) -> bytes:
+    return np.ascontiguousarray(matrix, dtype=np.float32).tobytes()
+
+
+def _from_blob(blob: bytes, count: int, dim: int) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32).reshape(count, dim)
+
+
+class VoiceprintStore:
+    def __init__(self, path: str = STORE_PATH, mmap_mb: int = STORE_MMAP_MB):
+        if path == ":memory:":
+            self._uri = f"file:voiceprints-{os.getpid()}-{next(_memory_ids)}?mode=memory&cache=shared"
+        else:
+            self._uri = Path(path).resolve().as_uri()
+        self.mmap_bytes = mmap_mb * 1024 * 1024
+        self._local = threading.local()
+        # In-memory databases vanish with their last connection.
+        self._keepalive = self._conn()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self._uri, uri=True, isolation_level=None, timeout=10,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # ---- baselines ----
+    def get_baselines(self, key: str) -> np.ndarray | None:
+        row = self._conn().execute(
+            "SELECT embeddings, count, dim FROM voiceprints WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or not row[1]:
+            return None
+        return _from_blob(*row)
+
+    def set_baselines(self, key: str, room: str, user: str, matrix: np.ndarray,
+                      reset_stats: bool = False) -> np.ndarray:
+        """Replace a user's baselines atomically."""
+        matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+        with self._write() as conn:
+            conn.execute(
+                """
+                INSERT INTO voiceprints (key, room, user, dim, count, embeddings, stats, updated)
+                VALUES (?, ?, ?, ?, ?, ?, NULL, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    dim = excluded.dim, count = excluded.count,
+                    embeddings = excluded.embeddings, updated = excluded.updated,
+                    stats = CASE WHEN ? THEN NULL ELSE stats END
+                """,
+                (key, room, user, matrix.shape[1], matrix.shape[0], _to_blob(matrix),
+                 time.time(), int(reset_stats)),
+            )
+        return matrix
+
+    def append_baseline(self, key: str, room: str, user: str, embedding: np.ndarray,
+                        max_clips: int) -> np.ndarray:
+        """Add one embedding and keep only the newest `max_clips`, in one transaction."""
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        with self._write() as conn:
+            row = conn.execute(
+                "SELECT embeddings, count, dim FROM voiceprints WHERE key = ?", (key,)
+            ).fetchone()
+            if row and row[1] and row[2] == embedding.shape[1]:
+                matrix = np.concatenate([_from_blob(*row), embedding])[-max_clips:]
+            else:
+                matrix = embedding
+            conn.execute(
+                """
+                INSERT INTO voiceprints (key, room, user, dim, count, embeddings, updated)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    dim = excluded.dim, count = excluded.count,
+                    embeddings = excluded.embeddings, updated = excluded.updated
+                """,
+                (key, room, user, matrix.shape[1], matrix.shape[0], _to_blob(matrix), time.time()),
+            )
+        return matrix
+
+    def room_version(self, room: str | None = None) -> tuple:
+        """Cheap change marker for a room (or the whole store) used to invalidate indexes."""
+        if room is None:
+            sql, args = "SELECT COUNT(*), MAX(updated) FROM voiceprints", ()
+        else:
+            sql, args = "SELECT COUNT(*), MAX(updated) FROM voiceprints WHERE room = ?", (room,)
+        return tuple(self._conn().execute(sql, args).fetchone())
+
+    def iter_voiceprints(self, room: str | None = None):
+        """Yield (key, room, user, baselines) for one room, or every room when None."""
+        sql = "SELECT key, room, user, embeddings, count, dim FROM voiceprints WHERE count > 0"
+        args = ()
+        if room is not None:
+            sql += " AND room = ?"
+            args = (room,)
+        for key, room_name, user, blob, count, dim in self._conn().execute(sql, args):
+            yield key, room_name, user, _from_blob(blob, count, dim)
+
+    # ---- stats ----
+    def get_profile(self, key: str) -> tuple[np.ndarray | None, VerificationStats | None]:
+        """Baselines and stats in one read (verification needs both)."""
+        row = self._conn().execute(
+            "SELECT embeddings, count, dim, stats FROM voiceprints WHERE key = ?", (key,)
+        ).fetchone()
+        if not row or not row[1]:
+            return None, None
+        return _from_blob(*row[:3]), VerificationStats.load(row[3])
+
+    def get_stats(self, key: str) -> VerificationStats | None:
+        row = self._conn().execute("SELECT stats FROM voiceprints WHERE key = ?", (key,)).fetchone()
+        return VerificationStats.load(row[0]) if row else None
+
+    def update_stats(self, key: str, mutate: Callable[[VerificationStats], None]) -> VerificationStats | None:
+        """Read-modify-write a user's stats atomically; returns the stored stats."""
+        with self._write() as conn:
+            row = conn.execute("SELECT stats FROM voiceprints WHERE key = ?", (key,)).fetchone()
+            if not row:
+                return None
+            stats = VerificationStats.load(row[0]) or VerificationStats()
+            mutate(stats)
+            conn.execute("UPDATE voiceprints SET stats = ? WHERE key = ?", (stats.to_bytes(), key))
+        return stats
+
+    def clear_stats(self, key: str):
+        with self._write() as conn:
+            conn.execute("UPDATE voiceprints SET stats = NULL WHERE key = ?", (key,))
+
+    def delete(self, key: str):
+        with self._write() as conn:
+            conn.execute("DELETE FROM voiceprints WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM voiceprints").fetchone()[0]
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_store() -> VoiceprintStore:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = VoiceprintStore()
+    return _STORE
@@ -0,0 +1,141 @@
+# videocall/coalescer.py
+"""
+Coalescing of high-frequency participant status (gaze / voice).
+
+Clients report their gaze several times a second whether it changed or not,
+and every report used to be broadcast to the whole room: N senders times N
+recipients. Per room (and per Daphne process) a StatusCoalescer now:
+
+    - drops reports whose value equals the last one sent for that participant
+    - keeps only the newest value per participant within a tick
+    - flushes once per tick, one `gaze_updates` / `voice_updates` message
+      per kind holding every participant that changed
+
+Batches are a protocol change (clients must understand `gaze_updates` /
+`voice_updates`), so coalescing is opt-in: SIGNALING_STATUS_TICK_MS sets the
+tick, and the default 0 broadcasts every report as before. What happened to
+each report is counted in signaling_status_updates_total on /metrics.
+"""
+
+import asyncio
+import logging
+
+from videocall_project import metrics
+
+from . import wire
+
+logger = logging.getLogger(__name__)
+
+KINDS = {"gaze": "gaze_updates", "voice": "voice_updates"}
+
+_updates = metrics.counter(
+    "signaling_status_updates_total",
+    "Gaze / voice reports by outcome: sent in a tick, coalesced into a newer one, deduplicated, "
+    "or dropped as unencodable",
+    ["kind", "outcome"],
+)
+SENT = {kind: _updates.labels(kind, "sent") for kind in KINDS}
+COALESCED = {kind: _updates.labels(kind, "coalesced") for kind in KINDS}
+DEDUPLICATED = {kind: _updates.labels(kind, "deduplicated") for kind in KINDS}
+DROPPED = {kind: _updates.labels(kind, "dropped") for kind in KINDS}
+
+
+class StatusCoalescer:
+    def __init__(self, room: str, tick: float, flush):
+        """
+        `flush(message, frame)` is awaited with each batched message and its
+        STATUS_FRAME encoding for compact clients.
+        """
+        self.room = room
+        self.tick = tick
+        self._flush = flush
+        self._pending = {kind: {} for kind in KINDS}  # kind -> channel -> update
+        self._sent = {kind: {} for kind in KINDS}     # kind -> channel -> last value sent
+        self._task = None
+        self.members = 0
+
+    def offer(self, kind: str, channel: str, value, update: dict) -> bool:
+        """Queue `update` for the next tick; False when it was dropped as unchanged."""
+        pending = self._pending[kind]
+        if channel not in pending and self._sent[kind].get(channel) == value:
+            DEDUPLICATED[kind].inc()
+            return False
+        if channel in pending:
+            COALESCED[kind].inc()
+        pending[channel] = (value, update)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return True
+
+    def forget(self, channel: str | None = None):
+        """Re-send current values on the next report (a participant joined or left)."""
+        for sent in self._sent.values():
+            if channel is None:
+                sent.clear()
+            else:
+                sent.pop(channel, None)
+        if channel is not None:
+            for pending in self._pending.values():
+                pending.pop(channel, None)
+
+    async def _run(self):
+        while any(self._pending.values()):
+            await asyncio.sleep(self.tick)
+            await self.flush()
+
+    async def flush(self):
+        for kind, message_type in KINDS.items():
+            pending = self._pending[kind]
+            if not pending:
+                continue
+            self._pending[kind] = {}
+            # Encoded one by one: an update the wire format cannot carry is
+            # dropped on its own instead of taking the whole batch with it
+            updates, entries = {}, []
+            for channel, (value, update) in pending.items():
+                try:
+                    entries.append(wire.encode_entry(f"{kind}_update", update))
+                except wire.WireError as exc:
+                    logger.warning("Dropping %s update from %s in room %s: %s", kind, channel, self.room, exc)
+                    DROPPED[kind].inc()
+                    continue
+                updates[channel] = (value, update)
+            if not updates:
+                continue
+            message = {"type": message_type, "updates": [update for _, update in updates.values()]}
+            try:
+                await self._flush(message, wire.encode_batch(entries))
+            except Exception:
+                logger.exception("Flushing %s for room %s failed", message_type, self.room)
+                continue
+            # Only what reached the room suppresses later identical reports
+            sent = self._sent[kind]
+            for channel, (value, _) in updates.items():
+                sent[channel] = value
+            SENT[kind].inc(len(updates))
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+_COALESCERS = {}  # room group -> StatusCoalescer (this process)
+
+
+def acquire(room: str, tick: float, flush) -> StatusCoalescer:
+    coalescer = _COALESCERS.get(room)
+    if coalescer is None:
+        coalescer = _COALESCERS[room] = StatusCoalescer(room, tick, flush)
+    coalescer.members += 1
+    return coalescer
+
+
+def release(room: str, channel: str):
+    coalescer = _COALESCERS.get(room)
+    if coalescer is None:
+        return
+    coalescer.members -= 1
+    coalescer.forget(channel)
+    if coalescer.members <= 0:
+        coalescer.close()
+        del _COALESCERS[room]
@@ -1,30 +1,99 @@
 # videocall/consumers.py
+import asyncio
+import contextlib
 import json
+import logging
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from videocall_project import metrics
+
+from . import coalescer
+from .message_log import log_message
+from .room_state import MAX_NAME_LENGTH, get_room_state
+from .wire import AUDIO_FRAME, STATUS_FRAME, SUBPROTOCOL_MSGPACK, WireError, decode_status, encode_status
+
+logger = logging.getLogger(__name__)
+
+# Inbound types the consumer handles; anything else is counted as "other"
+MESSAGE_TYPES = (
+    "offer", "answer", "ice_candidate", "join", "name_update", "mic_toggle", "cam_toggle", "hand_toggle",
+    "resync", "chat", "bye", "gaze_status", "voice_status", "voice_stream_start", "voice_stream_stop",
+    "live_translation",
+)
+_messages = metrics.counter("signaling_messages_total", "WebSocket messages received, by type", ["type"])
+MESSAGE_COUNTERS = {t: _messages.labels(t) for t in MESSAGE_TYPES}
+OTHER_MESSAGES = _messages.labels("other")
+AUDIO_FRAMES = metrics.counter("signaling_audio_frames_total", "Binary voice stream frames received").labels()
+GROUP_SEND_SECONDS = metrics.histogram(
+    "signaling_group_send_seconds", "Time spent in channel_layer.group_send per broadcast", ["type"]
+)
+CONNECTIONS = metrics.gauge("signaling_participants", "WebSocket participants connected to this process").labels()
+
+# Status timestamps are client milliseconds; anything outside the range a JS
+# number holds exactly is not a timestamp (and may not fit the wire format)
+MAX_TIMESTAMP = 2 ** 53
+
+
+def group_event(message, sender_channel=None, skip_sender=False, compact=False):
+    """
+    Group event for `message`, encoded once here instead of once per
+    recipient: it carries the JSON text (and the STATUS_FRAME bytes for
+    compact clients), so handlers only filter and write.
+    """
+    event = {
+        "type": message["type"],
+        "sender_channel": sender_channel,
+        "skip_sender": skip_sender,
+        "text": json.dumps(message),
+    }
+    if compact:
+        try:
+            event["bytes"] = encode_status(message)
+        except WireError:
+            logger.warning("No compact encoding for %s; sending it as text", message["type"])
+    return event
 
 
-class SignalingConsumer(AsyncWebsocketConsumer):
-    # In-memory rooms (for demo/dev; replace with DB/Redis in production)
-    rooms = {}  # { room_name: { "participants": {chan_id: {...}}, "order": [] } }
+def _new_voice_stream(room, user):
+    # The first import loads torch and speechbrain: seconds of work, run in a thread
+    from conference.voice_stream import StreamingVerifier
+
+    return StreamingVerifier(room, user)
+
+
+def _status_fields(data):
+    """`user` and `ts` of a client status report, coerced to what the room is sent."""
+    ts = data.get("ts")
+    if isinstance(ts, bool) or not isinstance(ts, (int, float)) or not -MAX_TIMESTAMP <= ts <= MAX_TIMESTAMP:
+        ts = None
+    return {"user": str(data.get("user", "Guest"))[:MAX_NAME_LENGTH], "ts": ts}
 
-    def get_room(self):
-        if self.room_name not in self.rooms:
-            self.rooms[self.room_name] = {"participants": {}, "order": []}
-        return self.rooms[self.room_name]
+
+class SignalingConsumer(AsyncWebsocketConsumer):
+    # Participants / join order live in a pluggable backend (in-memory or
+    # Redis, see SIGNALING_ROOM_STATE) so rooms survive across Daphne workers.
+    room_state = None
+    # Connections per room in this process (signaling_rooms / _participants)
+    local_rooms = {}
 
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"signaling_{self.room_name}"
         self.channel_id = self.channel_name
+        if self.room_state is None:
+            type(self).room_state = get_room_state()
 
-        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
+        # Clients opting into compact status frames ask for the msgpack subprotocol
+        self.compact = SUBPROTOCOL_MSGPACK in self.scope.get("subprotocols", [])
 
-        room = self.get_room()
-        room["order"].append(self.channel_id)
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept(subprotocol=SUBPROTOCOL_MSGPACK if self.compact else None)
 
         # Add participant placeholder first
-        room["participants"][self.channel_id] = {
+        participant = {
             "channel": self.channel_id,
             "name": "Guest",   # will be replaced if client sends `join`
             "mic": "off",
@@ -34,7 +103,26 @@ class SignalingConsumer(AsyncWebsocketConsumer):
         }
 
         # Polite rule: first in room = polite = True; others = False
-        polite = True if room["order"][0] == self.channel_id else False
+        polite, version, swept = await self.room_state.join(self.room_name, self.channel_id, participant)
+        self.status_coalescer = None
+        tick = getattr(settings, "SIGNALING_STATUS_TICK_MS", 0) / 1000
+        if tick > 0:
+            layer, group = self.channel_layer, self.room_group_name
+
+            async def flush(message, frame):
+                started = time.perf_counter()
+                await layer.group_send(group, {**group_event(message), "bytes": frame})
+                GROUP_SEND_SECONDS.labels(message["type"]).observe(time.perf_counter() - started)
+
+            self.status_coalescer = coalescer.acquire(group, tick, flush)
+        self._left = False
+        self.local_rooms[self.room_name] = self.local_rooms.get(self.room_name, 0) + 1
+        CONNECTIONS.inc()
+        self.voice_stream = None
+        self._voice_task = None
+        self._heartbeat_task = None
+        if self.room_state.heartbeat:
+            self._heartbeat_task = asyncio.ensure_future(self._heartbeat(self.room_state.heartbeat))
 
         # Tell this client its ID and polite flag
         await self.send(text_data=json.dumps({
@@ -43,56 +131,62 @@ class SignalingConsumer(AsyncWebsocketConsumer):
             "polite": polite,
         }))
 
-        # Send snapshot of all participants (including self)
-        await self.send(text_data=json.dumps({
-            "type": "participants",
-            "participants": list(room["participants"].values())
-        }))
+        # Reconnecting clients pass ?since=<last room version> to get only the
+        # changes they missed; everyone else gets a snapshot of all participants
+        since = parse_qs(self.scope.get("query_string", b"").decode()).get("since")
+        await self.send_room_state(since[0] if since else None)
+
+        # Participants of a crashed worker, dropped from the room by our join
+        for channel, left_version in swept:
+            await self.broadcast({"type": "participant_left", "channel": channel, "v": left_version})
 
         # Notify others (they'll get real name after join)
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "participant_joined",
-                "participant": room["participants"][self.channel_id],
-                "sender_channel": self.channel_id,
-            }
-        )
+        await self.broadcast({"type": "participant_joined", "participant": participant, "v": version},
+                             skip_sender=True)
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
-
-        room = self.rooms.get(self.room_name)
-        if not room:
+        self.voice_stream = None
+        task, self._voice_task = getattr(self, "_voice_task", None), None
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+        # `bye` followed by the socket closing calls this twice
+        if getattr(self, "_left", True):
             return
-
-        if self.channel_id in room["participants"]:
-            room["participants"].pop(self.channel_id, None)
-        if self.channel_id in room.get("order", []):
-            room["order"].remove(self.channel_id)
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                "type": "participant_left",
-                "channel": self.channel_id,
-            }
-        )
-
-        if not room["participants"]:
-            self.rooms.pop(self.room_name, None)
+        self._left = True
+        CONNECTIONS.dec()
+        remaining = self.local_rooms.pop(self.room_name, 1) - 1
+        if remaining:
+            self.local_rooms[self.room_name] = remaining
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        if self.status_coalescer is not None:
+            coalescer.release(self.room_group_name, self.channel_id)
+        _, version = await self.room_state.leave(self.room_name, self.channel_id)
+
+        await self.broadcast({"type": "participant_left", "channel": self.channel_id, "v": version})
 
     async def receive(self, text_data=None, bytes_data=None):
+        # After `bye` the participant is gone; late state updates must not re-create it
+        if self._left:
+            return
+        if bytes_data is not None:
+            await self.receive_binary(bytes_data)
+            return
+
         try:
             data = json.loads(text_data)
         except Exception:
             return
-        
+        await self.handle_message(data)
+
+    async def handle_message(self, data):
         msg_type = data.get("type")
-        print(f"📩 Incoming WS message: type={msg_type}, from={self.channel_id}")
-        
-        if msg_type == "gaze_status":
-            print(f"🎯 GAZE_STATUS received: user={data.get('user')}, gaze={data.get('gaze')}")
+        MESSAGE_COUNTERS.get(msg_type, OTHER_MESSAGES).inc()
+        log_message(msg_type, self.room_name, self.channel_id, data)
 
         # Direct signaling
         if msg_type in ("offer", "answer", "ice_candidate"):
@@ -109,51 +203,26 @@ class SignalingConsumer(AsyncWebsocketConsumer):
 
         # 👇 New: join with name
         if msg_type == "join":
-            room = self.get_room()
-            part = room["participants"].get(self.channel_id, {})
-            part.update({
-                "name": data.get("name", "Guest"),
-            })
-            room["participants"][self.channel_id] = part
-
-            # Notify group of update
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "participant_updated",
-                    "participant": {**part, "channel": self.channel_id},
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.update_participant({"name": data.get("name", "Guest")})
             return
 
         # Participant state updates
         if msg_type in ("name_update", "mic_toggle", "cam_toggle", "hand_toggle"):
-            room = self.get_room()
-            part = room["participants"].get(self.channel_id, {})
-            part.update(data)
-            room["participants"][self.channel_id] = part
-
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "participant_updated",
-                    "participant": {**part, "channel": self.channel_id},
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.update_participant(data)
+            return
+
+        # Catch up after missed messages: deltas since a version, or a snapshot
+        if msg_type == "resync":
+            await self.send_room_state(data.get("since"))
             return
 
         # Chat
         if msg_type == "chat":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "chat_message",
-                    "message": {"by": data.get("by", "Guest"), "text": data.get("text", "")},
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.broadcast({
+                "type": "chat_message",
+                "message": {"by": data.get("by", "Guest"), "text": data.get("text", "")},
+                "sender_channel": self.channel_id,
+            }, skip_sender=True)
             return
 
         # Leave
@@ -161,98 +230,179 @@ class SignalingConsumer(AsyncWebsocketConsumer):
             await self.disconnect(1000)
 
         if msg_type == "gaze_status":
-            print("📡 Broadcasting gaze_update to group:", self.room_group_name)
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "gaze_update",
-                    "user": data.get("user", "Guest"),
-                    "gaze": data.get("gaze", "CENTER"),
-                    "ts": data.get("ts"),
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.report_status("gaze", {
+                "type": "gaze_update",
+                **_status_fields(data),
+                "gaze": str(data.get("gaze", "CENTER")),
+                "channel": self.channel_id,
+            })
             return
 
         if msg_type == "voice_status":
-            print(f"🎤 VOICE_STATUS received: user={data.get('user')}, voice={data.get('voice')}")
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "voice_update",
-                    "user": data.get("user", "Guest"),
-                    "voice": data.get("voice", "N/A"),
-                    "ts": data.get("ts"),
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.report_status("voice", {
+                "type": "voice_update",
+                **_status_fields(data),
+                "voice": str(data.get("voice", "N/A")),
+                "channel": self.channel_id,
+            })
+            return
+
+        # Live voice verification: PCM arrives as AUDIO_FRAME binary messages
+        if msg_type == "voice_stream_start":
+            loop = asyncio.get_running_loop()
+            try:
+                self.voice_stream = await loop.run_in_executor(
+                    None, _new_voice_stream, self.room_name, str(data.get("user", "Guest"))
+                )
+            except Exception:
+                logger.exception("Could not start streaming voice verification")
+            return
+
+        if msg_type == "voice_stream_stop":
+            self.voice_stream = None
             return
 
         if msg_type == "live_translation":
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    "type": "live_translation",
-                    "channel": data.get("channel") or self.channel_id,
-                    "translatedText": data.get("translatedText", ""),
-                    "originalText": data.get("originalText", ""),
-                    "sourceLanguage": data.get("sourceLanguage", ""),
-                    "targetLanguage": data.get("targetLanguage", ""),
-                    "timestamp": data.get("timestamp"),
-                    "sender_channel": self.channel_id,
-                }
-            )
+            await self.broadcast({
+                "type": "live_translation",
+                "channel": data.get("channel") or self.channel_id,
+                "translatedText": data.get("translatedText", ""),
+                "originalText": data.get("originalText", ""),
+                "sourceLanguage": data.get("sourceLanguage", ""),
+                "targetLanguage": data.get("targetLanguage", ""),
+                "timestamp": data.get("timestamp"),
+            }, skip_sender=True)
             return
 
-    # ==== Group event handlers ====
-    async def participant_joined(self, event):
-        if event.get("sender_channel") != self.channel_id:
-            await self.send(text_data=json.dumps({
-                "type": "participant_joined",
-                "participant": event["participant"],
-            }))
+    async def receive_binary(self, frame):
+        if not frame:
+            return
+        kind, payload = frame[0], frame[1:]
+        if kind == STATUS_FRAME:
+            try:
+                data = decode_status(payload)
+            except WireError:
+                return
+            await self.handle_message(data)
+            return
+        if kind == AUDIO_FRAME and self.voice_stream is not None:
+            AUDIO_FRAMES.inc()
+            ready = self.voice_stream.push(payload)
+            if ready and (self._voice_task is None or self._voice_task.done()):
+                self._voice_task = asyncio.ensure_future(self._score_voice_stream(self.voice_stream))
 
-    async def gaze_update(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "gaze_update",
-            "user": event["user"],
-            "gaze": event["gaze"],
-            "ts": event["ts"],
-            "channel": event["sender_channel"],
-        }))
+    async def _score_voice_stream(self, stream):
+        from conference.inference_executor import ExecutorSaturated, get_executor
 
-    async def voice_update(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "voice_update",
-            "user": event["user"],
-            "voice": event["voice"],
-            "ts": event["ts"],
-            "channel": event["sender_channel"],
-        }))
+        try:
+            result = await get_executor().run(stream.process)
+        except ExecutorSaturated:
+            return  # audio stays buffered; the next frame retries
+        except Exception:
+            logger.exception("Streaming voice verification failed")
+            return
+        if not result or not result.get("success") or stream is not self.voice_stream:
+            return
 
-    async def live_translation(self, event):
-        if event.get("sender_channel") == self.channel_id:
+        await self.broadcast({
+            "type": "voice_update",
+            "user": stream.user,
+            "voice": "Unmatch" if result["status"] == "suspicious" else "Match",
+            "ts": int(time.time() * 1000),
+            "channel": self.channel_id,
+            # Scores from streaming verification
+            "percentage": result["percentage"],
+            "status": result["status"],
+        }, compact=True)
+
+    # ==== Room state ====
+    async def _heartbeat(self, interval):
+        """Tell the room state we are alive, so our entry is not swept as stale."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.room_state.touch(self.room_name, self.channel_id)
+            except Exception:
+                logger.exception("Room state heartbeat failed for %s", self.room_name)
+
+    async def update_participant(self, fields):
+        """Store schema fields and tell the room only what actually changed."""
+        _, changed, version = await self.room_state.update(self.room_name, self.channel_id, fields)
+        if not changed:
             return
+        await self.broadcast({
+            "type": "participant_updated",
+            "participant": {**changed, "channel": self.channel_id},
+            "sender_channel": self.channel_id,
+            "v": version,
+        }, skip_sender=True)
+
+    async def send_room_state(self, since=None):
+        if since is not None:
+            try:
+                changes, version = await self.room_state.changes_since(self.room_name, int(since))
+            except (TypeError, ValueError):
+                changes = None
+            if changes is not None:
+                await self.send(text_data=json.dumps({
+                    "type": "participants_delta",
+                    "since": int(since),
+                    "v": version,
+                    "changes": changes,
+                }))
+                return
+
+        participants, version = await self.room_state.snapshot(self.room_name)
         await self.send(text_data=json.dumps({
-            "type": "live_translation",
-            "channel": event.get("channel") or event.get("sender_channel"),
-            "translatedText": event.get("translatedText", ""),
-            "originalText": event.get("originalText", ""),
-            "sourceLanguage": event.get("sourceLanguage", ""),
-            "targetLanguage": event.get("targetLanguage", ""),
-            "timestamp": event.get("timestamp"),
+            "type": "participants",
+            "participants": participants,
+            "v": version,
         }))
 
-    async def participant_left(self, event):
-        await self.send(text_data=json.dumps(event))
+    # ==== Broadcasts ====
+    async def broadcast(self, message, skip_sender=False, compact=False):
+        """Fan `message` out to the room (see group_event)."""
+        started = time.perf_counter()
+        await self.channel_layer.group_send(
+            self.room_group_name, group_event(message, self.channel_id, skip_sender, compact)
+        )
+        GROUP_SEND_SECONDS.labels(message["type"]).observe(time.perf_counter() - started)
+
+    async def report_status(self, kind, message):
+        """Gaze / voice report: coalesced into the room's next tick, or sent right away."""
+        if self.status_coalescer is None:
+            await self.broadcast(message, compact=True)
+            return
+        update = {k: v for k, v in message.items() if k != "type"}
+        self.status_coalescer.offer(kind, self.channel_id, message[kind], update)
 
-    async def participant_updated(self, event):
-        if event.get("sender_channel") != self.channel_id:
-            await self.send(text_data=json.dumps(event))
+    async def deliver(self, event):
+        if event["skip_sender"] and event["sender_channel"] == self.channel_id:
+            return
+        if self.compact and "bytes" in event:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            await self.send(text_data=event["text"])
 
-    async def chat_message(self, event):
-        if event.get("sender_channel") != self.channel_id:
-            await self.send(text_data=json.dumps(event))
+    # ==== Group event handlers ====
+    async def participant_joined(self, event):
+        # The newcomer has not seen anyone's current gaze / voice yet
+        if self.status_coalescer is not None:
+            self.status_coalescer.forget()
+        await self.deliver(event)
+
+    participant_left = deliver
+    participant_updated = deliver
+    chat_message = deliver
+    gaze_update = deliver
+    voice_update = deliver
+    gaze_updates = deliver
+    voice_updates = deliver
+    live_translation = deliver
 
     async def signal(self, event):
         await self.send(text_data=json.dumps(event["message"]))
+
+
+metrics.collector("signaling_rooms", "Rooms with at least one participant on this process",
+                  lambda: len(SignalingConsumer.local_rooms))
@@ -0,0 +1,128 @@
+"""
+CPU cost of one room broadcast as the room grows.
+
+Connects N SignalingConsumers through WebsocketCommunicator on an in-memory
+channel layer, has one participant send a burst of messages and waits until
+every recipient got all of them. Reports process CPU per broadcast and per
+delivered message, next to what re-encoding the payload for every recipient
+would add on top.
+
+    python manage.py bench_fanout
+    python manage.py bench_fanout --sizes 10 50 100 --messages 300 --kind chat --compact-share 0.5
+    python manage.py bench_fanout --tick-ms 100     # gaze / voice coalescing on
+
+Coalescing is off by default so every broadcast is measured; with
+--tick-ms the recipients are drained until the room goes quiet and the
+deliveries actually made are counted.
+"""
+
+import asyncio, json, time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from videocall.management.harness import connect, drain, signaling_app
+from videocall.wire import SUBPROTOCOL_MSGPACK
+
+
+def _payload(kind: str, i: int) -> dict:
+    if kind == "chat":
+        return {"type": "chat", "by": "bench", "text": f"message {i} " + "x" * 40}
+    if kind == "voice":
+        return {"type": "voice_status", "user": "bench", "voice": "Match", "ts": i}
+    return {"type": "gaze_status", "user": "bench", "gaze": ("LEFT", "CENTER")[i % 2], "ts": i}
+
+
+async def _run_room(app, size: int, messages: int, kind: str, compact_share: float) -> dict:
+    room = f"bench-{size}-{time.monotonic_ns()}"
+    compact_count = round(size * compact_share)
+    comms = []
+    for i in range(size):
+        subprotocols = [SUBPROTOCOL_MSGPACK] if i < compact_count else None
+        comms.append(await connect(app, room, subprotocols))
+    for comm in comms:
+        await drain(comm)
+
+    sender = comms[-1]
+    # chat is not echoed back to its sender; gaze / voice updates are
+    recipients = comms[:-1] if kind == "chat" else comms
+    payloads = [json.dumps(_payload(kind, i)) for i in range(messages)]
+
+    tick = settings.SIGNALING_STATUS_TICK_MS / 1000
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for text in payloads:
+        await sender.send_to(text_data=text)
+    deliveries = 0
+    for comm in recipients:
+        if tick > 0 and kind != "chat":
+            while not await comm.receive_nothing(tick * 3):
+                await comm.receive_output()
+                deliveries += 1
+        else:
+            for _ in range(messages):
+                await comm.receive_output(timeout=10)
+            deliveries += messages
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    for comm in comms:
+        await comm.disconnect()
+
+    deliveries = max(deliveries, 1)
+    return {
+        "room_size": size,
+        "messages": messages,
+        "deliveries": deliveries,
+        "cpu_ms_per_broadcast": cpu * 1000 / messages,
+        "cpu_us_per_delivery": cpu * 1e6 / deliveries,
+        "msgs_per_sec": deliveries / wall,
+        "encode_us_per_recipient": _encode_cost(kind) * 1e6,
+    }
+
+
+def _encode_cost(kind: str, rounds: int = 2000) -> float:
+    """Seconds one json.dumps of the outgoing event costs (what each recipient used to pay)."""
+    message = {"type": "gaze_update", "user": "bench", "gaze": "LEFT", "ts": 1,
+               "channel": "specific.abcdefgh!ijklmnopqrst"}
+    if kind == "chat":
+        message = {"type": "chat_message", "message": {"by": "bench", "text": "message 1 " + "x" * 40},
+                   "sender_channel": "specific.abcdefgh!ijklmnopqrst"}
+    start = time.process_time()
+    for _ in range(rounds):
+        json.dumps(message)
+    return (time.process_time() - start) / rounds
+
+
+class Command(BaseCommand):
+    help = "Benchmark CPU per signaling broadcast versus room size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="+", type=int, default=[2, 10, 25, 50])
+        parser.add_argument("--messages", type=int, default=200, help="broadcasts per room size")
+        parser.add_argument("--kind", choices=("gaze", "voice", "chat"), default="gaze")
+        parser.add_argument("--compact-share", type=float, default=0.0,
+                            help="fraction of clients using the msgpack subprotocol")
+        parser.add_argument("--tick-ms", type=int, default=0,
+                            help="SIGNALING_STATUS_TICK_MS for the run (0 = no coalescing)")
+        parser.add_argument("--json", action="store_true", help="print one JSON object per room size")
+
+    def handle(self, *args, **opts):
+        settings.SIGNALING_STATUS_TICK_MS = opts["tick_ms"]
+        app = signaling_app()
+
+        results = []
+        for size in opts["sizes"]:
+            results.append(asyncio.run(_run_room(app, size, opts["messages"], opts["kind"], opts["compact_share"])))
+
+        if opts["json"]:
+            for row in results:
+                self.stdout.write(json.dumps(row))
+            return
+
+        self.stdout.write(f"{'room':>6}{'deliveries':>12}{'CPU ms/bcast':>14}{'CPU us/deliv':>14}{'deliv/s':>10}"
+                          f"{'dumps us/recip':>16}")
+        for row in results:
+            self.stdout.write(
+                f"{row['room_size']:>6}{row['deliveries']:>12}{row['cpu_ms_per_broadcast']:>14.3f}{row['cpu_us_per_delivery']:>14.1f}"
+                f"{row['msgs_per_sec']:>10.0f}{row['encode_us_per_recipient']:>16.2f}"
+            )
@@ -0,0 +1,103 @@
+"""
+Inbound signaling throughput: messages/sec a room's consumers can take in.
+
+M participants join one room on an in-memory channel layer and each sends a
+burst of gaze_status / voice_status reports. A probe participant then waits
+for one closing chat message per sender; since every consumer handles its
+messages in order, that marks the end of the burst.
+
+Logging of the videocall.messages logger can be switched to reproduce the
+old per-message stdout writes:
+
+    python manage.py bench_receive                                   # INFO, sampled (default)
+    python manage.py bench_receive --log-level DEBUG --unsampled --sink stdout
+"""
+
+import asyncio, contextlib, json, logging, os, sys, time
+
+from django.core.management.base import BaseCommand
+
+from videocall import message_log
+from videocall.management.harness import connect, drain, signaling_app
+
+
+async def _run(app, senders: int, messages: int) -> dict:
+    room = f"bench-recv-{time.monotonic_ns()}"
+    comms = [await connect(app, room) for _ in range(senders + 1)]
+    probe, senders_ = comms[0], comms[1:]
+    for comm in comms:
+        await drain(comm)
+
+    gazes = ("LEFT", "CENTER", "RIGHT")
+    frames = [
+        json.dumps({"type": "gaze_status", "user": "bench", "gaze": gazes[i % 3], "ts": i})
+        if i % 4 else json.dumps({"type": "voice_status", "user": "bench", "voice": "Match", "ts": i})
+        for i in range(messages)
+    ]
+    done = json.dumps({"type": "chat", "by": "bench", "text": "done"})
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for text in frames:
+        for comm in senders_:
+            await comm.send_to(text_data=text)
+    for comm in senders_:
+        await comm.send_to(text_data=done)
+    pending = len(senders_)
+    while pending:
+        message = json.loads(await probe.receive_from(timeout=30))
+        if message["type"] == "chat_message":
+            pending -= 1
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    for comm in comms:
+        await comm.disconnect()
+
+    total = messages * len(senders_)
+    return {
+        "senders": len(senders_),
+        "messages": total,
+        "msgs_per_sec": total / wall,
+        "cpu_us_per_msg": cpu * 1e6 / total,
+    }
+
+
+class Command(BaseCommand):
+    help = "Benchmark inbound WebSocket messages/sec on a synthetic room."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--senders", type=int, default=10)
+        parser.add_argument("--messages", type=int, default=500, help="reports per sender")
+        parser.add_argument("--log-level", default="INFO", help="level of the videocall.messages logger")
+        parser.add_argument("--unsampled", action="store_true", help="log every message (sampling rate 1.0)")
+        parser.add_argument("--sink", choices=("devnull", "stdout"), default="devnull",
+                            help="where emitted log records are written")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        app = signaling_app()
+
+        with contextlib.ExitStack() as stack:
+            stream = sys.stdout if opts["sink"] == "stdout" else stack.enter_context(open(os.devnull, "w"))
+            handler = logging.StreamHandler(stream)
+            logger = message_log.logger
+            logger.addHandler(handler)
+            logger.setLevel(opts["log_level"].upper())
+            logger.propagate = False
+            if opts["unsampled"]:
+                message_log._rates = {}
+            try:
+                result = asyncio.run(_run(app, opts["senders"], opts["messages"]))
+            finally:
+                logger.removeHandler(handler)
+
+        result["log_level"] = opts["log_level"].upper()
+        result["sampled"] = not opts["unsampled"]
+        if opts["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(
+            f"{result['messages']} messages from {result['senders']} senders "
+            f"(log {result['log_level']}, {'sampled' if result['sampled'] else 'unsampled'}): "
+            f"{result['msgs_per_sec']:.0f} msgs/sec, {result['cpu_us_per_msg']:.1f} us CPU/msg"
+        )
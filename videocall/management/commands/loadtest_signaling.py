@@ -0,0 +1,309 @@
+"""
+Load test for the signaling server inside one process (one Daphne worker).
+
+Simulated clients drive SignalingConsumer through WebsocketCommunicator:
+every room gets --room-size participants that send gaze / voice status
+reports, offer / answer / ICE messages to random peers and chat, while
+participants leave and new ones join at the --churn rate.
+
+    python manage.py loadtest_signaling
+    python manage.py loadtest_signaling --rooms 4 --room-size 25 --duration 20 --gaze-hz 6
+    python manage.py loadtest_signaling --layer redis                   # in-process fakeredis stand-in (requirements-dev.txt)
+    python manage.py loadtest_signaling --layer redis --redis-url redis://127.0.0.1:6379/0
+
+Reports delivery latency percentiles per message family, messages/sec in
+and out, connect time, and resident memory per connected participant.
+"""
+
+import asyncio, contextlib, json, os, random, resource, time
+
+import numpy as np
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand, CommandError
+
+from videocall import room_state
+from videocall.management.harness import connect, signaling_app
+
+# Outgoing message type -> latency family, for messages that carry a send time
+FAMILIES = {
+    "gaze_update": "status", "gaze_updates": "status",
+    "voice_update": "status", "voice_updates": "status",
+    "offer": "signal", "answer": "signal", "ice_candidate": "signal",
+    "chat_message": "chat",
+}
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _now_ms() -> float:
+    return time.perf_counter() * 1000
+
+
+class Stats:
+    def __init__(self):
+        self.latency = {"status": [], "signal": [], "chat": []}
+        self.connect_ms = []
+        self.sent = 0
+        self.received = 0
+        self.errors = 0
+
+
+class SimClient:
+    def __init__(self, app, room: str, stats: Stats):
+        self.app = app
+        self.room = room
+        self.stats = stats
+        self.comm = None
+        self.channel = None
+        self._reader = None
+
+    async def connect(self):
+        started = _now_ms()
+        self.comm = await connect(self.app, self.room)
+        welcome = json.loads((await self.comm.receive_output(timeout=10))["text"])
+        self.channel = welcome["channel"]
+        self.stats.connect_ms.append(_now_ms() - started)
+        self._reader = asyncio.ensure_future(self._read())
+        await self.send({"type": "join", "name": f"sim-{self.channel[-6:]}"})
+
+    async def send(self, message: dict):
+        self.stats.sent += 1
+        await self.comm.send_to(text_data=json.dumps(message))
+
+    async def _read(self):
+        # Read the queue directly: receive_output() cancels the app on timeout.
+        queue = self.comm.output_queue
+        while True:
+            event = await queue.get()
+            if event.get("type") == "websocket.close":
+                return
+            text = event.get("text")
+            if not text:
+                continue
+            self.stats.received += 1
+            message = json.loads(text)
+            family = FAMILIES.get(message.get("type"))
+            if family is None:
+                continue
+            now = _now_ms()
+            if family == "status":
+                updates = message.get("updates") or [message]
+                self.stats.latency[family].extend(now - u["ts"] for u in updates if isinstance(u.get("ts"), float))
+            elif family == "chat":
+                sent_at = message.get("message", {}).get("text")
+                with contextlib.suppress(TypeError, ValueError):
+                    self.stats.latency[family].append(now - float(sent_at))
+            elif isinstance(message.get("sent_at"), float):
+                self.stats.latency[family].append(now - message["sent_at"])
+
+    async def close(self):
+        with contextlib.suppress(Exception):
+            await self.send({"type": "bye"})
+            await self.comm.disconnect()
+        if self._reader is not None:
+            self._reader.cancel()
+
+
+class Room:
+    def __init__(self, app, name: str, opts, stats: Stats):
+        self.app = app
+        self.name = name
+        self.opts = opts
+        self.stats = stats
+        self.clients = []
+
+    async def add_client(self):
+        client = SimClient(self.app, self.name, self.stats)
+        await client.connect()
+        self.clients.append(client)
+        return client
+
+    def peer_of(self, client):
+        others = [c for c in self.clients if c is not client and c.channel]
+        return random.choice(others) if others else None
+
+    async def _every(self, hz: float, action, deadline: float):
+        if hz <= 0:
+            return
+        period = 1.0 / hz
+        delay = random.random() * period
+        while time.perf_counter() + delay < deadline:
+            await asyncio.sleep(delay)
+            try:
+                await action()
+            except Exception:
+                self.stats.errors += 1
+            delay = period * random.uniform(0.8, 1.2)
+
+    async def _client_traffic(self, client, deadline: float):
+        gazes = ("CENTER", "LEFT", "RIGHT", "UP", "DOWN", "offscreen")
+
+        async def gaze():
+            if client in self.clients:
+                gaze = random.choice(gazes) if random.random() < self.opts["gaze_change"] else "CENTER"
+                await client.send({"type": "gaze_status", "user": client.channel, "gaze": gaze, "ts": _now_ms()})
+
+        async def voice():
+            if client in self.clients:
+                await client.send({"type": "voice_status", "user": client.channel,
+                                   "voice": random.choice(("Match", "Unmatch")), "ts": _now_ms()})
+
+        async def signal():
+            peer = self.peer_of(client)
+            if client in self.clients and peer is not None:
+                kind = random.choice(("offer", "answer", "ice_candidate", "ice_candidate", "ice_candidate"))
+                await client.send({"type": kind, "to": peer.channel, "sent_at": _now_ms(),
+                                   "candidate": {"candidate": "candidate:1 1 udp 2122260223 10.0.0.1 5000 typ host"}})
+
+        async def chat():
+            if client in self.clients:
+                await client.send({"type": "chat", "by": client.channel, "text": repr(_now_ms())})
+
+        await asyncio.gather(
+            self._every(self.opts["gaze_hz"], gaze, deadline),
+            self._every(self.opts["voice_hz"], voice, deadline),
+            self._every(self.opts["signal_hz"], signal, deadline),
+            self._every(self.opts["chat_hz"], chat, deadline),
+        )
+
+    async def _churn(self, deadline: float, tasks: list):
+        async def replace():
+            if not self.clients:
+                return
+            leaving = random.choice(self.clients)
+            self.clients.remove(leaving)
+            await leaving.close()
+            client = await self.add_client()
+            tasks.append(asyncio.ensure_future(self._client_traffic(client, deadline)))
+
+        await self._every(self.opts["churn"], replace, deadline)
+
+    async def run(self, deadline: float):
+        tasks = [asyncio.ensure_future(self._client_traffic(c, deadline)) for c in self.clients]
+        await self._churn(deadline, tasks)
+        await asyncio.gather(*tasks)
+
+
+async def _load_test(app, opts) -> dict:
+    stats = Stats()
+    rooms = [Room(app, f"load-{i}-{time.monotonic_ns()}", opts, stats) for i in range(opts["rooms"])]
+
+    rss_before = _rss_mb()
+    for room in rooms:
+        for _ in range(opts["room_size"]):
+            await room.add_client()
+    await asyncio.sleep(0.5)
+    rss_connected = _rss_mb()
+    participants = opts["rooms"] * opts["room_size"]
+
+    sent0, received0 = stats.sent, stats.received
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    await asyncio.gather(*(room.run(wall_start + opts["duration"]) for room in rooms))
+    await asyncio.sleep(0.5)  # let the last broadcasts land
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    rss_peak = _rss_mb()
+
+    for room in rooms:
+        for client in list(room.clients):
+            await client.close()
+
+    def percentiles(values):
+        if not values:
+            return None
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        return {"count": len(values), "p50_ms": round(float(p50), 2), "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2), "max_ms": round(float(max(values)), 2)}
+
+    return {
+        "rooms": opts["rooms"],
+        "room_size": opts["room_size"],
+        "layer": opts["layer"],
+        "duration_s": round(wall, 2),
+        "msgs_in_per_sec": round((stats.sent - sent0) / wall, 1),
+        "msgs_out_per_sec": round((stats.received - received0) / wall, 1),
+        "cpu_utilization": round(cpu / wall, 3),
+        "errors": stats.errors,
+        "connect": percentiles(stats.connect_ms),
+        "latency": {family: percentiles(values) for family, values in stats.latency.items()},
+        "rss_mb": {"before": round(rss_before, 1), "connected": round(rss_connected, 1), "end": round(rss_peak, 1)},
+        "kb_per_participant": round((rss_connected - rss_before) * 1024 / max(participants, 1), 1),
+    }
+
+
+def _fake_redis_hosts():
+    """In-process Redis stand-in: channels_redis and the room state share one fakeredis server."""
+    try:
+        import fakeredis
+        from fakeredis.aioredis import FakeConnection
+    except ImportError:
+        raise CommandError("--layer redis without --redis-url needs fakeredis: "
+                           "pip install -r requirements-dev.txt")
+    import redis.asyncio as aioredis
+
+    server = fakeredis.FakeServer()
+    layer_host = {"connection_class": FakeConnection, "server": server}
+    state_pool = aioredis.ConnectionPool(connection_class=FakeConnection, server=server, decode_responses=True)
+    return layer_host, {"connection_pool": state_pool}
+
+
+class Command(BaseCommand):
+    help = "Load-test SignalingConsumer: latency percentiles, msgs/sec and memory per participant."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=2)
+        parser.add_argument("--room-size", type=int, default=10)
+        parser.add_argument("--duration", type=float, default=10.0, help="seconds of traffic")
+        parser.add_argument("--gaze-hz", type=float, default=5.0, help="gaze reports per participant per second")
+        parser.add_argument("--gaze-change", type=float, default=0.3,
+                            help="probability a gaze report differs from CENTER")
+        parser.add_argument("--voice-hz", type=float, default=0.5)
+        parser.add_argument("--signal-hz", type=float, default=1.0,
+                            help="offer / answer / ICE messages per participant per second")
+        parser.add_argument("--chat-hz", type=float, default=0.05)
+        parser.add_argument("--churn", type=float, default=0.2, help="leave + join per room per second")
+        parser.add_argument("--layer", choices=("memory", "redis"), default="memory",
+                            help="channel layer + room state backend")
+        parser.add_argument("--redis-url", help="real Redis to use instead of the fakeredis stand-in")
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **opts):
+        if opts["layer"] == "redis":
+            from channels_redis.core import RedisChannelLayer
+
+            if opts["redis_url"]:
+                layer_host, state_host = opts["redis_url"], opts["redis_url"]
+            else:
+                layer_host, state_host = _fake_redis_hosts()
+            layer = RedisChannelLayer(hosts=[layer_host], capacity=10_000)
+            state = room_state.RedisRoomState(hosts=[state_host], prefix=f"loadtest:{os.getpid()}")
+        else:
+            layer = InMemoryChannelLayer(capacity=10_000)
+            state = room_state.InMemoryRoomState()
+        result = asyncio.run(_load_test(signaling_app(layer, state), opts))
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(result))
+            return
+        self.stdout.write(
+            f"{result['rooms']} rooms x {result['room_size']} participants on {result['layer']} "
+            f"for {result['duration_s']}s: {result['msgs_in_per_sec']} msgs/s in, "
+            f"{result['msgs_out_per_sec']} msgs/s out, CPU {result['cpu_utilization']:.0%}, "
+            f"errors {result['errors']}"
+        )
+        rows = [("connect", result["connect"])] + list(result["latency"].items())
+        self.stdout.write(f"{'':<10}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for name, row in rows:
+            if row is None:
+                continue
+            self.stdout.write(f"{name:<10}{row['count']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+                              f"{row['p99_ms']:>10}{row['max_ms']:>10}")
+        rss = result["rss_mb"]
+        self.stdout.write(f"RSS {rss['before']} -> {rss['connected']} MB connected -> {rss['end']} MB at end; "
+                          f"~{result['kb_per_participant']} KB per participant")
@@ -0,0 +1,38 @@
+"""
+Shared setup for the signaling benchmarks and load test: SignalingConsumers
+driven through WebsocketCommunicator inside this process, on an in-memory
+channel layer unless another one is given.
+"""
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+
+from videocall.consumers import SignalingConsumer
+from videocall.routing import websocket_urlpatterns
+
+
+def signaling_app(layer=None, room_state=None, capacity: int = 100_000):
+    """
+    ASGI app for the signaling routes. Swaps the process's default channel
+    layer for `layer` (in-memory by default: measure the consumer, not
+    Redis) and, when given, the room state backend.
+    """
+    channel_layers.set(DEFAULT_CHANNEL_LAYER, layer or InMemoryChannelLayer(capacity=capacity))
+    if room_state is not None:
+        SignalingConsumer.room_state = room_state
+    return URLRouter(websocket_urlpatterns)
+
+
+async def connect(app, room: str, subprotocols=None) -> WebsocketCommunicator:
+    comm = WebsocketCommunicator(app, f"/ws/signaling/{room}/", subprotocols=subprotocols)
+    connected, _ = await comm.connect()
+    if not connected:
+        raise RuntimeError("consumer refused the connection")
+    return comm
+
+
+async def drain(comm, timeout=0.05):
+    """Discard whatever `comm` received until it has been quiet for `timeout`."""
+    while not await comm.receive_nothing(timeout):
+        await comm.receive_output()
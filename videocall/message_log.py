@@ -0,0 +1,43 @@
+# videocall/message_log.py
+"""
+Logging for incoming signaling messages.
+
+Status reports (gaze / voice) and ICE candidates arrive several times a
+second per participant, so they are logged at DEBUG and sampled: with the
+logger at INFO they cost one isEnabledFor() check and nothing is formatted.
+Everything else (join, toggles, chat, offers...) is logged at INFO.
+
+Records carry `ws_type`, `room`, `channel` and `sample_rate` as extra
+attributes for structured handlers. Per-type sampling rates come from the
+SIGNALING_LOG_SAMPLING setting (type -> fraction kept, default 1.0).
+"""
+
+import logging, random
+
+from django.conf import settings
+
+logger = logging.getLogger("videocall.messages")
+
+HIGH_FREQUENCY_TYPES = frozenset({"gaze_status", "voice_status", "ice_candidate"})
+
+_rates = None
+
+
+def _sample_rates() -> dict:
+    global _rates
+    if _rates is None:
+        _rates = dict(getattr(settings, "SIGNALING_LOG_SAMPLING", {}))
+    return _rates
+
+
+def log_message(msg_type, room, channel, data):
+    level = logging.DEBUG if msg_type in HIGH_FREQUENCY_TYPES else logging.INFO
+    if not logger.isEnabledFor(level):
+        return
+    rate = _sample_rates().get(msg_type, 1.0)
+    if rate < 1.0 and random.random() >= rate:
+        return
+    logger.log(
+        level, "ws %s room=%s channel=%s user=%s", msg_type, room, channel, data.get("user"),
+        extra={"ws_type": msg_type, "room": room, "channel": channel, "sample_rate": rate},
+    )
@@ -0,0 +1,377 @@
+# videocall/room_state.py
+"""
+Room-state backends for SignalingConsumer.
+
+The consumer only talks to the small async interface below, so the same code
+runs against a per-process dict (dev / single worker) or against Redis, where
+every Daphne worker behind the load balancer sees the same participants,
+join order and polite flag.
+
+Room state is versioned: every join, leave and effective field change bumps
+a per-room sequence number and is appended to a bounded change log, so a
+reconnecting client can catch up with changes_since() instead of a full
+snapshot. Participant records only hold PARTICIPANT_SCHEMA fields.
+
+Select the backend in settings, same shape as CHANNEL_LAYERS:
+
+    SIGNALING_ROOM_STATE = {
+        "BACKEND": "videocall.room_state.RedisRoomState",
+        "CONFIG": {"hosts": [("127.0.0.1", 6379)]},
+    }
+"""
+import json
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Fields a participant record may hold, with the values accepted from clients.
+# Anything else a client sends in a state update is not stored.
+PARTICIPANT_SCHEMA = {
+    "name": str,
+    "mic": ("on", "off"),
+    "cam": ("on", "off"),
+    "videoOn": bool,
+    "handRaised": bool,
+}
+MAX_NAME_LENGTH = 64
+
+
+def clean_participant(fields):
+    """Keep only schema fields with acceptable values."""
+    clean = {}
+    for key, rule in PARTICIPANT_SCHEMA.items():
+        if key not in fields:
+            continue
+        value = fields[key]
+        if rule is str:
+            if isinstance(value, str):
+                clean[key] = value.strip()[:MAX_NAME_LENGTH] or "Guest"
+        elif rule is bool:
+            if isinstance(value, bool):
+                clean[key] = value
+        elif value in rule:
+            clean[key] = value
+    return clean
+
+
+def _since(changes, since, version):
+    """Changes after `since`, or None when the log no longer reaches back that far."""
+    if since > version:
+        return None
+    missing = version - since
+    if missing == 0:
+        return []
+    if len(changes) < missing or changes[-missing]["v"] != since + 1:
+        return None
+    return list(changes[-missing:])
+
+
+class InMemoryRoomState:
+    """
+    Process-local rooms: { room: { "participants": {chan: {...}}, "order": [], "log": deque } }.
+
+    Every join / leave / effective update bumps the room version and is kept
+    in a bounded change log (`history` entries) for changes_since().
+    """
+
+    # Participants cannot outlive this process, so nothing needs sweeping
+    heartbeat = None
+
+    def __init__(self, history=256, **config):
+        self.rooms = {}
+        self.versions = {}  # survives empty rooms so versions never go backwards
+        self.history = int(history)
+
+    def _room(self, room_name):
+        room = self.rooms.get(room_name)
+        if room is None:
+            room = self.rooms[room_name] = {
+                "participants": {}, "order": [], "log": deque(maxlen=self.history),
+            }
+        return room
+
+    def _record(self, room_name, room, op, channel, fields=None):
+        version = self.versions[room_name] = self.versions.get(room_name, 0) + 1
+        change = {"v": version, "op": op, "channel": channel}
+        if fields is not None:
+            change["fields"] = fields
+        room["log"].append(change)
+        return version
+
+    async def join(self, room_name, channel, participant):
+        """
+        Register a participant; returns (polite, version, swept), polite if
+        first in join order. `swept` lists the (channel, version) of stale
+        participants removed on the way (backends with heartbeats only).
+        """
+        room = self._room(room_name)
+        room["participants"][channel] = participant
+        room["order"].append(channel)
+        version = self._record(room_name, room, "join", channel, participant)
+        return room["order"][0] == channel, version, []
+
+    async def leave(self, room_name, channel):
+        """Drop a participant; returns (participants left, version)."""
+        room = self.rooms.get(room_name)
+        if not room or channel not in room["participants"]:
+            return (len(room["participants"]) if room else 0), self.versions.get(room_name, 0)
+        room["participants"].pop(channel)
+        if channel in room["order"]:
+            room["order"].remove(channel)
+        version = self._record(room_name, room, "leave", channel)
+        if not room["participants"]:
+            self.rooms.pop(room_name, None)
+            return 0, version
+        return len(room["participants"]), version
+
+    async def update(self, room_name, channel, fields):
+        """
+        Merge schema fields into a participant; returns (record, changed fields, version).
+        A channel that is not in the room is left alone (record None, nothing changed).
+        """
+        room = self.rooms.get(room_name)
+        part = room["participants"].get(channel) if room else None
+        if part is None:
+            return None, {}, self.versions.get(room_name, 0)
+        changed = {k: v for k, v in clean_participant(fields).items() if part.get(k) != v}
+        if not changed:
+            return dict(part), {}, self.versions.get(room_name, 0)
+        part.update(changed)
+        version = self._record(room_name, room, "update", channel, changed)
+        return dict(part), changed, version
+
+    async def get(self, room_name, channel):
+        room = self.rooms.get(room_name)
+        if not room:
+            return None
+        return room["participants"].get(channel)
+
+    async def snapshot(self, room_name):
+        """(participants, version)."""
+        room = self.rooms.get(room_name)
+        version = self.versions.get(room_name, 0)
+        if not room:
+            return [], version
+        return list(room["participants"].values()), version
+
+    async def changes_since(self, room_name, since):
+        """(changes after `since` or None if a full snapshot is needed, version)."""
+        version = self.versions.get(room_name, 0)
+        room = self.rooms.get(room_name)
+        return _since(list(room["log"]) if room else [], since, version), version
+
+    async def touch(self, room_name, channel):
+        pass
+
+    async def close(self):
+        pass
+
+
+# Each script touches only the keys of one room, so Redis runs it atomically
+# without any cross-room lock. KEYS are always participants, order, version,
+# log and seen (channel -> last heartbeat, in Redis server seconds); every
+# script refreshes their TTL, so only rooms nobody touches expire. The version
+# key outlives empty rooms.
+_EXPIRE_LUA = """
+local function expire_room(ttl)
+    for i = 1, #KEYS do redis.call('EXPIRE', KEYS[i], ttl) end
+end
+local function now()
+    return tonumber(redis.call('TIME')[1])
+end
+"""
+
+# ARGV: channel, record, ttl, history, stale seconds. Participants whose
+# worker stopped heartbeating (crashed) are swept first, so they neither
+# linger in the room nor keep the polite / first-joiner slot.
+_JOIN_LUA = _EXPIRE_LUA + """
+local t = now()
+local swept = {}
+for _, ch in ipairs(redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', t - tonumber(ARGV[5]))) do
+    redis.call('ZREM', KEYS[5], ch)
+    if redis.call('HDEL', KEYS[1], ch) == 1 then
+        redis.call('LREM', KEYS[2], 1, ch)
+        local sv = redis.call('INCR', KEYS[3])
+        redis.call('RPUSH', KEYS[4], cjson.encode({v = sv, op = 'leave', channel = ch}))
+        swept[#swept + 1] = {ch, sv}
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('ZADD', KEYS[5], t, ARGV[1])
+local v = redis.call('INCR', KEYS[3])
+redis.call('RPUSH', KEYS[4], cjson.encode({v = v, op = 'join', channel = ARGV[1], fields = cjson.decode(ARGV[2])}))
+redis.call('LTRIM', KEYS[4], -tonumber(ARGV[4]), -1)
+expire_room(ARGV[3])
+return {redis.call('LINDEX', KEYS[2], 0), v, swept}
+"""
+
+# ARGV: channel, ttl, history
+_LEAVE_LUA = _EXPIRE_LUA + """
+redis.call('ZREM', KEYS[5], ARGV[1])
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 0 then
+    return {redis.call('HLEN', KEYS[1]), tonumber(redis.call('GET', KEYS[3]) or 0)}
+end
+redis.call('LREM', KEYS[2], 1, ARGV[1])
+local v = redis.call('INCR', KEYS[3])
+redis.call('RPUSH', KEYS[4], cjson.encode({v = v, op = 'leave', channel = ARGV[1]}))
+redis.call('LTRIM', KEYS[4], -tonumber(ARGV[3]), -1)
+local left = redis.call('HLEN', KEYS[1])
+if left == 0 then
+    redis.call('DEL', KEYS[1], KEYS[2], KEYS[4], KEYS[5])
+    redis.call('EXPIRE', KEYS[3], ARGV[2])
+else
+    expire_room(ARGV[2])
+end
+return {left, v}
+"""
+
+# ARGV: channel, fields, ttl, history. Channels not in the room are left alone.
+_UPDATE_LUA = _EXPIRE_LUA + """
+expire_room(ARGV[3])
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return {false, '{}', tonumber(redis.call('GET', KEYS[3]) or 0)}
+end
+local part = cjson.decode(redis.call('HGET', KEYS[1], ARGV[1]))
+local changed, any = {}, false
+for k, val in pairs(cjson.decode(ARGV[2])) do
+    if part[k] ~= val then
+        changed[k] = val
+        part[k] = val
+        any = true
+    end
+end
+local out = cjson.encode(part)
+if not any then
+    return {out, '{}', tonumber(redis.call('GET', KEYS[3]) or 0)}
+end
+redis.call('HSET', KEYS[1], ARGV[1], out)
+local v = redis.call('INCR', KEYS[3])
+local delta = cjson.encode(changed)
+redis.call('RPUSH', KEYS[4], '{"v":' .. v .. ',"op":"update","channel":' .. cjson.encode(ARGV[1]) .. ',"fields":' .. delta .. '}')
+redis.call('LTRIM', KEYS[4], -tonumber(ARGV[4]), -1)
+return {out, delta, v}
+"""
+
+# ARGV: channel, ttl. Only refreshes participants that are still registered.
+_TOUCH_LUA = _EXPIRE_LUA + """
+local alive = redis.call('ZADD', KEYS[5], 'XX', 'CH', now(), ARGV[1])
+expire_room(ARGV[2])
+return alive
+"""
+
+
+class RedisRoomState:
+    """
+    Rooms shared through the channels_redis Redis.
+
+    Per room: a hash `<prefix>:<room>:participants` (channel -> JSON record),
+    a list `<prefix>:<room>:order` (join order), a counter `...:version`, a
+    capped list `...:log` of JSON changes and a sorted set `...:seen` of
+    participant heartbeats. Each operation is one round-trip (a Lua script
+    or a single transaction).
+
+    Consumers call touch() every `heartbeat` seconds; a participant not seen
+    for three heartbeats belongs to a dead worker and is swept on the next join.
+    """
+
+    def __init__(self, hosts=None, prefix="signaling:room", expiry=86400, history=256, heartbeat=30,
+                 **config):
+        import redis.asyncio as aioredis
+
+        if hosts is None:
+            hosts = _channel_layer_hosts()
+        host = hosts[0] if hosts else ("127.0.0.1", 6379)
+        if isinstance(host, str):
+            self.redis = aioredis.from_url(host, decode_responses=True)
+        elif isinstance(host, dict):
+            self.redis = aioredis.Redis(decode_responses=True, **host)
+        else:
+            self.redis = aioredis.Redis(host=host[0], port=host[1], decode_responses=True)
+
+        self.prefix = prefix
+        self.expiry = int(expiry)
+        self.history = int(history)
+        self.heartbeat = float(heartbeat)
+        self._join = self.redis.register_script(_JOIN_LUA)
+        self._leave = self.redis.register_script(_LEAVE_LUA)
+        self._update = self.redis.register_script(_UPDATE_LUA)
+        self._touch = self.redis.register_script(_TOUCH_LUA)
+
+    def _keys(self, room_name):
+        base = f"{self.prefix}:{room_name}"
+        return {
+            "participants": f"{base}:participants",
+            "order": f"{base}:order",
+            "version": f"{base}:version",
+            "log": f"{base}:log",
+            "seen": f"{base}:seen",
+        }
+
+    def _script_keys(self, room_name):
+        return list(self._keys(room_name).values())
+
+    async def join(self, room_name, channel, participant):
+        first, version, swept = await self._join(
+            keys=self._script_keys(room_name),
+            args=[channel, json.dumps(participant), self.expiry, self.history, 3 * self.heartbeat],
+        )
+        return first == channel, int(version), [(ch, int(v)) for ch, v in swept]
+
+    async def leave(self, room_name, channel):
+        left, version = await self._leave(
+            keys=self._script_keys(room_name),
+            args=[channel, self.expiry, self.history],
+        )
+        return int(left), int(version)
+
+    async def update(self, room_name, channel, fields):
+        raw, delta, version = await self._update(
+            keys=self._script_keys(room_name),
+            args=[channel, json.dumps(clean_participant(fields)), self.expiry, self.history],
+        )
+        # cjson encodes an empty table as {} and a non-empty one as an object
+        return (json.loads(raw) if raw else None), json.loads(delta) or {}, int(version)
+
+    async def get(self, room_name, channel):
+        raw = await self.redis.hget(self._keys(room_name)["participants"], channel)
+        return json.loads(raw) if raw else None
+
+    async def snapshot(self, room_name):
+        keys = self._keys(room_name)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            values, version = await pipe.hvals(keys["participants"]).get(keys["version"]).execute()
+        return [json.loads(v) for v in values], int(version or 0)
+
+    async def changes_since(self, room_name, since):
+        keys = self._keys(room_name)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            entries, version = await pipe.lrange(keys["log"], 0, -1).get(keys["version"]).execute()
+        version = int(version or 0)
+        return _since([json.loads(e) for e in entries], since, version), version
+
+    async def touch(self, room_name, channel):
+        """Heartbeat: keep `channel` from being swept and the room from expiring."""
+        await self._touch(keys=self._script_keys(room_name), args=[channel, self.expiry])
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def _channel_layer_hosts():
+    layer = getattr(settings, "CHANNEL_LAYERS", {}).get("default", {})
+    return layer.get("CONFIG", {}).get("hosts")
+
+
+_ROOM_STATE = None
+
+
+def get_room_state():
+    """Build (once per process) the backend configured in SIGNALING_ROOM_STATE."""
+    global _ROOM_STATE
+    if _ROOM_STATE is None:
+        conf = getattr(settings, "SIGNALING_ROOM_STATE", {})
+        backend = import_string(conf.get("BACKEND", "videocall.room_state.InMemoryRoomState"))
+        _ROOM_STATE = backend(**conf.get("CONFIG", {}))
+    return _ROOM_STATE
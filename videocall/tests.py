@@ -1,3 +1,323 @@
-from django.test import TestCase
+import threading
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, override_settings
+
+from . import coalescer, wire
+from .room_state import InMemoryRoomState, RedisRoomState, _since, clean_participant
+from .consumers import SignalingConsumer, group_event
+
+try:
+    import fakeredis
+    from fakeredis.aioredis import FakeConnection
+except ImportError:  # requirements-dev.txt
+    fakeredis = None
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+def _unpack(frame):
+    assert frame[0] == wire.STATUS_FRAME
+    return msgpack.unpackb(frame[1:])
+
+
+class WireTests(SimpleTestCase):
+    def test_gaze_round_trip(self):
+        frame = wire.encode_status({"type": "gaze_update", "user": "ana", "gaze": "LEFT", "ts": 5, "channel": "c1"})
+        self.assertEqual(_unpack(frame), [wire.STATUS_GAZE, "ana", 1, 5, "c1"])
+        # Server frames carry the channel after ts; decode reads the first four fields
+        self.assertEqual(wire.decode_status(frame[1:]),
+                         {"type": "gaze_status", "user": "ana", "gaze": "LEFT", "ts": 5})
+
+    def test_voice_scores_and_unknown_values(self):
+        frame = wire.encode_status({"type": "voice_update", "user": "ana", "voice": "Maybe", "ts": 5,
+                                    "channel": "c1", "percentage": 91.5, "status": "verified"})
+        self.assertEqual(_unpack(frame), [wire.STATUS_VOICE, "ana", "Maybe", 5, "c1", 91.5, "verified"])
+        self.assertEqual(wire.decode_status(frame[1:])["voice"], "Maybe")
+
+    def test_batch(self):
+        frame = wire.encode_status({"type": "gaze_updates", "updates": [
+            {"user": "ana", "gaze": "UP", "ts": 1, "channel": "c1"},
+            {"user": "bo", "gaze": "offscreen", "ts": 2, "channel": "c2"},
+        ]})
+        self.assertEqual(_unpack(frame), [wire.STATUS_BATCH, [
+            [wire.STATUS_GAZE, "ana", 3, 1, "c1"],
+            [wire.STATUS_GAZE, "bo", 5, 2, "c2"],
+        ]])
+
+    def test_batch_from_separately_packed_entries(self):
+        updates = [{"user": "ana", "gaze": "UP", "ts": 1, "channel": "c1"},
+                   {"user": "bo", "gaze": "offscreen", "ts": 2, "channel": "c2"}]
+        entries = [wire.encode_entry("gaze_update", update) for update in updates]
+        self.assertEqual(wire.encode_batch(entries),
+                         wire.encode_status({"type": "gaze_updates", "updates": updates}))
+        with self.assertRaises(wire.WireError):
+            wire.encode_entry("gaze_update", {**updates[0], "ts": 2 ** 70})
+
+    def test_unencodable_message(self):
+        with self.assertRaises(wire.WireError):
+            wire.encode_status({"type": "chat_message"})
+
+    def test_unhashable_value_is_rejected(self):
+        with self.assertRaises(wire.WireError):
+            wire.encode_status({"type": "gaze_update", "user": "ana", "gaze": ["LEFT"], "ts": 1, "channel": "c1"})
+
+    def test_values_msgpack_cannot_pack(self):
+        for ts in (2 ** 70, object()):
+            with self.assertRaises(wire.WireError):
+                wire.encode_status({"type": "gaze_update", "user": "ana", "gaze": "UP", "ts": ts, "channel": "c1"})
+
+    def test_group_event_falls_back_to_text(self):
+        message = {"type": "gaze_update", "user": "ana", "gaze": "UP", "ts": 2 ** 70, "channel": "c1"}
+        with self.assertLogs("videocall.consumers", "WARNING"):
+            event = group_event(message, compact=True)
+        self.assertNotIn("bytes", event)
+        self.assertIn(str(2 ** 70), event["text"])
+
+    def test_malformed_frames(self):
+        for payload in (b"", b"\xc1", msgpack.packb([0, "ana"]), msgpack.packb(7)):
+            with self.assertRaises(wire.WireError):
+                wire.decode_status(payload)
+        with self.assertRaises(wire.WireError):
+            wire.decode_status(msgpack.packb([9, "ana", 0, 1]))
+
+
+class RoomStateTests(SimpleTestCase):
+    def test_since(self):
+        log = [{"v": v} for v in (4, 5, 6)]
+        self.assertEqual(_since(log, 6, 6), [])
+        self.assertEqual(_since(log, 4, 6), [{"v": 5}, {"v": 6}])
+        self.assertEqual(_since(log, 3, 6), log)
+        # Trimmed past `since`, or a version from the future: snapshot instead
+        self.assertIsNone(_since(log, 2, 6))
+        self.assertIsNone(_since(log, 7, 6))
+        self.assertIsNone(_since([], 0, 1))
+
+    def test_clean_participant(self):
+        self.assertEqual(
+            clean_participant({"name": "  " + "x" * 100, "mic": "loud", "cam": "on", "videoOn": 1,
+                               "handRaised": True, "admin": True}),
+            {"name": "x" * 64, "cam": "on", "handRaised": True},
+        )
+        self.assertEqual(clean_participant({"name": "   "}), {"name": "Guest"})
+
+    async def test_versions_and_delta_log(self):
+        state = InMemoryRoomState(history=3)
+        self.assertEqual(await state.join("r", "a", {"channel": "a"}), (True, 1, []))
+        self.assertEqual(await state.join("r", "b", {"channel": "b"}), (False, 2, []))
+
+        record, changed, version = await state.update("r", "b", {"name": "Bo", "mic": "on", "bogus": 1})
+        self.assertEqual((changed, version), ({"name": "Bo", "mic": "on"}, 3))
+        self.assertEqual(record, {"channel": "b", "name": "Bo", "mic": "on"})
+        # No effective change: no new version
+        self.assertEqual((await state.update("r", "b", {"mic": "on"}))[1:], ({}, 3))
+
+        changes, version = await state.changes_since("r", 1)
+        self.assertEqual(version, 3)
+        self.assertEqual([(c["op"], c["channel"]) for c in changes], [("join", "b"), ("update", "b")])
+
+        self.assertEqual(await state.leave("r", "a"), (1, 4))
+        self.assertEqual(await state.snapshot("r"), ([{"channel": "b", "name": "Bo", "mic": "on"}], 4))
+        # The log only holds `history` changes
+        self.assertIsNone((await state.changes_since("r", 0))[0])
+        # The next first joiner is polite
+        self.assertEqual(await state.leave("r", "b"), (0, 5))
+        self.assertEqual(await state.join("r", "c", {"channel": "c"}), (True, 6, []))
+
+    async def test_update_after_leave_does_not_recreate_the_participant(self):
+        state = InMemoryRoomState()
+        await state.join("r", "a", {"channel": "a"})
+        await state.leave("r", "a")
+        self.assertEqual(await state.update("r", "a", {"name": "Ana"}), (None, {}, 2))
+        self.assertEqual(await state.update("elsewhere", "a", {"name": "Ana"}), (None, {}, 0))
+        self.assertEqual(await state.snapshot("r"), ([], 2))
+
+
+@unittest.skipUnless(fakeredis, "needs fakeredis (requirements-dev.txt)")
+class RedisRoomStateTests(SimpleTestCase):
+    def _state(self, **kwargs):
+        import redis.asyncio as aioredis
+
+        pool = aioredis.ConnectionPool(connection_class=FakeConnection, server=fakeredis.FakeServer(),
+                                       decode_responses=True)
+        return RedisRoomState(hosts=[{"connection_pool": pool}], prefix="test", **kwargs)
+
+    async def test_join_update_leave(self):
+        state = self._state()
+        self.assertEqual(await state.join("r", "a", {"channel": "a"}), (True, 1, []))
+        self.assertEqual(await state.join("r", "b", {"channel": "b"}), (False, 2, []))
+
+        record, changed, version = await state.update("r", "b", {"name": "Bo", "mic": "on", "bogus": 1})
+        self.assertEqual((record, changed, version), ({"channel": "b", "name": "Bo", "mic": "on"},
+                                                      {"name": "Bo", "mic": "on"}, 3))
+        self.assertEqual((await state.update("r", "b", {"mic": "on"}))[1:], ({}, 3))
+        self.assertEqual(await state.get("r", "b"), record)
+
+        changes, version = await state.changes_since("r", 1)
+        self.assertEqual([(c["op"], c["channel"]) for c in changes], [("join", "b"), ("update", "b")])
+
+        self.assertEqual(await state.leave("r", "a"), (1, 4))
+        self.assertEqual(await state.leave("r", "a"), (1, 4))
+        self.assertEqual(await state.snapshot("r"), ([record], 4))
+        # b is now first in join order
+        self.assertEqual(await state.join("r", "c", {"channel": "c"}), (False, 5, []))
+        self.assertEqual(await state.leave("r", "b"), (1, 6))
+        self.assertEqual(await state.join("r", "d", {"channel": "d"}), (False, 7, []))
+        await state.close()
+
+    async def test_update_after_leave_does_not_recreate_the_participant(self):
+        state = self._state()
+        await state.join("r", "a", {"channel": "a"})
+        await state.leave("r", "a")
+        self.assertEqual(await state.update("r", "a", {"name": "Ana"}), (None, {}, 2))
+        self.assertEqual(await state.update("elsewhere", "a", {"name": "Ana"}), (None, {}, 0))
+        self.assertEqual(await state.snapshot("r"), ([], 2))
+        await state.close()
+
+    async def test_participants_that_stop_heartbeating_are_swept_on_join(self):
+        state = self._state(heartbeat=30)
+        await state.join("r", "crashed", {"channel": "crashed"})
+        await state.join("r", "alive", {"channel": "alive"})
+        await state.touch("r", "alive")
+        # Last seen long before three heartbeats ago
+        await state.redis.zadd(state._keys("r")["seen"], {"crashed": 0})
+
+        polite, version, swept = await state.join("r", "new", {"channel": "new"})
+        self.assertEqual(swept, [("crashed", 3)])
+        self.assertEqual((polite, version), (False, 4))
+        participants, _ = await state.snapshot("r")
+        self.assertEqual(sorted(p["channel"] for p in participants), ["alive", "new"])
+        # The sweep is in the delta log like any other leave
+        changes, _ = await state.changes_since("r", 2)
+        self.assertEqual([(c["op"], c["channel"]) for c in changes], [("leave", "crashed"), ("join", "new")])
+        # The next join keeps "alive": it is within the window
+        self.assertEqual((await state.join("r", "later", {"channel": "later"}))[2], [])
+        await state.close()
+
+
+class StatusCoalescerTests(SimpleTestCase):
+    def setUp(self):
+        self.flushed = []
+
+    async def _flush(self, message, frame):
+        self.assertEqual(frame, wire.encode_status(message))
+        self.flushed.append(message)
+
+    def _update(self, channel, value, kind="gaze"):
+        return {"user": channel, kind: value, "ts": 1, "channel": channel}
+
+    async def test_newest_value_per_participant_per_tick(self):
+        status = coalescer.StatusCoalescer("room", 60, self._flush)
+        sent = coalescer.SENT["gaze"].value
+        superseded = coalescer.COALESCED["gaze"].value
+        status.offer("gaze", "c1", "LEFT", self._update("c1", "LEFT"))
+        status.offer("gaze", "c1", "RIGHT", self._update("c1", "RIGHT"))
+        status.offer("gaze", "c2", "UP", self._update("c2", "UP"))
+        await status.flush()
+        status.close()
+        self.assertEqual(self.flushed, [{"type": "gaze_updates", "updates": [
+            self._update("c1", "RIGHT"), self._update("c2", "UP"),
+        ]}])
+        self.assertEqual(coalescer.SENT["gaze"].value - sent, 2)
+        self.assertEqual(coalescer.COALESCED["gaze"].value - superseded, 1)
+
+    async def test_unchanged_reports_are_deduplicated_until_forgotten(self):
+        status = coalescer.StatusCoalescer("room", 60, self._flush)
+        deduplicated = coalescer.DEDUPLICATED["voice"].value
+        status.offer("voice", "c1", "Match", self._update("c1", "Match", "voice"))
+        await status.flush()
+        self.assertFalse(status.offer("voice", "c1", "Match", self._update("c1", "Match", "voice")))
+        self.assertEqual(coalescer.DEDUPLICATED["voice"].value - deduplicated, 1)
+        status.forget("c1")
+        self.assertTrue(status.offer("voice", "c1", "Match", self._update("c1", "Match", "voice")))
+        status.close()
+
+    async def test_failed_flush_does_not_suppress_the_next_report(self):
+        async def broken(message, frame):
+            raise RuntimeError("layer down")
+
+        status = coalescer.StatusCoalescer("room", 60, broken)
+        status.offer("gaze", "c1", "LEFT", self._update("c1", "LEFT"))
+        with self.assertLogs("videocall.coalescer", "ERROR"):
+            await status.flush()
+        self.assertTrue(status.offer("gaze", "c1", "LEFT", self._update("c1", "LEFT")))
+        status.close()
+
+    async def test_unencodable_update_is_dropped_alone(self):
+        status = coalescer.StatusCoalescer("room", 60, self._flush)
+        dropped = coalescer.DROPPED["gaze"].value
+        status.offer("gaze", "c1", "LEFT", {**self._update("c1", "LEFT"), "ts": 2 ** 70})
+        status.offer("gaze", "c2", "UP", self._update("c2", "UP"))
+        with self.assertLogs("videocall.coalescer", "WARNING"):
+            await status.flush()
+        status.close()
+        self.assertEqual(self.flushed, [{"type": "gaze_updates", "updates": [self._update("c2", "UP")]}])
+        self.assertEqual(coalescer.DROPPED["gaze"].value - dropped, 1)
+
+    async def test_flushes_on_its_own_after_a_tick(self):
+        status = coalescer.StatusCoalescer("room", 0.001, self._flush)
+        status.offer("gaze", "c1", "LEFT", self._update("c1", "LEFT"))
+        await status._task
+        self.assertEqual(len(self.flushed), 1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, SIGNALING_STATUS_TICK_MS=0)
+class StatusReportTests(SimpleTestCase):
+    async def _connect(self, room, subprotocols=None):
+        communicator = WebsocketCommunicator(SignalingConsumer.as_asgi(), f"/ws/signaling/{room}/",
+                                             subprotocols=subprotocols)
+        communicator.scope["url_route"] = {"kwargs": {"room_name": room}}
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # welcome
+        await communicator.receive_json_from()  # participants
+        return communicator
+
+    async def test_non_string_gaze_is_broadcast_as_text(self):
+        watcher = await self._connect("wire-room", [wire.SUBPROTOCOL_MSGPACK])
+        sender = await self._connect("wire-room")
+        await watcher.receive_output()  # participant_joined
+        await sender.send_json_to({"type": "gaze_status", "user": "ana", "gaze": ["LEFT"], "ts": 1})
+        frame = (await watcher.receive_output())["bytes"]
+        self.assertEqual(_unpack(frame)[2], "['LEFT']")
+        await sender.disconnect()
+        await watcher.disconnect()
+
+    async def test_status_user_and_ts_are_coerced(self):
+        watcher = await self._connect("ts-room", [wire.SUBPROTOCOL_MSGPACK])
+        sender = await self._connect("ts-room")
+        await watcher.receive_output()  # participant_joined
+        for ts in (2 ** 70, "soon", True):
+            await sender.send_json_to({"type": "voice_status", "user": 42, "voice": "Match", "ts": ts})
+            frame = (await watcher.receive_output())["bytes"]
+            self.assertEqual(_unpack(frame)[1:4], ["42", 1, None])
+        await sender.send_json_to({"type": "voice_status", "user": "ana", "voice": "Match", "ts": 1.5})
+        self.assertEqual(_unpack((await watcher.receive_output())["bytes"])[3], 1.5)
+        await sender.disconnect()
+        await watcher.disconnect()
+
+    async def test_voice_stream_is_created_off_the_event_loop(self):
+        threads = []
+
+        def new_stream(room, user):
+            threads.append(threading.current_thread())
+            return None
+
+        communicator = await self._connect("stream-room")
+        with mock.patch("videocall.consumers._new_voice_stream", new_stream):
+            await communicator.send_json_to({"type": "voice_stream_start", "user": "ana"})
+            await communicator.receive_nothing(0.05)
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        await communicator.disconnect()
+
+    async def test_messages_after_bye_are_ignored(self):
+        communicator = await self._connect("bye-room")
+        await communicator.send_json_to({"type": "bye"})
+        await communicator.send_json_to({"type": "name_update", "name": "Ghost"})
+        await communicator.receive_nothing(0.05)
+        self.assertEqual(await SignalingConsumer.room_state.snapshot("bye-room"), ([], 2))
+        await communicator.disconnect()
@@ -0,0 +1,122 @@
+# videocall/wire.py
+"""
+Binary signaling frames.
+
+Every binary WebSocket message starts with one kind byte:
+
+    AUDIO_FRAME  0x01  16 kHz mono s16le PCM for streaming voice verification
+    STATUS_FRAME 0x02  compact gaze / voice status (MessagePack array)
+
+Status frames replace the JSON `gaze_status` / `voice_status` messages (and
+the `gaze_update` / `voice_update` fan-out) for clients that open the socket
+with the `signaling.msgpack` subprotocol. The payload is a MessagePack array
+with the gaze direction and voice verdict as small enum codes:
+
+    client -> server   [STATUS_GAZE,  user, gaze,  ts]
+                       [STATUS_VOICE, user, voice, ts]
+    server -> client   [STATUS_GAZE,  user, gaze,  ts, channel]
+                       [STATUS_VOICE, user, voice, ts, channel, percentage?, status?]
+                       [STATUS_BATCH, [<gaze or voice entry>, ...]]   (gaze_updates / voice_updates)
+
+Values outside the enums are sent as plain strings. JSON clients are
+unaffected; both encodings are served side by side in the same room.
+"""
+
+import msgpack
+
+AUDIO_FRAME = 0x01
+STATUS_FRAME = 0x02
+
+SUBPROTOCOL_MSGPACK = "signaling.msgpack"
+
+STATUS_GAZE = 0
+STATUS_VOICE = 1
+STATUS_BATCH = 2
+
+GAZE_CODES = ("CENTER", "LEFT", "RIGHT", "UP", "DOWN", "offscreen")
+VOICE_CODES = ("N/A", "Match", "Unmatch")
+_GAZE_INDEX = {name: code for code, name in enumerate(GAZE_CODES)}
+_VOICE_INDEX = {name: code for code, name in enumerate(VOICE_CODES)}
+
+_STATUS_PREFIX = bytes([STATUS_FRAME])
+
+
+class WireError(ValueError):
+    pass
+
+
+def _encode_enum(value, index):
+    if not isinstance(value, str):
+        raise WireError(f"status value must be a string, not {type(value).__name__}")
+    return index.get(value, value)
+
+
+def _decode_enum(value, names):
+    if isinstance(value, int) and 0 <= value < len(names):
+        return names[value]
+    return value
+
+
+def _gaze_entry(update: dict) -> list:
+    return [STATUS_GAZE, update["user"], _encode_enum(update["gaze"], _GAZE_INDEX),
+            update["ts"], update["channel"]]
+
+
+def _voice_entry(update: dict) -> list:
+    body = [STATUS_VOICE, update["user"], _encode_enum(update["voice"], _VOICE_INDEX),
+            update["ts"], update["channel"]]
+    if "percentage" in update:
+        body += [update["percentage"], update["status"]]
+    return body
+
+
+_ENTRIES = {"gaze_update": _gaze_entry, "voice_update": _voice_entry}
+
+
+def _pack(body) -> bytes:
+    try:
+        return msgpack.packb(body)
+    except (OverflowError, TypeError, ValueError) as exc:  # e.g. ints beyond 64 bits
+        raise WireError(f"cannot pack status: {exc}") from exc
+
+
+def encode_status(message: dict) -> bytes:
+    """gaze_update(s) / voice_update(s) JSON message -> STATUS_FRAME for a compact client."""
+    message_type = message["type"]
+    if message_type in _ENTRIES:
+        body = _ENTRIES[message_type](message)
+    elif message_type.endswith("s") and message_type[:-1] in _ENTRIES:
+        entry = _ENTRIES[message_type[:-1]]
+        body = [STATUS_BATCH, [entry(update) for update in message["updates"]]]
+    else:
+        raise WireError(f"no compact encoding for {message_type!r}")
+    return _STATUS_PREFIX + _pack(body)
+
+
+def encode_entry(message_type: str, update: dict) -> bytes:
+    """
+    One update of a batch (`message_type` gaze_update / voice_update),
+    packed on its own so a bad one can be left out; see encode_batch.
+    """
+    return _pack(_ENTRIES[message_type](update))
+
+
+def encode_batch(entries: list) -> bytes:
+    """STATUS_BATCH frame around entries packed by encode_entry."""
+    packer = msgpack.Packer()
+    return b"".join([_STATUS_PREFIX, packer.pack_array_header(2), packer.pack(STATUS_BATCH),
+                     packer.pack_array_header(len(entries)), *entries])
+
+
+def decode_status(payload: bytes) -> dict:
+    """STATUS_FRAME payload (kind byte stripped) -> the equivalent JSON message."""
+    try:
+        body = msgpack.unpackb(payload)
+        kind, user, value, ts = body[:4]
+    except (ValueError, TypeError, msgpack.UnpackException) as exc:
+        raise WireError(f"malformed status frame: {exc}") from exc
+    if kind == STATUS_GAZE:
+        return {"type": "gaze_status", "user": user, "gaze": _decode_enum(value, GAZE_CODES), "ts": ts}
+    if kind == STATUS_VOICE:
+        return {"type": "voice_status", "user": user, "voice": _decode_enum(value, VOICE_CODES), "ts": ts}
+    raise WireError(f"unknown status kind {kind!r}")
@@ -3,11 +3,20 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import videocall.routing
+from conference.uploads import UploadLimitMiddleware
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'videocall_project.settings')
 
+django_asgi_app = get_asgi_application()
+
+# Opt-in model warm-up, only in server processes (not in manage.py commands);
+# /api/voice/ready reports 503 until it finishes.
+if os.environ.get("VOICE_WARMUP", "").lower() in ("1", "true", "yes"):
+    from conference.speaker_verification import start_warm_up
+    start_warm_up()
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": UploadLimitMiddleware(django_asgi_app),
     "websocket": AuthMiddlewareStack(
         URLRouter(
             videocall.routing.websocket_urlpatterns
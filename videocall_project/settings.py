@@ -75,6 +75,26 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Signaling room registry (participants / join order). The in-memory backend
+# only works with a single Daphne process; use Redis when running several.
+SIGNALING_ROOM_STATE = {
+    "BACKEND": os.environ.get("SIGNALING_ROOM_BACKEND", "videocall.room_state.InMemoryRoomState"),
+    "CONFIG": {},
+}
+
+# Gaze / voice status reports can be coalesced per room and flushed once per
+# tick (milliseconds) as gaze_updates / voice_updates batches. Opt-in, since
+# clients must understand the batches; 0 broadcasts every report immediately.
+SIGNALING_STATUS_TICK_MS = int(os.environ.get("SIGNALING_STATUS_TICK_MS", "0"))
+
+# Share of incoming messages logged per type (videocall.messages logger).
+# High-frequency types are logged at DEBUG only; the rest at INFO.
+SIGNALING_LOG_SAMPLING = {
+    "gaze_status": 0.01,
+    "voice_status": 0.05,
+    "ice_candidate": 0.1,
+}
+
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
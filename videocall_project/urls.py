@@ -6,8 +6,11 @@ from django.conf.urls.static import static
 from django.urls import path, include
 from django.views.generic import RedirectView
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('video-call/', include(('conference.urls', 'conference'), namespace='conference')),
+    path('metrics', metrics_view, name='metrics'),
     path('', RedirectView.as_view(url='/video-call/', permanent=False)),
 ] + static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)